@@ -1,59 +1,142 @@
 #!/usr/bin/env python3
 import sys
 import os
+import time
+import asyncio
 import logging
 import traceback
 
 # Importar módulos refactorizados
 import config
-from knowledge_base import initialize_faiss, get_faq_answer
-from audio_processor import validate_audio_file, read_audio_file, transcribe_audio, text_to_speech
+from knowledge_base import initialize_faiss, search_faq_async, embed_query_async, faq_index_version
+from faq_audio_cache import get_cached_faq_audio, faq_audio_text
+from semantic_cache import get_semantic_cache
+from audio_processor import validate_audio_file, transcribe_audio_async, text_to_speech_async, SegmentPublisher
 from openai_client import (
     create_openai_headers, 
     create_llm_payload, 
     create_second_llm_payload, 
-    send_openai_request, 
+    create_grounded_llm_payload,
+    send_openai_request_async, 
     process_llm_response, 
-    extract_function_args
+    extract_function_args,
+    stream_llm_response,
+    iter_sentences,
+    is_exit_response
+)
+from file_utils import (
+    create_required_directories,
+    save_audio_response,
+    create_exit_flag,
+    create_transfer_flag,
+    get_call_paths,
+    remove_audio_segments
 )
-from file_utils import create_required_directories, save_audio_response, create_exit_flag
 from metrics_tracker import CallMetrics, estimate_audio_duration
 
 # Configurar logger
 logger = logging.getLogger(__name__)
 
-def main():
-    """Función principal del asistente virtual - Implementa arquitectura encadenada (STT → LLM → TTS)"""
-    logger.info("==== INICIO DEL SCRIPT asistente_virtual.py (Arquitectura Encadenada) ====")
-    logger.info("Entrando a función main()")
+# Tareas en segundo plano (escritura de métricas) que no deben retrasar la respuesta
+_background_tasks = set()
+
+def _run_in_background(func, *args):
+    """
+    Ejecuta una función bloqueante en segundo plano sin esperar su resultado
     
-    # Verificar argumentos
-    if len(sys.argv) < 2:
-        logger.error("Uso: asistente_virtual.py <ruta_wav>")
-        sys.exit(1)
+    Args:
+        func (callable): Función a ejecutar en el pool de hilos
+        *args: Argumentos de la función
+        
+    Returns:
+        asyncio.Task: Tarea creada
+    """
+    task = asyncio.create_task(asyncio.to_thread(func, *args))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def wait_background_tasks():
+    """Espera a que terminen las tareas en segundo plano pendientes (p. ej. antes de salir)"""
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+
+def _normalize_question(text):
+    """Normaliza una pregunta para compararla (minúsculas, sin signos ni espacios extra)"""
+    return " ".join(text.lower().strip(" ¿?¡!.,").split())
+
+async def _call_llm(headers, payload, publisher=None):
+    """
+    Llama al LLM y retorna un resultado con el mismo formato en modo normal y streaming
     
-    # Obtener ruta del archivo de audio
-    user_input_wav = sys.argv[1]
-    logger.info(f"Archivo de entrada: {user_input_wav}")
+    Args:
+        headers (dict): Cabeceras HTTP
+        payload (dict): Payload de la solicitud
+        publisher (SegmentPublisher, optional): Si se indica, la respuesta se consume en streaming
+            y cada frase se envía a TTS en cuanto se completa
+        
+    Returns:
+        dict: Claves 'ok', 'content', 'tool_calls' y 'usage'
+    """
+    if publisher is not None:
+        state = {}
+        
+        def consume_stream():
+            deltas = stream_llm_response(headers, payload, state)
+            for sentence in iter_sentences(deltas, config.STREAMING_MIN_SENTENCE_CHARS):
+                publisher.submit(sentence)
+        
+        await asyncio.to_thread(consume_stream)
+        return state
+    
+    llm_response = await send_openai_request_async(headers, payload)
+    if not llm_response:
+        return {"ok": False, "content": "", "tool_calls": [], "usage": None}
+    
+    tool_calls, assistant_response, _ = process_llm_response(llm_response)
+    return {
+        "ok": True,
+        "content": assistant_response,
+        "tool_calls": tool_calls or [],
+        "usage": llm_response.get("usage")
+    }
+
+async def process_turn_async(user_input_wav, OPENAI_API_KEY, call_id=None, stream=False, on_segment=None):
+    """
+    Procesa un turno completo del llamante (STT → LLM → TTS) sobre asyncio
+    
+    La búsqueda FAISS se lanza de forma especulativa con la transcripción mientras la primera
+    llamada al LLM está en curso, y las métricas se escriben en segundo plano. Un mismo bucle
+    de eventos puede atender muchas llamadas concurrentes.
     
+    No inicializa el entorno ni FAISS: el llamador (el script o el daemon) debe hacerlo una sola vez.
+    
+    Args:
+        user_input_wav (str): Ruta al archivo WAV con la pregunta del usuario
+        OPENAI_API_KEY (str): Clave API de OpenAI
+        call_id (str, optional): UUID de la llamada. Si se indica, la respuesta y las banderas
+            se escriben en el directorio propio de la llamada (ver file_utils.get_call_paths)
+        stream (bool): Si es True, la respuesta del LLM se consume en streaming y cada frase se
+            publica como un segmento WAV independiente en cuanto está sintetizada
+        on_segment (callable, optional): Función llamada (desde un hilo) con la ruta de cada
+            segmento publicado en modo streaming
+        
+    Returns:
+        list or None: Rutas de los audios publicados en orden (un único archivo en modo normal),
+            o None si el turno falló
+    """
     # Validar archivo de audio
     if not validate_audio_file(user_input_wav):
-        sys.exit(1)
+        return None
     
-    # Verificar clave API de OpenAI
-    OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-    if not OPENAI_API_KEY:
-        logger.error("La clave API de OpenAI no está configurada en las variables de entorno.")
-        sys.exit(1)
-    else:
-        logger.info("API key de OpenAI configurada correctamente")
+    # Rutas de trabajo de esta llamada
+    paths = get_call_paths(call_id)
+    if stream:
+        remove_audio_segments(paths["segment_pattern"])
     
-    # Inicializar FAISS
-    faiss_initialized = initialize_faiss()
-    logger.info(f"Estado de inicialización FAISS: {'Disponible' if faiss_initialized else 'No disponible'}")
-    
-    # Inicializar tracker de métricas
-    metrics = CallMetrics(config.BASE_DIR)
+    # Inicializar tracker de métricas (un registro por turno)
+    metrics_id = f"{call_id}_{time.strftime('%Y%m%d_%H%M%S')}" if call_id else None
+    metrics = CallMetrics(config.BASE_DIR, call_id=metrics_id)
     
     # Registrar modelos utilizados
     metrics.set_models(
@@ -67,175 +150,383 @@ def main():
     input_duration = estimate_audio_duration(user_input_wav)
     metrics.set_audio_metrics(input_size=input_size, input_duration=input_duration)
     
+    publisher = None
+    faq_task = None
     try:
         # PASO 1: Transcribir audio a texto (STT)
         # ------------------------------------------------------------
         logger.info("PASO 1: Transcribiendo audio a texto (STT)")
         metrics.start_step("stt")
-        transcript = transcribe_audio(user_input_wav, OPENAI_API_KEY)
+        transcript = await transcribe_audio_async(user_input_wav, OPENAI_API_KEY)
         metrics.end_step("stt")
         
         if not transcript:
             logger.error("No se pudo transcribir el audio")
             metrics.set_status(stt_success=False)
-            metrics.finalize()
-            sys.exit(1)
+            _run_in_background(metrics.finalize)
+            return None
         
         # Registrar transcripción y estado de éxito
         metrics.set_transcript(user_input=transcript)
         metrics.set_status(stt_success=True)
         logger.info(f"Transcripción: {transcript}")
         
+        # Caché semántico: una pregunta ya respondida (con otras palabras) no pasa por LLM ni TTS.
+        # El embedding se calcula una vez y se reutiliza en la búsqueda FAQ
+        semantic_cache = get_semantic_cache()
+        query_embedding = None
+        if semantic_cache is not None and len(transcript.strip()) >= config.SEMANTIC_CACHE_MIN_CHARS:
+            query_embedding = await embed_query_async(transcript)
+        if query_embedding is not None:
+            # Tras recargar el índice FAQ, las respuestas guardadas con el anterior se descartan
+            faq_version = faq_index_version()
+            cached_response = semantic_cache.lookup(query_embedding, version=faq_version)
+            if cached_response:
+                answer_start = time.time()
+                logger.info(f"Respuesta del caché semántico (similitud={cached_response['similarity']:.3f}): {cached_response['transcript'][:100]}")
+                audio = await text_to_speech_async(cached_response["response"], OPENAI_API_KEY, instructions=config.TTS_INSTRUCTIONS)
+                if audio:
+                    metrics.record_step("tts", time.time() - answer_start)
+                    metrics.set_pipeline_metrics(mode="semantic_cache", llm_calls=0)
+                    metrics.set_semantic_cache_metrics(
+                        hit=True,
+                        similarity=cached_response["similarity"],
+                        latency_saved=max(0, cached_response["cost"] - (time.time() - answer_start))
+                    )
+                    return await _answer_from_cache(
+                        cached_response["response"], paths, stream, on_segment, metrics, "semantic_cache", audio=audio
+                    )
+        
+        # Búsqueda especulativa: la mayoría de las preguntas son FAQ. Con el camino rápido o el
+        # audio precalculado activos (lo habitual) el turno espera aquí el resultado antes de
+        # llamar al LLM, así que la búsqueda no se solapa con él; sin ellos, se solapa con la
+        # primera llamada y la función get_faq_answer reutiliza su resultado
+        faq_task = asyncio.create_task(search_faq_async(transcript, embedding=query_embedding))
+        transfer_requested = False
+        
+        # Camino rápido: si la búsqueda sobre la transcripción es confiable, las respuestas
+        # se inyectan directamente y basta una sola llamada al LLM
+        mode = "tool"
+        llm_calls = 1
+        faq_top_score = 0
+        if config.FAQ_FAST_PATH_ENABLED or config.FAQ_AUDIO_CACHE_ENABLED:
+            faiss_wait_start = time.time()
+            hits = await faq_task
+            # Los umbrales están calibrados en similitud coseno ("score"); con la búsqueda
+            # híbrida el primer resultado es el de la fusión, que no tiene por qué ser el de
+            # mayor coseno
+            faq_top_score = max((h["score"] for h in hits), default=0)
+            
+            # Respuesta con audio precalculado: sin LLM ni TTS. Se sirve el primer resultado,
+            # así que es su propio coseno el que debe pasar el umbral
+            served = hits[0] if hits else None
+            if config.FAQ_AUDIO_CACHE_ENABLED and served and served["score"] >= config.FAQ_AUDIO_CACHE_THRESHOLD:
+                cached_audio = await asyncio.to_thread(
+                    get_cached_faq_audio, served["faq_index"], served["pregunta"], faq_audio_text(served)
+                )
+                if cached_audio:
+                    logger.info(f"Respuesta FAQ {served['faq_index']} con audio precalculado (score={served['score']:.3f})")
+                    metrics.record_step("faiss", time.time() - faiss_wait_start)
+                    metrics.set_faiss_metrics(used=True, found_answer=True)
+                    metrics.set_pipeline_metrics(mode="cached_audio", llm_calls=0, faq_top_score=served["score"])
+                    metrics.set_transcript(faiss_response=served["answer"])
+                    return await _answer_from_cache(
+                        cached_audio["text"], paths, stream, on_segment, metrics, "cached_audio",
+                        audio_path=cached_audio["path"]
+                    )
+            
+            if config.FAQ_FAST_PATH_ENABLED and faq_top_score >= config.FAQ_FAST_PATH_THRESHOLD:
+                mode = "fast_path"
+                faiss_response = [h["answer"] for h in hits]
+                logger.info(f"Camino rápido FAQ (score={faq_top_score:.3f}): una sola llamada al LLM")
+                metrics.set_faiss_metrics(used=True, found_answer=True)
+                metrics.record_step("faiss", time.time() - faiss_wait_start)
+                metrics.set_transcript(faiss_response=faiss_response)
+        
         # PASO 2: Procesar texto con el LLM
         # ------------------------------------------------------------
-        logger.info("PASO 2: Procesando texto con el LLM")
-        metrics.start_step("llm")
+        logger.info(f"PASO 2: Procesando texto con el LLM{' en streaming' if stream else ''}")
+        llm_start = time.time()
         
-        # Crear cabeceras y payload para la API
+        # Crear cabeceras y publicador de segmentos (solo en streaming)
         headers = create_openai_headers(OPENAI_API_KEY)
-        llm_payload = create_llm_payload(transcript)
+        if stream:
+            publisher = SegmentPublisher(
+                OPENAI_API_KEY,
+                paths["segment_pattern"],
+                on_segment=on_segment,
+                instructions=config.TTS_INSTRUCTIONS,
+                workers=config.STREAMING_TTS_WORKERS
+            )
         
         # Enviar solicitud al LLM
-        llm_response = send_openai_request(headers, llm_payload)
-        if not llm_response:
+        if mode == "fast_path":
+            llm_payload = create_grounded_llm_payload(transcript, faiss_response)
+        else:
+            llm_payload = create_llm_payload(transcript)
+        llm_result = await _call_llm(headers, llm_payload, publisher)
+        if not llm_result["ok"]:
             logger.error("Falló la llamada al LLM")
+            metrics.set_pipeline_metrics(mode=mode, llm_calls=llm_calls, faq_top_score=faq_top_score)
             metrics.set_status(stt_success=True, llm_success=False)
-            metrics.finalize()
-            sys.exit(1)
-        
-        # Procesar respuesta del LLM
-        tool_calls, assistant_response, should_exit = process_llm_response(llm_response)
-        
-        # Registrar uso de tokens si está disponible
-        if "usage" in llm_response:
-            usage = llm_response["usage"]
-            metrics.set_token_usage(
-                input_tokens=usage.get("prompt_tokens", 0),
-                output_tokens=usage.get("completion_tokens", 0)
-            )
+            _run_in_background(metrics.finalize)
+            return None
+        
+        assistant_response = llm_result["content"]
+        usage = llm_result["usage"] or {}
+        input_tokens = usage.get("prompt_tokens", 0)
+        output_tokens = usage.get("completion_tokens", 0)
         
         # Si hay llamadas a funciones, procesar y hacer segunda llamada
-        if tool_calls:
-            for tool_call in tool_calls:
-                if tool_call["function"]["name"] == "get_faq_answer":
-                    # Registrar uso de FAISS
-                    metrics.set_faiss_metrics(used=True)
-                    metrics.start_step("faiss")
+        tool_calls = llm_result["tool_calls"]
+        for tool_call in tool_calls:
+            if tool_call["function"]["name"] == "get_faq_answer":
+                # Registrar uso de FAISS
+                metrics.set_faiss_metrics(used=True)
+                faiss_wait_start = time.time()
+                
+                # Extraer pregunta y buscar en FAISS
+                question = extract_function_args(tool_call)
+                if question:
+                    # Reutilizar la búsqueda especulativa; repetirla con la pregunta del LLM
+                    # solo si no encontró nada y la pregunta es distinta
+                    hits = await faq_task
+                    if not hits and _normalize_question(question) != _normalize_question(transcript):
+                        hits = await search_faq_async(question)
+                    faiss_response = [h["answer"] for h in hits] or None
+                    faiss_found = faiss_response is not None
+                    logger.info(f"Respuesta FAISS obtenida: {faiss_found}")
+                    
+                    # Actualizar métricas de FAISS (solo el tiempo que el turno esperó al índice)
+                    metrics.set_faiss_metrics(used=True, found_answer=faiss_found)
+                    metrics.record_step("faiss", time.time() - faiss_wait_start)
+                    
+                    if faiss_response:
+                        metrics.set_transcript(faiss_response=faiss_response)
                     
-                    # Extraer pregunta y buscar en FAISS
-                    question = extract_function_args(tool_call)
-                    if question:
-                        # Buscar en la base de conocimiento
-                        faiss_response = get_faq_answer(question)
-                        faiss_found = faiss_response is not None
-                        logger.info(f"Respuesta FAISS obtenida: {faiss_found}")
-                        
-                        # Actualizar métricas de FAISS
-                        metrics.set_faiss_metrics(used=True, found_answer=faiss_found)
-                        metrics.end_step("faiss")
-                        
-                        if faiss_response:
-                            metrics.set_transcript(faiss_response=faiss_response)
-                        
-                        # Segunda llamada al LLM con el resultado de FAISS
-                        second_payload = create_second_llm_payload(transcript, tool_calls, faiss_response)
-                        
-                        # Enviar segunda solicitud
-                        logger.info("Enviando segunda solicitud al LLM con resultado de FAISS...")
-                        second_llm_response = send_openai_request(headers, second_payload)
-                        
-                        if second_llm_response:
-                            logger.info("Segunda solicitud exitosa, usando esta respuesta")
-                            # Actualizar con nueva información procesada
-                            _, assistant_response, should_exit = process_llm_response(second_llm_response)
-                            
-                            # Actualizar métricas de tokens para incluir la segunda llamada
-                            if "usage" in second_llm_response:
-                                usage = second_llm_response["usage"]
-                                current_input = metrics.metrics["tokens"]["input"]
-                                current_output = metrics.metrics["tokens"]["output"]
-                                metrics.set_token_usage(
-                                    input_tokens=current_input + usage.get("prompt_tokens", 0),
-                                    output_tokens=current_output + usage.get("completion_tokens", 0)
-                                )
-        
-                if tool_call["function"]["name"] == "transfer_to_agent":
-                    motivo = extract_function_args(tool_call)
-                    with open("/tmp/transfer_flag.txt", "w") as f:
-                        f.write("1")
+                    # Segunda llamada al LLM con el resultado de FAISS
+                    logger.info("Enviando segunda solicitud al LLM con resultado de FAISS...")
+                    second_payload = create_second_llm_payload(transcript, tool_calls, faiss_response)
+                    second_result = await _call_llm(headers, second_payload, publisher)
+                    llm_calls += 1
+                    
+                    if second_result["ok"]:
+                        logger.info("Segunda solicitud exitosa, usando esta respuesta")
+                        # En streaming el texto de la primera llamada ya se reprodujo
+                        if stream:
+                            assistant_response += second_result["content"]
+                        else:
+                            assistant_response = second_result["content"]
+                        second_usage = second_result["usage"] or {}
+                        input_tokens += second_usage.get("prompt_tokens", 0)
+                        output_tokens += second_usage.get("completion_tokens", 0)
+            
+            if tool_call["function"]["name"] == "transfer_to_agent":
+                motivo = extract_function_args(tool_call)
+                create_transfer_flag(paths["transfer_flag"])
+                transfer_requested = True
         
         # Finalizar métricas del paso LLM
-        metrics.end_step("llm")
+        metrics.record_step("llm", time.time() - llm_start)
+        metrics.set_token_usage(input_tokens=input_tokens, output_tokens=output_tokens)
+        metrics.set_pipeline_metrics(mode=mode, llm_calls=llm_calls, faq_top_score=faq_top_score)
+        should_exit = is_exit_response(assistant_response)
         
         # Registrar respuesta del asistente y estado
         metrics.set_transcript(assistant_response=assistant_response)
-        metrics.set_status(stt_success=True, llm_success=True)
+        metrics.set_status(stt_success=True, llm_success=bool(assistant_response))
         
         # PASO 3: Convertir respuesta a voz (TTS)
         # ------------------------------------------------------------
-        if assistant_response:
+        if publisher is not None:
+            # Esperar a que se publiquen todos los segmentos pendientes
+            outputs = await asyncio.to_thread(publisher.finish)
+            metrics.record_step("tts", publisher.tts_time)
+            if publisher.first_segment_time is not None:
+                metrics.record_step("first_audio", publisher.first_segment_time - metrics.start_time)
+            output_size = publisher.audio_bytes
+            tts_success = bool(outputs) and not publisher.failed
+        elif assistant_response:
             logger.info("PASO 3: Convirtiendo respuesta a voz (TTS)")
-            metrics.start_step("tts")
-            
             logger.info(f"Texto a convertir: {assistant_response}")
+            metrics.start_step("tts")
+            audio_response = await text_to_speech_async(assistant_response, OPENAI_API_KEY, instructions=config.TTS_INSTRUCTIONS)
+            metrics.end_step("tts")
             
-            # Convertir texto a voz            
-            speech_instructions = """Habla en tono profesional, cálido y moderadamente pausado. Pronuncia con absoluta claridad términos específicos como ANDJE (pronunciado letra por letra: A-N-D-J-E), PQRSDF (P-Q-R-S-D-F), números de referencia, correos electrónicos (destacando el símbolo @ como "arroba") y direcciones web. Usa entonación natural con ligeras pausas entre frases para facilitar comprensión telefónica."""
-            audio_response = text_to_speech(assistant_response, OPENAI_API_KEY, instructions=speech_instructions)
-            
+            outputs = []
+            output_size = 0
             if not audio_response:
                 logger.error("No se pudo convertir el texto a voz")
-                metrics.set_status(stt_success=True, llm_success=True, tts_success=False)
-                metrics.finalize()
-                sys.exit(1)
-            
-            # Actualizar métricas de TTS
-            metrics.end_step("tts")
-            metrics.set_status(stt_success=True, llm_success=True, tts_success=True)
-            
-            # Actualizar métricas de audio de salida
-            output_size = len(audio_response)
-            # Estimación aproximada de duración del audio generado (TTS)
-            output_duration = len(assistant_response) * 0.07  # Aproximadamente 70ms por carácter
-            metrics.set_audio_metrics(
-                input_size=input_size,
-                output_size=output_size,
-                input_duration=input_duration,
-                output_duration=output_duration
-            )
-                
-            # Guardar respuesta de audio
-            if save_audio_response(audio_response, config.RESPONSE_PATH):
+            elif await asyncio.to_thread(save_audio_response, audio_response, paths["response_wav"]):
                 logger.info(f"Respuesta de audio guardada exitosamente")
+                outputs = [paths["response_wav"]]
+                output_size = len(audio_response)
+                metrics.record_step("first_audio", time.time() - metrics.start_time)
             else:
                 logger.error("Error guardando respuesta de audio")
-                sys.exit(1)
+            tts_success = bool(outputs)
         else:
             logger.error("No se obtuvo respuesta del LLM")
-            metrics.set_status(stt_success=True, llm_success=False, tts_success=False)
-            metrics.finalize()
-            sys.exit(1)
+            outputs = []
+            output_size = 0
+            tts_success = False
+        
+        metrics.set_status(stt_success=True, llm_success=bool(assistant_response), tts_success=tts_success)
+        
+        # Actualizar métricas de audio de salida
+        # Estimación aproximada de duración del audio generado (TTS)
+        output_duration = len(assistant_response) * 0.07  # Aproximadamente 70ms por carácter
+        metrics.set_audio_metrics(
+            input_size=input_size,
+            output_size=output_size,
+            input_duration=input_duration,
+            output_duration=output_duration
+        )
+        
+        if not outputs:
+            _run_in_background(metrics.finalize)
+            return None
         
         # Si el usuario pidió salir, crear bandera
         if should_exit:
             logger.info("Creando bandera de salida por solicitud del usuario")
-            create_exit_flag()
+            create_exit_flag(paths["exit_flag"])
+        
+        # Guardar la respuesta para preguntas equivalentes (no las que dependen del estado de la llamada)
+        if query_embedding is not None and tts_success and not transfer_requested and not should_exit:
+            answer_cost = metrics.metrics["duration"]["first_audio"] - metrics.metrics["duration"]["stt"]
+            semantic_cache.add(query_embedding, transcript, assistant_response, cost=answer_cost, version=faq_version)
         
-        # Finalizar y guardar todas las métricas
-        final_metrics = metrics.finalize()
-        logger.info(f"Métricas finales: Duración total={final_metrics['duration']['total']}s, Costo total=${final_metrics['costs']['total']}")
+        # Guardar métricas sin retrasar la respuesta
+        _run_in_background(metrics.finalize)
+        logger.info(f"Turno completado en {time.time() - metrics.start_time:.2f}s (primer audio en {metrics.metrics['duration']['first_audio']}s, {len(outputs)} audio(s))")
+        return outputs
         
     except Exception as e:
         logger.critical(f"Error en la ejecución: {e}")
         logger.critical(traceback.format_exc())
         
+        if publisher is not None:
+            await asyncio.to_thread(publisher.finish)
+        
         # Intentar finalizar métricas incluso en caso de error
-        try:
-            if 'metrics' in locals():
-                metrics.finalize()
-        except:
-            pass
-            
+        _run_in_background(metrics.finalize)
+        return None
+    
+    finally:
+        # La búsqueda especulativa no se usó (sin llamada a get_faq_answer)
+        if faq_task is not None and not faq_task.done():
+            faq_task.cancel()
+
+async def _answer_from_cache(answer, paths, stream, on_segment, metrics, mode, audio=None, audio_path=None):
+    """
+    Completa un turno con una respuesta ya conocida, sin llamar al LLM ni sintetizar voz
+    
+    Args:
+        answer (str): Texto de la respuesta
+        paths (dict): Rutas de trabajo de la llamada
+        stream (bool): Si el turno es en modo streaming
+        on_segment (callable, optional): Función llamada con la ruta del audio publicado
+        metrics (CallMetrics): Métricas del turno (el llamador registra el modo y la puntuación)
+        mode (str): Modo del pipeline para las métricas ('cached_audio' o 'semantic_cache')
+        audio (bytes, optional): Audio de la respuesta
+        audio_path (str, optional): Archivo inmutable con el audio (alternativa a audio)
+        
+    Returns:
+        list or None: Ruta del audio publicado, o None si no se pudo publicar
+    """
+    if stream and audio_path:
+        # El archivo es inmutable: se reproduce directamente sin copiarlo
+        outputs = [audio_path]
+        output_size = os.path.getsize(audio_path)
+        if on_segment:
+            on_segment(audio_path)
+    else:
+        if audio is None:
+            with open(audio_path, "rb") as f:
+                audio = f.read()
+        # Sin streaming el dialplan reproduce siempre la ruta de respuesta de la llamada
+        output_path = paths["segment_pattern"].format(0) if stream else paths["response_wav"]
+        saved = await asyncio.to_thread(save_audio_response, audio, output_path)
+        outputs = [output_path] if saved else []
+        output_size = len(audio)
+        if saved and stream and on_segment:
+            on_segment(output_path)
+    
+    if outputs:
+        metrics.record_step("first_audio", time.time() - metrics.start_time)
+    metrics.set_transcript(assistant_response=answer)
+    metrics.set_status(stt_success=True, llm_success=True, tts_success=bool(outputs))
+    metrics.set_audio_metrics(
+        input_size=metrics.metrics["audio"]["input_size_bytes"],
+        output_size=output_size,
+        input_duration=metrics.metrics["audio"]["input_duration_seconds"],
+        output_duration=len(answer) * 0.07
+    )
+    
+    if not outputs:
+        logger.error(f"No se pudo publicar la respuesta ({mode})")
+        _run_in_background(metrics.finalize)
+        return None
+    
+    if is_exit_response(answer):
+        create_exit_flag(paths["exit_flag"])
+    
+    _run_in_background(metrics.finalize)
+    logger.info(f"Turno completado en {time.time() - metrics.start_time:.2f}s desde {mode}")
+    return outputs
+
+async def _process_turn_and_flush(*args, **kwargs):
+    """Ejecuta un turno y espera a que se escriban las métricas (para uso fuera de un bucle de eventos)"""
+    try:
+        return await process_turn_async(*args, **kwargs)
+    finally:
+        await wait_background_tasks()
+
+def process_turn(user_input_wav, OPENAI_API_KEY, call_id=None):
+    """
+    Procesa un turno completo del llamante (STT → LLM → TTS) y deja el audio de respuesta en disco
+    
+    Envoltorio síncrono de process_turn_async para el script de línea de comandos.
+    
+    Args:
+        user_input_wav (str): Ruta al archivo WAV con la pregunta del usuario
+        OPENAI_API_KEY (str): Clave API de OpenAI
+        call_id (str, optional): UUID de la llamada (ver process_turn_async)
+        
+    Returns:
+        bool: True si se generó la respuesta de audio, False en caso contrario
+    """
+    return asyncio.run(_process_turn_and_flush(user_input_wav, OPENAI_API_KEY, call_id=call_id)) is not None
+
+def main():
+    """Función principal del asistente virtual - Implementa arquitectura encadenada (STT → LLM → TTS)"""
+    logger.info("==== INICIO DEL SCRIPT asistente_virtual.py (Arquitectura Encadenada) ====")
+    logger.info("Entrando a función main()")
+    
+    # Verificar argumentos
+    if len(sys.argv) < 2:
+        logger.error("Uso: asistente_virtual.py <ruta_wav> [uuid_llamada]")
+        sys.exit(1)
+    
+    # Obtener ruta del archivo de audio y UUID opcional de la llamada
+    user_input_wav = sys.argv[1]
+    call_id = sys.argv[2] if len(sys.argv) > 2 else None
+    logger.info(f"Archivo de entrada: {user_input_wav} (llamada: {call_id})")
+    
+    # Verificar clave API de OpenAI
+    OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+    if not OPENAI_API_KEY:
+        logger.error("La clave API de OpenAI no está configurada en las variables de entorno.")
+        sys.exit(1)
+    else:
+        logger.info("API key de OpenAI configurada correctamente")
+    
+    # Inicializar FAISS
+    faiss_initialized = initialize_faiss()
+    logger.info(f"Estado de inicialización FAISS: {'Disponible' if faiss_initialized else 'No disponible'}")
+    
+    if not process_turn(user_input_wav, OPENAI_API_KEY, call_id=call_id):
         sys.exit(1)
         
     logger.info("==== FIN DEL SCRIPT asistente_virtual.py ====")
@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 import os
 import base64
+import asyncio
 import logging
 import time
-import requests
 import traceback
+import http_client
 import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from file_utils import save_audio_response
+from tts_cache import get_tts_cache, tts_cache_key
 from config import OPENAI_TRANSCRIBE_URL, OPENAI_STT_MODEL, OPENAI_SPEECH_URL, OPENAI_TTS_MODEL, OPENAI_TTS_VOICE, OPENAI_TTS_FORMAT
 
 logger = logging.getLogger(__name__)
@@ -102,33 +108,36 @@ def transcribe_audio(audio_path, api_key):
         logger.info(f"Transcribiendo audio con modelo {OPENAI_STT_MODEL}")
         headers = {"Authorization": f"Bearer {api_key}"}
         
+        # Se envían los bytes (no el archivo abierto) para que un reintento pueda reenviarlos
         with open(audio_path, "rb") as audio_file:
-            files = {
-                "file": (os.path.basename(audio_path), audio_file, "audio/wav"),
-                "model": (None, OPENAI_STT_MODEL)
-            }
-            
-            logger.debug("Enviando solicitud de transcripción")
-            start_time = time.time()
-            response = requests.post(OPENAI_TRANSCRIBE_URL, headers=headers, files=files)
-            request_time = time.time() - start_time
-            logger.info(f"Transcripción completada en {request_time:.2f} segundos")
-            
-            if response.status_code == 200:
-                result = response.json()
-                transcript = result.get("text", "")
-                logger.info(f"Texto transcrito: {transcript[:100]}...")
-                return transcript
-            else:
-                logger.error(f"Error en la transcripción: {response.status_code} - {response.text[:200]}")
-                return None
+            audio_bytes = audio_file.read()
+        
+        files = {
+            "file": (os.path.basename(audio_path), audio_bytes, "audio/wav"),
+            "model": (None, OPENAI_STT_MODEL)
+        }
+        
+        logger.debug("Enviando solicitud de transcripción")
+        start_time = time.time()
+        response = http_client.post(OPENAI_TRANSCRIBE_URL, headers=headers, files=files)
+        request_time = time.time() - start_time
+        logger.info(f"Transcripción completada en {request_time:.2f} segundos")
+        
+        if response.status_code == 200:
+            result = response.json()
+            transcript = result.get("text", "")
+            logger.info(f"Texto transcrito: {transcript[:100]}...")
+            return transcript
+        else:
+            logger.error(f"Error en la transcripción: {response.status_code} - {response.text[:200]}")
+            return None
                 
     except Exception as e:
         logger.error(f"Error en transcripción: {e}")
         logger.error(traceback.format_exc())
         return None
 
-def text_to_speech(text, api_key, voice=None, instructions=None):
+def text_to_speech(text, api_key, voice=None, instructions=None, refresh=False):
     """
     Convierte texto a voz usando la API de OpenAI (gpt-4o-mini-tts)
     
@@ -137,6 +146,7 @@ def text_to_speech(text, api_key, voice=None, instructions=None):
         api_key (str): Clave API de OpenAI
         voice (str, optional): Voz a utilizar. Por defecto usa la configurada en config.py
         instructions (str, optional): Instrucciones adicionales para la síntesis de voz
+        refresh (bool): Sintetizar aunque el audio esté en el caché TTS (y reemplazarlo)
         
     Returns:
         bytes or None: Audio generado como bytes o None si hay error
@@ -144,6 +154,15 @@ def text_to_speech(text, api_key, voice=None, instructions=None):
     try:
         if not voice:
             voice = OPENAI_TTS_VOICE
+        
+        # Saludos, mensajes de error y respuestas FAQ se repiten: reutilizar el audio ya generado
+        cache = get_tts_cache()
+        if cache is not None:
+            cache_key = tts_cache_key(text, voice, OPENAI_TTS_MODEL, instructions, OPENAI_TTS_FORMAT)
+            cached_audio = None if refresh else cache.get(cache_key, OPENAI_TTS_FORMAT)
+            if cached_audio:
+                logger.info(f"Audio obtenido del caché TTS: {len(cached_audio)} bytes")
+                return cached_audio
             
         logger.info(f"Generando voz con modelo {OPENAI_TTS_MODEL}, voz {voice}")
         
@@ -165,12 +184,14 @@ def text_to_speech(text, api_key, voice=None, instructions=None):
         logger.debug(f"Payload para TTS: {json.dumps(payload)[:200]}...")
         
         start_time = time.time()
-        response = requests.post(OPENAI_SPEECH_URL, headers=headers, json=payload)
+        response = http_client.post(OPENAI_SPEECH_URL, headers=headers, json=payload)
         request_time = time.time() - start_time
         logger.info(f"Síntesis de voz completada en {request_time:.2f} segundos")
         
         if response.status_code == 200:
             logger.info(f"Audio generado correctamente: {len(response.content)} bytes")
+            if cache is not None:
+                cache.put(cache_key, response.content, OPENAI_TTS_FORMAT, voice=voice, model=OPENAI_TTS_MODEL, text=text[:200])
             return response.content
         else:
             logger.error(f"Error en la síntesis de voz: {response.status_code} - {response.text[:200]}")
@@ -179,4 +200,125 @@ def text_to_speech(text, api_key, voice=None, instructions=None):
     except Exception as e:
         logger.error(f"Error en síntesis de voz: {e}")
         logger.error(traceback.format_exc())
-        return None
\ No newline at end of file
+        return None
+
+class SegmentPublisher:
+    """
+    Sintetiza frases en paralelo y publica cada una como segmento WAV en orden
+    
+    Permite que FreeSWITCH empiece a reproducir la primera frase mientras el LLM
+    sigue generando el resto de la respuesta.
+    """
+    
+    def __init__(self, api_key, segment_pattern, on_segment=None, instructions=None, workers=2):
+        """
+        Inicializa el publicador
+        
+        Args:
+            api_key (str): Clave API de OpenAI
+            segment_pattern (str): Plantilla de ruta de los segmentos (se usa .format(n))
+            on_segment (callable, optional): Función llamada con la ruta de cada segmento publicado
+            instructions (str, optional): Instrucciones para la síntesis de voz
+            workers (int): Frases sintetizadas en paralelo
+        """
+        self.api_key = api_key
+        self.segment_pattern = segment_pattern
+        self.on_segment = on_segment
+        self.instructions = instructions
+        self.segments = []
+        self.audio_bytes = 0
+        self.tts_time = 0
+        self.first_segment_time = None
+        self.failed = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._publish_loop, daemon=True)
+        self._thread.start()
+        
+    def submit(self, sentence):
+        """
+        Encola una frase para síntesis; se publicará después de las anteriores
+        
+        Args:
+            sentence (str): Frase a sintetizar
+        """
+        logger.debug(f"Frase enviada a TTS: {sentence[:100]}")
+        self._pending.put(self._executor.submit(self._synthesize, sentence))
+        
+    def _synthesize(self, sentence):
+        """Sintetiza una frase y acumula el tiempo de TTS"""
+        start_time = time.time()
+        audio = text_to_speech(sentence, self.api_key, instructions=self.instructions)
+        with self._lock:
+            self.tts_time += time.time() - start_time
+        return audio
+        
+    def _publish_loop(self):
+        """Publica los segmentos en el orden en que se encolaron las frases"""
+        while True:
+            future = self._pending.get()
+            if future is None:
+                break
+            
+            audio = future.result()
+            if not audio:
+                logger.error("No se pudo sintetizar una frase; se omite el segmento")
+                self.failed = True
+                continue
+            
+            path = self.segment_pattern.format(len(self.segments))
+            if not save_audio_response(audio, path):
+                self.failed = True
+                continue
+            
+            self.segments.append(path)
+            self.audio_bytes += len(audio)
+            if self.first_segment_time is None:
+                self.first_segment_time = time.time()
+            
+            if self.on_segment:
+                try:
+                    self.on_segment(path)
+                except Exception as e:
+                    logger.error(f"Error notificando segmento {path}: {e}")
+        
+    def finish(self):
+        """
+        Espera a que se publiquen todas las frases encoladas
+        
+        Returns:
+            list: Rutas de los segmentos publicados, en orden
+        """
+        self._pending.put(None)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        return self.segments
+
+async def transcribe_audio_async(audio_path, api_key):
+    """
+    Variante asíncrona de transcribe_audio (se ejecuta en el pool de hilos del bucle de eventos)
+    
+    Args:
+        audio_path (str): Ruta al archivo de audio
+        api_key (str): Clave API de OpenAI
+        
+    Returns:
+        str or None: Texto transcrito o None si hay error
+    """
+    return await asyncio.to_thread(transcribe_audio, audio_path, api_key)
+
+async def text_to_speech_async(text, api_key, voice=None, instructions=None):
+    """
+    Variante asíncrona de text_to_speech (se ejecuta en el pool de hilos del bucle de eventos)
+    
+    Args:
+        text (str): Texto a convertir en voz
+        api_key (str): Clave API de OpenAI
+        voice (str, optional): Voz a utilizar
+        instructions (str, optional): Instrucciones adicionales para la síntesis de voz
+        
+    Returns:
+        bytes or None: Audio generado como bytes o None si hay error
+    """
+    return await asyncio.to_thread(text_to_speech, text, api_key, voice, instructions)
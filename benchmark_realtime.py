@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Benchmark de CPU de las etapas de audio de las sesiones Realtime.
+
+Subida: compara un evento input_audio_buffer.append por fragmento de captura (base64 +
+json.dumps de un dict nuevo, el esquema anterior) con AudioUplink a distintas duraciones de
+paquete. Incluye el frame WebSocket enmascarado que escribe el cliente si websockets
+está instalado. Reporta, para un núcleo:
+    events_per_sec:  eventos serializados por segundo de CPU
+    audio_ratio:     segundos de audio procesados por segundo de CPU (≈ sesiones
+                     simultáneas que un núcleo puede subir)
+    us_per_audio_sec: microsegundos de CPU por segundo de audio de una sesión
+
+Bajada: compara el despacho anterior (frame decodificado a str, json.loads de cada evento,
+cadena if/elif y base64 del campo "delta") con el de RealtimeSession (peek_type, tabla de
+manejadores y split_audio_delta sobre los bytes del frame), con una mezcla de eventos
+response.audio.delta de --delta-ms y eventos de transcripción que nadie maneja.
+
+Barge-in: reproduce en tiempo real una respuesta recibida a ráfaga con AudioPlayout y una
+salida bloqueante con --sink-latency-ms de latencia, y la interrumpe en un punto al azar
+(--barge-in veces). Reporta el tiempo desde la interrupción hasta el silencio en la salida
+(flush) frente al audio obsoleto que el usuario habría escuchado sin descartarlo.
+
+Uso:
+    python benchmark_realtime.py [--seconds 60] [--chunk 1024] [--packets 20 50 100 200] [--delta-ms 100]
+                                 [--barge-in 5] [--sink-latency-ms 40]
+"""
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import statistics
+
+from config import REALTIME_SAMPLE_RATE
+from realtime_audio import AudioUplink, AudioPlayout
+from realtime_events import peek_type, parse_event, split_audio_delta
+
+def _frame_serializer():
+    """Serializa un frame de texto enmascarado como el cliente WebSocket, o None sin websockets"""
+    try:
+        from websockets.frames import Frame, Opcode
+    except ImportError:
+        return None
+    return lambda data: Frame(Opcode.TEXT, bytes(data)).serialize(mask=True)
+
+def _report(name, events, audio_seconds, cpu_seconds, event_bytes):
+    """Resultado de una variante"""
+    return {
+        "mode": name,
+        "events": events,
+        "bytes_per_event": event_bytes,
+        "events_per_sec": round(events / cpu_seconds),
+        "audio_ratio": round(audio_seconds / cpu_seconds, 1),
+        "us_per_audio_sec": round(cpu_seconds / audio_seconds * 1e6, 1)
+    }
+
+def bench_uplink_baseline(chunks, audio_seconds, frame):
+    """Un evento por fragmento: base64 + json.dumps de un dict nuevo"""
+    start = time.process_time()
+    for chunk in chunks:
+        message = json.dumps({"type": "input_audio_buffer.append", "audio": base64.b64encode(chunk).decode("utf-8")})
+        if frame is not None:
+            frame(message.encode("utf-8"))
+    elapsed = time.process_time() - start
+    return _report("por fragmento (json.dumps)", len(chunks), audio_seconds, elapsed, len(message))
+
+def bench_uplink(chunks, audio_seconds, frame, packet_ms):
+    """AudioUplink con paquetes de packet_ms"""
+    uplink = AudioUplink(packet_ms)
+    events = 0
+    start = time.process_time()
+    for chunk in chunks:
+        for event in uplink.push(chunk):
+            events += 1
+            if frame is not None:
+                frame(event)
+    elapsed = time.process_time() - start
+    return _report(f"AudioUplink {packet_ms} ms", events, audio_seconds, elapsed, len(uplink._template))
+
+def downlink_messages(seconds, delta_ms):
+    """Frames de bajada (bytes) de una respuesta: audio y eventos de transcripción intercalados"""
+    pcm = bytes(range(256)) * (REALTIME_SAMPLE_RATE * 2 * delta_ms // 1000 // 256)
+    audio = json.dumps({
+        "type": "response.audio.delta", "event_id": "event_123", "response_id": "resp_123",
+        "item_id": "item_123", "output_index": 0, "content_index": 0,
+        "delta": base64.b64encode(pcm).decode("ascii")
+    }, separators=(",", ":")).encode("utf-8")
+    transcript = json.dumps({
+        "type": "response.audio_transcript.delta", "event_id": "event_124", "response_id": "resp_123",
+        "item_id": "item_123", "output_index": 0, "content_index": 0, "delta": "la Agencia "
+    }, separators=(",", ":")).encode("utf-8")
+    messages = []
+    for _ in range(seconds * 1000 // delta_ms):
+        messages += [audio, transcript]
+    return messages, len(pcm)
+
+def bench_downlink_baseline(messages, audio_seconds):
+    """Despacho anterior: str, json.loads y cadena if/elif para cada evento"""
+    received = 0
+    start = time.process_time()
+    for message in messages:
+        event = json.loads(message.decode("utf-8"))
+        event_type = event.get("type", "")
+        if event_type == "session.created":
+            pass
+        elif event_type == "session.updated":
+            pass
+        elif event_type == "response.created":
+            pass
+        elif event_type == "response.done":
+            pass
+        elif event_type == "input_audio_buffer.speech_started":
+            pass
+        elif event_type == "input_audio_buffer.speech_stopped":
+            pass
+        elif event_type == "response.text.delta":
+            pass
+        elif event_type == "response.text.done":
+            pass
+        elif event_type == "response.audio.delta":
+            received += len(base64.b64decode(event["delta"]))
+    elapsed = time.process_time() - start
+    return _report("json.loads + if/elif", len(messages), audio_seconds, elapsed, len(messages[0]))
+
+def bench_downlink(messages, audio_seconds):
+    """Despacho de RealtimeSession: tipo sin parsear, tabla de manejadores y audio sin copias"""
+    received = 0
+
+    def on_audio(message):
+        nonlocal received
+        received += len(split_audio_delta(message)[1])
+
+    raw_handlers = {"response.audio.delta": on_audio}
+    handlers = {"response.created": parse_event, "response.done": parse_event}
+    start = time.process_time()
+    for message in messages:
+        event_type = peek_type(message)
+        raw_handler = raw_handlers.get(event_type)
+        if raw_handler is not None:
+            raw_handler(message)
+            continue
+        handler = handlers.get(event_type)
+        if handler is not None:
+            handler(message)
+    elapsed = time.process_time() - start
+    return _report("peek_type + tabla + split_audio_delta", len(messages), audio_seconds, elapsed, len(messages[0]))
+
+class _RealTimeSink:
+    """Salida bloqueante que tarda lo que dura el audio (como PyAudio)"""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000
+
+    def write(self, pcm):
+        time.sleep(len(pcm) / (REALTIME_SAMPLE_RATE * 2))
+
+async def _barge_in_trial(response_seconds, delta_ms, latency_ms):
+    """Una respuesta interrumpida: (ms hasta el silencio, ms de audio obsoleto sin flush)"""
+    playout = AudioPlayout(_RealTimeSink(latency_ms))
+    await playout.start()
+    delta = b"\0" * (REALTIME_SAMPLE_RATE * 2 * delta_ms // 1000)
+    for _ in range(response_seconds * 1000 // delta_ms):
+        playout.push(delta)
+    await asyncio.sleep(random.uniform(0.3, response_seconds - 0.5))
+    stale_ms = playout.buffered_ms() + latency_ms
+    playout.flush()
+    await playout.wait_drained(1)
+    await playout.stop()
+    return playout.flush_ms_last, stale_ms
+
+def bench_barge_in(trials, delta_ms, latency_ms, response_seconds=3):
+    """Interrupciones de respuestas en reproducción"""
+    silence, stale = zip(*(asyncio.run(_barge_in_trial(response_seconds, delta_ms, latency_ms)) for _ in range(trials)))
+    return {
+        "trials": trials,
+        "sink_latency_ms": latency_ms,
+        "flush_to_silence_ms": {"p50": round(statistics.median(silence), 1), "max": round(max(silence), 1)},
+        "stale_audio_without_flush_ms": {"p50": round(statistics.median(stale)), "max": max(stale)}
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de CPU de la subida y la bajada de audio de las sesiones Realtime")
+    parser.add_argument("--seconds", type=int, default=60, help="Segundos de audio simulados")
+    parser.add_argument("--chunk", type=int, default=1024, help="Muestras por fragmento de captura")
+    parser.add_argument("--packets", type=int, nargs="+", default=[20, 50, 100, 200], help="Duraciones de paquete (ms)")
+    parser.add_argument("--delta-ms", type=int, default=100, help="Audio de cada response.audio.delta (ms)")
+    parser.add_argument("--barge-in", type=int, default=5, help="Interrupciones simuladas (0 para omitirlas)")
+    parser.add_argument("--sink-latency-ms", type=int, default=40, help="Latencia de la salida de audio simulada (ms)")
+    args = parser.parse_args()
+
+    chunk_bytes = args.chunk * 2
+    total_chunks = REALTIME_SAMPLE_RATE * 2 * args.seconds // chunk_bytes
+    chunks = [bytes([i % 251]) * chunk_bytes for i in range(total_chunks)]
+    audio_seconds = total_chunks * chunk_bytes / (REALTIME_SAMPLE_RATE * 2)
+    frame = _frame_serializer()
+
+    results = [bench_uplink_baseline(chunks, audio_seconds, frame)]
+    results += [bench_uplink(chunks, audio_seconds, frame, packet_ms) for packet_ms in args.packets]
+
+    messages, delta_bytes = downlink_messages(args.seconds, args.delta_ms)
+    downlink_seconds = len(messages) // 2 * delta_bytes / (REALTIME_SAMPLE_RATE * 2)
+    downlink = [bench_downlink_baseline(messages, downlink_seconds), bench_downlink(messages, downlink_seconds)]
+
+    print(json.dumps({
+        "audio_seconds": round(audio_seconds, 1),
+        "chunk_ms": round(args.chunk * 1000 / REALTIME_SAMPLE_RATE, 1),
+        "websocket_frames": frame is not None,
+        "uplink": results,
+        "delta_ms": args.delta_ms,
+        "downlink": downlink,
+        "barge_in": bench_barge_in(args.barge_in, args.delta_ms, args.sink_latency_ms) if args.barge_in else None
+    }, ensure_ascii=False, indent=4))
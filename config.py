@@ -55,13 +55,38 @@ TMP_DIR = os.path.join(BASE_DIR, "tmp")
 LOGS_DIR = os.path.join(BASE_DIR, "logs")
 RESPONSE_PATH = os.path.join(TMP_DIR, "assistant_response.wav")
 EXIT_FLAG_PATH = os.path.join(TMP_DIR, "salir.flag")
+TRANSFER_FLAG_PATH = os.path.join(TMP_DIR, "transfer_flag.txt")
 
-# URLs y endpoints
-OPENAI_API_BASE_URL = "https://api.openai.com/v1"
+# Archivos de trabajo por llamada (un subdirectorio por UUID de FreeSWITCH)
+CALLS_DIR = os.path.join(TMP_DIR, "calls")
+CALL_INPUT_NAME = "pregunta.wav"
+CALL_RESPONSE_NAME = "assistant_response.wav"
+CALL_EXIT_FLAG_NAME = "salir.flag"
+CALL_TRANSFER_FLAG_NAME = "transfer_flag.txt"
+CALL_SEGMENT_NAME = "assistant_response_{:03d}.wav"   # Segmentos del modo streaming
+CALL_DIR_MAX_AGE = 2 * 60 * 60    # Segundos tras los cuales se borra un directorio de llamada huérfano
+
+# Daemon de procesamiento de turnos (mantiene modelo, índice FAISS y sesiones HTTP en memoria)
+# ivr_client.py no importa este módulo: lee IVR_DAEMON_SOCKET e IVR_TURN_TIMEOUT del entorno con los mismos valores por defecto
+DAEMON_SOCKET_PATH = os.environ.get("IVR_DAEMON_SOCKET", os.path.join(TMP_DIR, "ivr_daemon.sock"))
+DAEMON_WORKERS = 32               # Hilos compartidos para llamadas bloqueantes (HTTP, FAISS, disco) de todos los turnos
+DAEMON_TURN_TIMEOUT = float(os.environ.get("IVR_TURN_TIMEOUT", 25))  # Segundos máximos que el cliente espera un turno
+DAEMON_CLEANUP_INTERVAL = 10 * 60 # Segundos entre barridos de directorios de llamada huérfanos
+
+# URLs y endpoints (OPENAI_API_BASE_URL en el entorno permite apuntar a un servidor local de pruebas)
+OPENAI_API_BASE_URL = os.environ.get("OPENAI_API_BASE_URL", "https://api.openai.com/v1")
 OPENAI_CHAT_URL = f"{OPENAI_API_BASE_URL}/chat/completions"
 OPENAI_TRANSCRIBE_URL = f"{OPENAI_API_BASE_URL}/audio/transcriptions"
 OPENAI_SPEECH_URL = f"{OPENAI_API_BASE_URL}/audio/speech"
 
+# Cliente HTTP compartido (conexiones keep-alive y reintentos)
+HTTP_CONNECT_TIMEOUT = 5          # Segundos para establecer la conexión
+HTTP_READ_TIMEOUT = 30            # Segundos máximos esperando datos de la API
+HTTP_POOL_SIZE = 16               # Conexiones keep-alive reutilizables por host
+HTTP_MAX_RETRIES = 2              # Reintentos ante errores de red, 429 y 5xx
+HTTP_BACKOFF_BASE = 0.25          # Segundos base del backoff exponencial
+HTTP_BACKOFF_MAX = 4              # Espera máxima entre reintentos
+
 # Modelos y configuración de OpenAI
 # Arquitectura encadenada (STT → LLM → TTS)
 OPENAI_STT_MODEL = "gpt-4o-mini-transcribe"  # Modelo de transcripción (Speech-to-Text)
@@ -70,6 +95,20 @@ OPENAI_TTS_MODEL = "gpt-4o-mini-tts"    # Modelo de síntesis de voz (Text-to-Sp
 OPENAI_TTS_VOICE = "alloy"              # Voz para síntesis
 OPENAI_TTS_FORMAT = "wav"               # Formato de audio de salida
 
+# Instrucciones de pronunciación para la síntesis de voz
+TTS_INSTRUCTIONS = """Habla en tono profesional, cálido y moderadamente pausado. Pronuncia con absoluta claridad términos específicos como ANDJE (pronunciado letra por letra: A-N-D-J-E), PQRSDF (P-Q-R-S-D-F), números de referencia, correos electrónicos (destacando el símbolo @ como "arroba") y direcciones web. Usa entonación natural con ligeras pausas entre frases para facilitar comprensión telefónica."""
+
+# Caché persistente de audio TTS (compartido entre procesos, con expulsión LRU)
+TTS_CACHE_ENABLED = True
+TTS_CACHE_DIR = os.path.join(BASE_DIR, "cache", "tts")
+TTS_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Tamaño máximo total de los audios
+TTS_CACHE_MAX_ENTRIES = 5000            # Número máximo de audios
+
+# Modo streaming: el texto del LLM se corta en frases y cada frase se sintetiza y publica
+# como un segmento de audio independiente en cuanto está lista
+STREAMING_MIN_SENTENCE_CHARS = 25       # Frases más cortas se unen con la siguiente
+STREAMING_TTS_WORKERS = 2               # Síntesis de frases en paralelo (el orden de publicación se conserva)
+
 # Sistema de mensajes para el LLM (optimizado para concisión)
 SYSTEM_MESSAGE = """
 Eres el asistente virtual oficial de la Agencia Nacional de Defensa Jurídica del Estado (ANDJE) para su sistema IVR telefónico.
@@ -108,5 +147,64 @@ Usuario: "Muchas gracias, eso era todo"
 Asistente: "Ha sido un placer ayudarte. ¡Hasta pronto!"
 """
 
+# Base de conocimiento (FAISS). Las puntuaciones son similitud coseno (consultas e índice normalizados);
+# los umbrales se recalibran con embeddings/calibrar_umbral.py sobre consultas etiquetadas
+FAQ_SEARCH_THRESHOLD = 0.5              # Puntuación mínima para considerar una FAQ relacionada
+FAQ_FAST_PATH_ENABLED = True            # Buscar en FAISS antes del LLM (sin solaparse con él) y resolver con una sola llamada
+FAQ_FAST_PATH_THRESHOLD = 0.75          # Coseno máximo entre los resultados para usar el camino rápido
+
+# Caché semántico de respuestas (embedding de la transcripción → texto y audio de la respuesta)
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.92         # Similitud coseno mínima con una pregunta ya respondida
+SEMANTIC_CACHE_TTL = 6 * 60 * 60        # Segundos de validez de cada respuesta
+SEMANTIC_CACHE_CAPACITY = 500           # Respuestas máximas (se expulsan las usadas hace más tiempo)
+SEMANTIC_CACHE_MIN_CHARS = 12           # Transcripciones más cortas ("sí", "no") no se cachean
+
+# Audio precalculado de las respuestas FAQ (se genera con faq_audio_cache.py; los audios
+# se guardan en el caché TTS y aquí solo el manifiesto)
+FAQ_AUDIO_CACHE_DIR = os.path.join(BASE_DIR, "cache", "faq_audio")
+FAQ_AUDIO_CACHE_ENABLED = True          # Reproducir el audio precalculado sin pasar por LLM ni TTS
+FAQ_AUDIO_CACHE_THRESHOLD = 0.85        # Coseno mínimo del primer resultado (el que suena) para reproducirlo directamente
+FAQ_AUDIO_MAX_CHARS = 600               # Respuestas más largas solo se precalculan si tienen versión telefónica
+
+# API Realtime (voz a voz por WebSocket; ver realtime_session.py y main_realtime.py)
+REALTIME_MODEL = "gpt-4o-mini-realtime-preview-2024-12-17"
+REALTIME_URL = os.environ.get("OPENAI_REALTIME_URL", f"wss://api.openai.com/v1/realtime?model={REALTIME_MODEL}")
+REALTIME_VOICE = "sage"
+REALTIME_SAMPLE_RATE = 24000            # PCM16 mono en ambos sentidos
+REALTIME_MAX_SESSIONS = 300             # Sesiones simultáneas por proceso
+REALTIME_SEND_QUEUE_SIZE = 100          # Eventos pendientes de envío por sesión antes de frenar a quien envía
+REALTIME_PLAYOUT_FRAME_MS = 20          # Audio que la reproducción entrega a la salida de cada vez
+REALTIME_PLAYOUT_BUFFER_MS = 4000       # Capacidad del anillo de reproducción por sesión (lo que no cabe espera aparte)
+REALTIME_JITTER_MIN_MS = 60             # Audio acumulado antes de empezar a reproducir una respuesta (mínimo)
+REALTIME_JITTER_MAX_MS = 400            # Máximo al que crece ese margen tras cortes por falta de audio
+REALTIME_PLAYOUT_LEAD_MS = 60           # Adelanto máximo sobre el tiempo real con salidas que no bloquean
+REALTIME_BARGE_IN = True                # La voz del usuario corta la respuesta en curso y el audio pendiente
+REALTIME_UPLINK_PACKET_MS = 100         # Duración del audio de cada input_audio_buffer.append (ms)
+REALTIME_SEND_BATCH = 32                # Eventos que el envío escribe seguidos sin volver a la cola
+REALTIME_CONNECT_TIMEOUT = 10           # Segundos para abrir el WebSocket
+REALTIME_PING_INTERVAL = 20             # Segundos entre pings de keep-alive
+REALTIME_RECONNECT_ATTEMPTS = 3         # Reconexiones seguidas antes de abandonar la sesión
+REALTIME_STABLE_CONNECTION = 30         # Segundos tras session.created para dar por buena una conexión (reinicia ese contador)
+REALTIME_MAX_OUTPUT_TOKENS = 350
+REALTIME_TEMPERATURE = 0.6
+
+REALTIME_INSTRUCTIONS = """
+Eres un asistente de voz para la Agencia Nacional de Defensa Jurídica del Estado (ANDJE). Fuiste creada por el equipo de Atención al Ciudadano.
+
+🔹 **Reglas para responder preguntas**:
+1️⃣ Si el usuario hace una pregunta que podría estar en la base de datos, **usa la función get_faq_answer(question)** para encontrar la respuesta correcta.
+2️⃣ Si la función devuelve varias respuestas, **elige la más relevante** y NO mezcles información de respuestas diferentes.
+3️⃣ Si la base de datos no tiene una respuesta clara, responde: *"Lo siento, no encontré esa respuesta en mi base de datos."*
+4️⃣ **No inventes información** ni respondas preguntas fuera de la base de datos.
+
+🔹 **Formato y Entonación**:
+- Habla de forma **calmada y pausada**.
+- Explica claramente los números y direcciones, mencionando cada símbolo con detalle (ej. “numeral” para `#`, “arroba” para `@`).
+- Usa un tono **confiable y preciso**.
+
+**Siempre debes usar la información de la base de datos para responder.** Si necesitas buscar una respuesta, usa la función correspondiente antes de responder.
+"""
+
 # Palabras clave para finalizar la conversación
 EXIT_WORDS = ["adiós", "adios", "termina", "finaliza", "hasta luego", "salir", "fin", "chao"]
@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import glob
+
+try:
+    from embeddings.answer_store import AnswerStore, faq_key, faq_record, write_answer_store
+    from embeddings.index_factory import to_id_index, apply_search_params
+    from embeddings.embedding_cache import open_embedding_cache
+    from embeddings.lexical_index import write_lexical_index
+    from embeddings.faq_vectors import faq_vector_texts, vector_id
+    from embeddings.buscar_pregunta import INDEX_META_PATH, PREGUNTAS_PATH, load_index_meta, current_dir
+except ImportError:
+    # Ejecución directa como script desde embeddings/
+    from answer_store import AnswerStore, faq_key, faq_record, write_answer_store
+    from index_factory import to_id_index, apply_search_params
+    from embedding_cache import open_embedding_cache
+    from lexical_index import write_lexical_index
+    from faq_vectors import faq_vector_texts, vector_id
+    from buscar_pregunta import INDEX_META_PATH, PREGUNTAS_PATH, load_index_meta, current_dir
+
+# =====================
+# ACTUALIZACIÓN INCREMENTAL DEL ÍNDICE
+# =====================
+# Compara preguntas.json con el índice publicado y solo recalcula los embeddings de las
+# preguntas nuevas o cuyo texto cambió:
+#   - Cada item se identifica por su pregunta normalizada (faq_key). Si cambia la pregunta
+#     es un item nuevo (se elimina el anterior y se añade con un id nuevo).
+#   - Si solo cambia la respuesta, los metadatos o la url (content_hash), se reescribe el
+#     registro con el mismo id y sin pasar por el modelo.
+#   - Los ids eliminados se quitan del índice (IndexIDMap2 / IVF) y su registro queda en
+#     null; los ids no se reutilizan. Si el tipo de índice no admite borrar (HNSW), el
+#     vector queda y la búsqueda lo descarta por su registro vacío.
+#
+# En índices con varios vectores por item (id_shift en index_meta.json, ver faq_vectors.py)
+# un cambio en la respuesta o en las paráfrasis cambia sus vectores: se eliminan los del
+# registro (rango de ids) y se añaden los nuevos con el mismo id de registro.
+#
+# El índice léxico BM25 se reconstruye completo (no necesita el modelo).
+#
+# La nueva versión se escribe en archivos nuevos (faiss_index.vN.bin, respuestas.vN.bin,
+# lexical.vN.json) y se publica reemplazando index_meta.json de forma atómica:
+# buscar_pregunta.py detecta el cambio y la carga en caliente, sin reiniciar el servidor.
+# Se conserva la versión anterior para los procesos que aún no la han cambiado.
+#
+# Con muchas eliminaciones acumuladas conviene regenerar todo con generate_embeddings.py.
+
+KEEP_VERSIONS = 2
+
+def load_current(meta):
+    """Carga el índice publicado (en memoria, para modificarlo) y sus registros"""
+    import faiss
+
+    index_path = os.path.join(current_dir, meta.get("index_file", "faiss_index.bin"))
+    answers_path = os.path.join(current_dir, meta.get("answers_file", "respuestas.bin"))
+    index = faiss.read_index(index_path)
+
+    store = AnswerStore(answers_path)
+    records = [store[i] for i in range(len(store))]
+
+    # Registros de índices anteriores a la actualización incremental: sin clave ni hash
+    occurrences = {}
+    for record in records:
+        if record is not None and "key" not in record:
+            base = faq_key(record["pregunta"])
+            record["key"] = faq_key(record["pregunta"], occurrences.get(base, 0))
+            occurrences[base] = occurrences.get(base, 0) + 1
+            record["content_hash"] = None
+    return index, records
+
+def load_faqs(path=PREGUNTAS_PATH):
+    """Retorna los registros deseados de preguntas.json (con clave y hash), en orden"""
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)["preguntas"]
+
+    occurrences = {}
+    faqs = []
+    for faq_index, item in enumerate(items):
+        base = faq_key(item["pregunta"])
+        faqs.append(faq_record(faq_index, item, faq_key(item["pregunta"], occurrences.get(base, 0))))
+        occurrences[base] = occurrences.get(base, 0) + 1
+    return faqs
+
+def diff(records, faqs):
+    """
+    Compara los registros del índice con los de preguntas.json.
+    Retorna (nuevos, modificados, eliminados): registros a añadir, pares (id, registro) a
+    reescribir y ids a eliminar.
+    """
+    ids_by_key = {record["key"]: record_id for record_id, record in enumerate(records) if record is not None}
+
+    added, changed = [], []
+    for faq in faqs:
+        record_id = ids_by_key.pop(faq["key"], None)
+        if record_id is None:
+            added.append(faq)
+        elif records[record_id]["content_hash"] != faq["content_hash"] or records[record_id]["faq_index"] != faq["faq_index"]:
+            changed.append((record_id, faq))
+    return added, changed, sorted(ids_by_key.values())
+
+def update_index(index, records, added, changed, removed, meta):
+    """
+    Aplica el diff sobre el índice y los registros. Solo se codifican los textos nuevos: las
+    preguntas añadidas y, con varios vectores por item, los de los items modificados.
+    Retorna el índice (admite ids explícitos) y la nueva lista de registros.
+    """
+    import numpy as np
+    import faiss
+
+    index = to_id_index(index)
+    records = list(records)
+    id_shift = meta.get("id_shift", 0)
+    multi_vector = bool(id_shift)
+
+    # (id de registro, registro) cuyos vectores hay que (re)calcular
+    pending = [(len(records) + i, faq) for i, faq in enumerate(added)]
+    stale = list(removed)
+    for record_id, faq in changed:
+        old = records[record_id]
+        if multi_vector and faq_vector_texts(old) != faq_vector_texts(faq):
+            stale.append(record_id)
+            pending.append((record_id, faq))
+        elif "vectores" in old:
+            faq["vectores"] = old["vectores"]
+        records[record_id] = faq
+
+    for record_id in removed:
+        records[record_id] = None
+    for record_id in stale:
+        try:
+            if multi_vector:
+                index.remove_ids(faiss.IDSelectorRange(record_id << id_shift, (record_id + 1) << id_shift))
+            else:
+                index.remove_ids(np.array([record_id], dtype="int64"))
+        except RuntimeError as e:
+            print(f"[WARN] el índice {meta['index']['type']} no admite eliminar ({e}); se descartan por su registro vacío")
+            break
+
+    records.extend(added)
+    if pending:
+        from sentence_transformers import SentenceTransformer
+
+        # Mismos textos que indexa generate_embeddings.py; el modelo solo se carga si falta alguno en caché
+        texts, ids = [], []
+        for record_id, faq in pending:
+            vectors = faq_vector_texts(faq, multi_vector)
+            if multi_vector:
+                faq["vectores"] = [kind for kind, _ in vectors]
+            texts.extend(text for _, text in vectors)
+            ids.extend(vector_id(record_id, number) if multi_vector else record_id for number in range(len(vectors)))
+        cache = open_embedding_cache(meta["model"], index.d, meta["normalize"])
+        if cache is not None:
+            embeddings = cache.encode(lambda: SentenceTransformer(meta["model"]), texts)
+        else:
+            embeddings = SentenceTransformer(meta["model"]).encode(texts, convert_to_numpy=True, normalize_embeddings=meta["normalize"])
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        if embeddings.shape[1] != index.d:
+            raise ValueError(f"El modelo {meta['model']} ({embeddings.shape[1]}) no corresponde al índice ({index.d})")
+
+        index.add_with_ids(embeddings, np.array(ids, dtype="int64"))
+
+    apply_search_params(index, meta["index"])
+    return index, records
+
+def publish(index, records, meta):
+    """
+    Escribe la nueva versión en archivos nuevos y la publica reemplazando index_meta.json.
+    Retorna el contrato publicado.
+    """
+    import faiss
+
+    version = meta.get("version", 0) + 1
+    index_file = f"faiss_index.v{version}.bin"
+    answers_file = f"respuestas.v{version}.bin"
+    lexical_file = f"lexical.v{version}.json"
+
+    tmp_path = os.path.join(current_dir, f"{index_file}.part")
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, os.path.join(current_dir, index_file))
+    write_answer_store(records, os.path.join(current_dir, answers_file))
+    write_lexical_index(records, os.path.join(current_dir, lexical_file))
+
+    meta = dict(meta, version=version, index_file=index_file, answers_file=answers_file, lexical_file=lexical_file,
+                count=int(index.ntotal), deleted=sum(1 for record in records if record is None))
+    tmp_path = f"{INDEX_META_PATH}.part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, INDEX_META_PATH)
+
+    # Las versiones antiguas ya no las usa nadie (los procesos que las tengan mapeadas
+    # conservan el acceso aunque se borre el archivo)
+    for pattern in ("faiss_index.v*.bin", "respuestas.v*.bin", "lexical.v*.json"):
+        for path in glob.glob(os.path.join(current_dir, pattern)):
+            try:
+                old_version = int(os.path.basename(path).split(".v")[1].split(".")[0])
+            except ValueError:
+                continue
+            if old_version <= version - KEEP_VERSIONS:
+                os.remove(path)
+    return meta
+
+# =====================
+# EJECUCIÓN EN TERMINAL
+# =====================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Actualiza el índice FAISS con los cambios de preguntas.json")
+    parser.add_argument("--preguntas", default=PREGUNTAS_PATH, help="Archivo de preguntas (por defecto ../preguntas.json)")
+    parser.add_argument("--dry-run", action="store_true", help="Mostrar los cambios sin publicar")
+    args = parser.parse_args()
+
+    if not os.path.isfile(INDEX_META_PATH):
+        print("Error: no hay índice publicado; ejecute primero generate_embeddings.py", file=sys.stderr)
+        sys.exit(1)
+
+    meta = load_index_meta()
+    index, records = load_current(meta)
+    added, changed, removed = diff(records, load_faqs(args.preguntas))
+    print(f"Nuevas: {len(added)}, modificadas: {len(changed)}, eliminadas: {len(removed)}")
+
+    if args.dry_run or not (added or changed or removed):
+        sys.exit(0)
+
+    try:
+        index, records = update_index(index, records, added, changed, removed, meta)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    meta = publish(index, records, meta)
+    print(f"✅ Publicada la versión {meta['version']}: {meta['count']} vectores ({meta['deleted']} ids eliminados)")
@@ -0,0 +1,101 @@
+import os
+import json
+import mmap
+import struct
+import hashlib
+
+# ----------------------------
+# ALMACÉN DE RESPUESTAS ALINEADO CON FAISS
+# ----------------------------
+# Archivo binario empaquetado donde el registro i corresponde al vector i del índice
+# FAISS (o, en índices con varios vectores por FAQ, a los vectores cuyo id codifica i; ver
+# faq_vectors.py), de modo que un id devuelto por la búsqueda se resuelve en O(1) sin
+# recorrer preguntas.json ni comparar textos.
+#
+# Formato (little-endian):
+#   magic "FAQS" | versión uint32 | número de registros uint64
+#   offsets: (n + 1) x uint64, relativos al inicio del bloque de datos
+#   datos: un JSON UTF-8 por registro
+#     {"faq_index", "pregunta", "respuesta", "metadata", "url", "key", "content_hash"}
+#     más "respuesta_telefonica" y "parafrasis" si el item las trae y "vectores" (tipo de cada vector) si hay varios
+#     o null si el id fue eliminado por actualizar_indice.py (los ids no se reutilizan)
+#
+# El archivo se abre con mmap de solo lectura: los procesos que lo usan comparten
+# las mismas páginas y solo se decodifican los registros consultados.
+
+MAGIC = b"FAQS"
+VERSION = 1
+HEADER = struct.Struct("<4sIQ")
+OFFSET = struct.Struct("<Q")
+
+def faq_key(pregunta, occurrence=0):
+    """Identidad de un item de preguntas.json: su pregunta normalizada (y su repetición, si la hay)"""
+    key = pregunta.strip().lower()
+    return key if occurrence == 0 else f"{key}#{occurrence}"
+
+def faq_record(faq_index, item, key=None):
+    """Registro del almacén para el item 'faq_index' de preguntas.json, con el hash de su contenido"""
+    record = {
+        "faq_index": faq_index,
+        "pregunta": item["pregunta"],
+        "respuesta": item["respuesta"].strip(),
+        "metadata": item.get("metadata", {}),
+        "url": item.get("url", ""),
+    }
+    if item.get("respuesta_telefonica"):
+        record["respuesta_telefonica"] = item["respuesta_telefonica"].strip()
+    if item.get("parafrasis"):
+        record["parafrasis"] = [p.strip() for p in item["parafrasis"] if p and p.strip()]
+    # faq_index no forma parte del contenido: mover un item no lo cambia
+    content = json.dumps({k: v for k, v in record.items() if k != "faq_index"}, ensure_ascii=False, sort_keys=True, default=str)
+    record["key"] = key if key is not None else faq_key(item["pregunta"])
+    record["content_hash"] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return record
+
+def write_answer_store(records, path):
+    """
+    Escribe el almacén de respuestas (de forma atómica).
+    'records' es una lista de dicts (o None) donde la posición es el id del vector en el índice.
+    """
+    blobs = [json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for record in records]
+
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(blobs)))
+        for offset in offsets:
+            f.write(OFFSET.pack(offset))
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+class AnswerStore:
+    """Acceso de solo lectura por id al almacén de respuestas"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} no es un almacén de respuestas válido (versión {version})")
+
+        self._count = count
+        self._offsets_start = HEADER.size
+        self._data_start = HEADER.size + OFFSET.size * (count + 1)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, record_id):
+        """Retorna el registro del id dado (IndexError si no existe)"""
+        if record_id < 0 or record_id >= self._count:
+            raise IndexError(f"id {record_id} fuera del almacén de respuestas ({self._count} registros)")
+
+        position = self._offsets_start + OFFSET.size * record_id
+        start, = OFFSET.unpack_from(self._data, position)
+        end, = OFFSET.unpack_from(self._data, position + OFFSET.size)
+        return json.loads(self._data[self._data_start + start:self._data_start + end].decode("utf-8"))
@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+try:
+    from embeddings.encoder_backends import BACKENDS, load_encoder
+    from embeddings.index_factory import apply_search_params
+    from embeddings.buscar_pregunta import PREGUNTAS_PATH, load_index_meta, current_dir
+except ImportError:
+    # Ejecución directa como script desde embeddings/
+    from encoder_backends import BACKENDS, load_encoder
+    from index_factory import apply_search_params
+    from buscar_pregunta import PREGUNTAS_PATH, load_index_meta, current_dir
+
+# =====================
+# BENCHMARK DE BACKENDS DEL CODIFICADOR
+# =====================
+# Para cada backend (en un proceso propio, para medir su memoria como la de un worker):
+#   - tiempo de carga y memoria residente (RSS) tras cargar y tras codificar
+#   - latencia de codificar una consulta (como en un turno del IVR): media, p50 y p95
+# y su paridad con "torch", el backend que generó el índice:
+#   - coseno entre los vectores de cada consulta
+#   - coincidencia del primer resultado y recall@k de la búsqueda en el índice actual
+#
+# Consultas: las preguntas de preguntas.json, o un archivo con una consulta por línea.
+
+def _rss_mb():
+    """Memoria residente del proceso en MB"""
+    with open("/proc/self/status", "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def _percentile(values, fraction):
+    """Percentil (0-1) de una lista de valores"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def run_worker(backend, queries, runs, output_path):
+    """Mide un backend en este proceso y guarda sus vectores en output_path (.npy)"""
+    import numpy as np
+
+    meta = load_index_meta()
+    rss_start = _rss_mb()
+    start_time = time.time()
+    model = load_encoder(meta["model"], backend)
+    load_time = time.time() - start_time
+    rss_loaded = _rss_mb()
+
+    # Calentamiento: la primera inferencia reserva memoria y compila kernels
+    model.encode(queries[:1], convert_to_numpy=True)
+
+    latencies = []
+    for run in range(runs):
+        query = queries[run % len(queries)]
+        start_time = time.perf_counter()
+        model.encode([query], convert_to_numpy=True, normalize_embeddings=meta["normalize"])
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+    vectors = model.encode(queries, convert_to_numpy=True, normalize_embeddings=meta["normalize"])
+    np.save(output_path, np.ascontiguousarray(vectors, dtype="float32"))
+
+    return {
+        "backend": backend,
+        "load_time": round(load_time, 2),
+        "rss_model_mb": round(rss_loaded - rss_start, 1),
+        "rss_total_mb": round(_rss_mb(), 1),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2),
+            "p50": round(_percentile(latencies, 0.5), 2),
+            "p95": round(_percentile(latencies, 0.95), 2)
+        }
+    }
+
+def parity(reference, vectors, k=3):
+    """Paridad de los vectores de un backend con los de referencia sobre el índice actual"""
+    import numpy as np
+    import faiss
+
+    meta = load_index_meta()
+    index = faiss.read_index(os.path.join(current_dir, meta.get("index_file", "faiss_index.bin")))
+    apply_search_params(index, meta["index"])
+
+    reference = np.array(reference, dtype="float32")
+    vectors = np.array(vectors, dtype="float32")
+    faiss.normalize_L2(reference)
+    faiss.normalize_L2(vectors)
+
+    cosines = np.sum(reference * vectors, axis=1)
+    _, expected = index.search(reference, k)
+    _, found = index.search(vectors, k)
+
+    return {
+        "cosine_mean": round(float(cosines.mean()), 5),
+        "cosine_min": round(float(cosines.min()), 5),
+        "top1_agreement": round(float(np.mean(expected[:, 0] == found[:, 0])), 4),
+        f"recall@{k}": round(sum(len(set(e) & set(f)) for e, f in zip(expected, found)) / expected.size, 4)
+    }
+
+def load_queries(path=None):
+    """Consultas del benchmark: un archivo (una por línea) o las preguntas de preguntas.json"""
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    with open(PREGUNTAS_PATH, "r", encoding="utf-8") as f:
+        return [item["pregunta"].strip().lower() for item in json.load(f)["preguntas"]]
+
+# =====================
+# EJECUCIÓN EN TERMINAL
+# =====================
+if __name__ == "__main__":
+    import argparse
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description="Compara latencia, memoria y paridad de recall de los backends del codificador")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--queries", help="Archivo con una consulta por línea (por defecto, las preguntas de la FAQ)")
+    parser.add_argument("--runs", type=int, default=200, help="Codificaciones de una consulta para medir la latencia")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, queries, args.runs, args.output)))
+        sys.exit(0)
+
+    # La paridad siempre se mide contra torch
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vectors = {}
+        for backend in backends:
+            output = os.path.join(tmp_dir, f"{backend}.npy")
+            command = [sys.executable, os.path.abspath(__file__), "--worker", backend, "--output", output, "--runs", str(args.runs)]
+            if args.queries:
+                command += ["--queries", args.queries]
+            result = subprocess.run(command, capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"[ERROR] backend {backend}: {result.stderr.strip().splitlines()[-1:]}", file=sys.stderr)
+                continue
+            report.append(json.loads(result.stdout.strip().splitlines()[-1]))
+            vectors[backend] = np.load(output)
+
+        for entry in report:
+            if "torch" in vectors and entry["backend"] in vectors:
+                entry["parity"] = parity(vectors["torch"], vectors[entry["backend"]])
+
+    print(json.dumps({"queries": len(queries), "runs": args.runs, "backends": report}, ensure_ascii=False, indent=4))
@@ -1,72 +1,533 @@
 import os
 import sys
 import json
-import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
+import time
+import threading
+import importlib.util
+
+try:
+    from embeddings.answer_store import AnswerStore
+    from embeddings.index_factory import apply_search_params
+    from embeddings.embedding_cache import open_embedding_cache
+    from embeddings.encoder_backends import load_encoder, cache_model_name
+    from embeddings.lexical_index import LexicalIndex
+    from embeddings.faq_vectors import record_id_of
+except ImportError:
+    # Ejecución directa como script desde embeddings/
+    from answer_store import AnswerStore
+    from index_factory import apply_search_params
+    from embedding_cache import open_embedding_cache
+    from encoder_backends import load_encoder, cache_model_name
+    from lexical_index import LexicalIndex
+    from faq_vectors import record_id_of
 
 # ----------------------------
-# CARGA DE RECURSOS GLOBALES
+# CARGA DIFERIDA DE RECURSOS
 # ----------------------------
+# El modelo, el índice y las tablas se cargan en la primera búsqueda (o en warm_up),
+# no al importar el módulo: importar es instantáneo y los procesos que no buscan no pagan
+# la carga. El índice se mapea en memoria de solo lectura, así que todos los procesos
+# comparten las mismas páginas del page cache en lugar de tener una copia cada uno.
+# Para compartir también el modelo entre workers creados con fork, llame a warm_up()
+# en el proceso padre antes de crearlos (copy-on-write).
 current_dir = os.path.dirname(os.path.abspath(__file__))
 root_dir = os.path.dirname(current_dir)
 
-model = SentenceTransformer("sentence-transformers/multi-qa-mpnet-base-dot-v1")
-index = faiss.read_index(os.path.join(current_dir, "faiss_index.bin"))
+EMBEDDINGS_MODEL = "sentence-transformers/multi-qa-mpnet-base-dot-v1"
+INDEX_PATH = os.path.join(current_dir, "faiss_index.bin")
+QUESTIONS_PATH = os.path.join(current_dir, "preguntas_lista.json")
+ANSWERS_PATH = os.path.join(current_dir, "respuestas.bin")
+LEXICAL_PATH = os.path.join(current_dir, "lexical_index.json")
+PREGUNTAS_PATH = os.path.join(root_dir, "preguntas.json")
+INDEX_META_PATH = os.path.join(current_dir, "index_meta.json")
+
+# Backend del codificador de consultas: "torch", "onnx" u "onnx-int8" (ver encoder_backends.py)
+ENCODER_BACKEND = os.environ.get("EMBEDDINGS_BACKEND", "torch")
+
+# Contrato de embeddings de los índices generados antes de index_meta.json
+# (generate_embeddings.py siempre indexó vectores normalizados con este modelo)
+DEFAULT_INDEX_META = {"model": EMBEDDINGS_MODEL, "normalize": True, "metric": "inner_product", "index": {"type": "flat"}}
+
+# Cada cuántos segundos como máximo se comprueba si hay un índice nuevo publicado
+INDEX_RELOAD_INTERVAL = 5.0
 
-with open(os.path.join(current_dir, "preguntas_lista.json"), "r", encoding="utf-8") as f:
-    faiss_questions = json.load(f)
+# Búsqueda híbrida: FAISS + BM25 (lexical_index.py) fusionados por rango recíproco (RRF).
+# El 'score' de cada resultado sigue siendo la similitud coseno (los umbrales de config.py
+# se aplican sobre ella); un resultado que FAISS no acepta entra si contiene al menos
+# LEXICAL_THRESHOLD del idf de los términos de la consulta (siglas, nombres propios).
+HYBRID_SEARCH = True
+RRF_K = 60                 # Constante de la fusión: 1 / (RRF_K + rango)
+LEXICAL_CANDIDATES = 10    # Candidatos de cada buscador que entran en la fusión
+LEXICAL_THRESHOLD = 0.6
 
-with open(os.path.join(root_dir, "preguntas.json"), "r", encoding="utf-8") as f:
-    preguntas_db = json.load(f)
+# Candidatos de FAISS por resultado pedido cuando un item tiene varios vectores (se agrupan
+# por item con su mejor score) y cuando hay filtros de metadatos (se descartan después)
+MULTI_VECTOR_FETCH = 4
+FILTER_FETCH = 4
+
+_resources = None
+_load_time = None
+_load_error = None
+_load_lock = threading.Lock()
+_last_reload_check = 0.0
+_failed_signature = None
+
+def load_index_meta():
+    """
+    Retorna el contrato de embeddings del índice (modelo, normalización, métrica y dimensión)
+    guardado por generate_embeddings.py, o el contrato por defecto si el índice es anterior.
+    """
+    if not os.path.isfile(INDEX_META_PATH):
+        print(f"[WARN] {INDEX_META_PATH} no existe; se asume el contrato por defecto", file=sys.stderr)
+        return dict(DEFAULT_INDEX_META)
+    with open(INDEX_META_PATH, "r", encoding="utf-8") as f:
+        return {**DEFAULT_INDEX_META, **json.load(f)}
+
+def _meta_signature():
+    """Identifica la versión publicada de index_meta.json (None si no existe)"""
+    try:
+        st = os.stat(INDEX_META_PATH)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _load_index(meta):
+    """Carga el índice (mmap de solo lectura) y el almacén de respuestas que nombra el contrato"""
+    import faiss
+
+    # actualizar_indice.py publica archivos versionados y los nombra en index_meta.json
+    index_path = os.path.join(current_dir, meta.get("index_file", os.path.basename(INDEX_PATH)))
+    answers_path = os.path.join(current_dir, meta.get("answers_file", os.path.basename(ANSWERS_PATH)))
+
+    resources = {}
+    try:
+        resources["index"] = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        resources["mmap"] = True
+    except RuntimeError as e:
+        # Versiones de faiss sin mmap para este tipo de índice: lectura normal
+        print(f"[WARN] índice FAISS sin mmap ({e}); se carga en memoria", file=sys.stderr)
+        resources["index"] = faiss.read_index(index_path)
+        resources["mmap"] = False
+
+    # Parámetros de búsqueda del índice aproximado (efSearch / nprobe) elegidos al construirlo
+    apply_search_params(resources["index"], meta["index"])
+
+    if os.path.isfile(answers_path):
+        resources["answers"] = AnswerStore(answers_path)
+    else:
+        print(f"[WARN] {answers_path} no existe; ejecute generate_embeddings.py. Se usa una tabla en memoria", file=sys.stderr)
+        resources["answers"] = _build_answer_table()
+
+    # Índice léxico de la búsqueda híbrida (los índices anteriores no lo tienen)
+    lexical_path = os.path.join(current_dir, meta.get("lexical_file", os.path.basename(LEXICAL_PATH)))
+    resources["lexical"] = LexicalIndex(lexical_path) if os.path.isfile(lexical_path) else None
+    if resources["lexical"] is None:
+        print(f"[WARN] {lexical_path} no existe; búsqueda solo semántica (regenere el índice)", file=sys.stderr)
+
+    # Tras una actualización incremental hay ids eliminados: el almacén puede tener más registros
+    # (con varios vectores por item, el índice tiene más vectores que registros)
+    if not meta.get("id_shift") and len(resources["answers"]) < resources["index"].ntotal:
+        raise ValueError(f"El almacén de respuestas ({len(resources['answers'])}) no corresponde al índice ({resources['index'].ntotal})")
+    return resources
+
+def _check_dimensions(resources):
+    """Comprueba que el modelo produce vectores de la dimensión del índice"""
+    meta = resources["meta"]
+    dimension = resources["model"].get_sentence_embedding_dimension()
+    if dimension != resources["index"].d or meta.get("dimension", dimension) != dimension:
+        raise ValueError(f"El modelo {meta['model']} ({dimension}) no corresponde al índice ({resources['index'].d})")
+
+def _load_resources():
+    """Carga modelo, índice (mmap de solo lectura) y tablas de preguntas"""
+    # La firma se toma antes de leer: si se publica otra versión durante la carga, se recargará
+    resources = {"signature": _meta_signature(), "meta": load_index_meta()}
+    resources.update(_load_index(resources["meta"]))
+
+    # Las consultas deben codificarse igual que las preguntas indexadas
+    resources["model"] = load_encoder(resources["meta"]["model"], ENCODER_BACKEND)
+    resources["backend"] = ENCODER_BACKEND
+    _check_dimensions(resources)
+    _open_cache(resources)
+    return resources
+
+def _open_cache(resources):
+    """Caché de embeddings de las consultas para el modelo y la normalización del contrato"""
+    meta = resources["meta"]
+    model_name = cache_model_name(meta["model"], resources["backend"])
+    resources["embedding_cache"] = open_embedding_cache(model_name, resources["index"].d, meta["normalize"])
+
+def _build_answer_table():
+    """
+    Construye en memoria la tabla id → registro para índices generados antes del almacén
+    de respuestas (relaciona preguntas_lista.json con preguntas.json por texto normalizado).
+    """
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        faiss_questions = json.load(f)
+
+    with open(PREGUNTAS_PATH, "r", encoding="utf-8") as f:
+        preguntas_db = json.load(f)
+
+    by_question = {}
+    for faq_index, item in enumerate(preguntas_db["preguntas"]):
+        by_question.setdefault(item["pregunta"].strip().lower(), {
+            "faq_index": faq_index,
+            "pregunta": item["pregunta"],
+            "respuesta": item["respuesta"],
+            "respuesta_telefonica": item.get("respuesta_telefonica"),
+            "metadata": item.get("metadata", {}),
+            "url": item.get("url", "")
+        })
+
+    return [by_question.get(pregunta.strip().lower()) for pregunta in faiss_questions]
+
+def get_resources():
+    """
+    Retorna los recursos de búsqueda ('model', 'index', 'answers', 'lexical', 'meta', 'mmap', 'embedding_cache'),
+    cargándolos la primera vez (una sola carga aunque lleguen varios hilos a la vez) y
+    recargando el índice si se publicó uno nuevo (ver reload_index).
+    Lanza la excepción de la carga si falló.
+    """
+    global _resources, _load_time, _load_error
+
+    if _resources is None:
+        with _load_lock:
+            # Si la carga ya falló no se reintenta en cada búsqueda (cada intento tarda segundos)
+            if _load_error is not None:
+                raise RuntimeError(f"Recursos de búsqueda no disponibles: {_load_error}")
+            if _resources is None:
+                start_time = time.time()
+                try:
+                    _resources = _load_resources()
+                except Exception as e:
+                    _load_error = e
+                    raise
+                _load_time = time.time() - start_time
+    elif time.monotonic() - _last_reload_check >= INDEX_RELOAD_INTERVAL:
+        try:
+            reload_index()
+        except Exception as e:
+            # Se sigue sirviendo la versión anterior
+            print(f"[ERROR] no se pudo recargar el índice publicado: {e}", file=sys.stderr)
+    return _resources
+
+def reload_index(force=False):
+    """
+    Cambia en caliente el índice y el almacén de respuestas si actualizar_indice.py publicó
+    una versión nueva (index_meta.json cambió). El modelo se reutiliza si el contrato no lo
+    cambia. Las búsquedas en curso terminan con la versión que tomaron; las siguientes usan
+    la nueva. Retorna True si se recargó. Lanza la excepción si la versión nueva no carga.
+    """
+    global _resources, _load_time, _last_reload_check, _failed_signature
+
+    _last_reload_check = time.monotonic()
+    current = _resources
+    signature = _meta_signature()
+    if current is None or (not force and signature in (current["signature"], _failed_signature)):
+        return False
+
+    with _load_lock:
+        if _resources is not current:
+            return True  # Otro hilo ya la recargó
+        start_time = time.time()
+        try:
+            resources = {"signature": signature, "meta": load_index_meta()}
+            resources.update(_load_index(resources["meta"]))
+            resources["backend"] = current["backend"]
+            if resources["meta"]["model"] == current["meta"]["model"] and resources["meta"]["normalize"] == current["meta"]["normalize"]:
+                resources["model"] = current["model"]
+                resources["embedding_cache"] = current["embedding_cache"]
+            else:
+                resources["model"] = load_encoder(resources["meta"]["model"], resources["backend"])
+                _open_cache(resources)
+            _check_dimensions(resources)
+        except Exception:
+            # No se reintenta la misma publicación en cada comprobación
+            _failed_signature = signature
+            raise
+
+        _resources = resources
+        _load_time = time.time() - start_time
+    print(f"[INFO] índice recargado: versión {resources['meta'].get('version', 0)}, {resources['index'].ntotal} vectores", file=sys.stderr)
+    return True
+
+def loaded_version():
+    """
+    Identifica la versión del índice cargada (cambia con cada recarga en caliente), o None si
+    aún no se cargó. Sirve para invalidar lo que se derivó de respuestas de otra versión.
+    """
+    current = _resources
+    return current["signature"] if current is not None else None
+
+def warm_up():
+    """
+    Carga los recursos y ejecuta una codificación de prueba para que la primera búsqueda
+    real no pague la inicialización. Retorna los segundos empleados.
+    """
+    start_time = time.time()
+    get_resources()["model"].encode(["calentamiento"], convert_to_numpy=True)
+    return time.time() - start_time
+
+def dependencies_available():
+    """
+    Indica si las dependencias y archivos necesarios existen, sin cargar nada pesado.
+    """
+    modules = ("numpy", "faiss", "sentence_transformers") + (("onnxruntime",) if ENCODER_BACKEND != "torch" else ())
+    meta = load_index_meta() if os.path.isfile(INDEX_META_PATH) else DEFAULT_INDEX_META
+    index_available = os.path.isfile(os.path.join(current_dir, meta.get("index_file", os.path.basename(INDEX_PATH))))
+    answers_path = os.path.join(current_dir, meta.get("answers_file", os.path.basename(ANSWERS_PATH)))
+    answers_available = os.path.isfile(answers_path) or (os.path.isfile(QUESTIONS_PATH) and os.path.isfile(PREGUNTAS_PATH))
+    return all(importlib.util.find_spec(m) is not None for m in modules) and index_available and answers_available
+
+def health():
+    """
+    Retorna el estado del buscador: si está cargado, tiempo de carga, tamaño y contrato del índice.
+    """
+    status = {
+        "loaded": _resources is not None,
+        "error": str(_load_error) if _load_error is not None else None,
+        "load_time": None,
+        "vectors": None,
+        "dimension": None,
+        "mmap": None,
+        "version": None,
+        "backend": None,
+        "lexical_terms": None,
+        "embedding_cache": None,
+        "meta": None
+    }
+    if _resources is not None:
+        status["load_time"] = round(_load_time, 3)
+        status["vectors"] = _resources["index"].ntotal
+        status["dimension"] = _resources["index"].d
+        status["mmap"] = _resources["mmap"]
+        status["version"] = _resources["meta"].get("version", 0)
+        status["backend"] = _resources["backend"]
+        if _resources["lexical"] is not None:
+            status["lexical_terms"] = len(_resources["lexical"])
+        if _resources["embedding_cache"] is not None:
+            status["embedding_cache"] = _resources["embedding_cache"].stats()
+        status["meta"] = _resources["meta"]
+    return status
+
+def __getattr__(name):
+    # Compatibilidad con el acceso directo a los antiguos globales del módulo (carga diferida)
+    if name in ("model", "index", "answers", "meta"):
+        return get_resources()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ----------------------------
 # FUNCION PRINCIPAL DE FAISS
 # ----------------------------
-def faiss_search(pregunta_usuario, threshold=0.5, k_value=3):
+def encode_queries(textos, batch_size=64):
     """
-    Retorna una lista de strings (cada string es la 'respuesta' de la FAQ),
-    con hasta k_value resultados que pasen el threshold.
+    Retorna la matriz de embeddings (len(textos) x dimension) de varios textos. Los ya
+    codificados antes (en este proceso o en otro) salen del caché de embeddings sin pasar
+    por el modelo; los nuevos se guardan en disco más tarde, fuera del camino de la consulta.
+    """
+    resources = get_resources()
+    if resources["embedding_cache"] is not None:
+        return resources["embedding_cache"].encode(resources["model"], textos, batch_size=batch_size, defer=True)
+    return resources["model"].encode(
+        list(textos), batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=resources["meta"]["normalize"]
+    )
+
+def encode_query(texto):
+    """
+    Retorna el embedding (matriz 1 x dimension) de un texto, para reutilizarlo
+    en varias búsquedas sin volver a pasar por el modelo.
+    """
+    return encode_queries([texto])
+
+def _prepare_queries(embeddings, meta):
+    """
+    Aplica el contrato del índice a una matriz de consultas: float32 contiguo y, si el índice
+    está normalizado, vectores unitarios (el producto interno es entonces el coseno y las
+    puntuaciones no dependen de la longitud de la consulta).
+    """
+    import numpy as np
+    import faiss
+
+    queries = np.array(embeddings, dtype="float32", copy=True).reshape(-1, embeddings.shape[-1])
+    if meta["normalize"]:
+        faiss.normalize_L2(queries)
+    return queries
+
+def _aggregate(scores, ids, id_shift):
+    """
+    Agrupa una fila de candidatos de FAISS por registro del almacén, con el mejor vector de
+    cada uno (los índices con varios vectores por FAQ codifican el registro en el id).
+    Retorna {id de registro: (score, número de vector)} en orden de score.
+    """
+    best = {}
+    for idx, sim in zip(ids, scores):
+        if idx < 0:
+            continue
+        record_id = record_id_of(int(idx), id_shift)
+        if record_id not in best:
+            best[record_id] = (float(sim), int(idx) - (record_id << id_shift))
+    return best
+
+def _matches(metadata, filters):
+    """Indica si los metadatos de un registro cumplen los filtros {clave: valor o lista de valores}"""
+    for key, expected in filters.items():
+        value = metadata.get(key)
+        if isinstance(expected, (list, tuple, set)):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+def _dense_score(index, query, record_id, registro, id_shift):
+    """Mejor similitud de la consulta con los vectores de un registro que no salió entre los candidatos de FAISS"""
+    numbers = range(len(registro.get("vectores", ["pregunta"]))) if id_shift else [0]
+    try:
+        return max(float(index.reconstruct((record_id << id_shift) | number) @ query) for number in numbers)
+    except RuntimeError:
+        # Índices sin reconstrucción por id (IVF sin mapa directo)
+        return 0.0
+
+def _collect_results(scores, ids, query_text, query, threshold, k_value, resources, filters=None, verbose=False):
+    """
+    Convierte una fila del resultado de index.search en la lista de hasta k_value dicts
+    {'id', 'answer', 'score', 'pregunta', 'faq_index', 'metadata', 'match'} aceptados, un
+    resultado por FAQ con el mejor score de sus vectores. Con índice léxico fusiona (RRF) los
+    candidatos con los de BM25 y añade 'lexical_score' (cobertura de la consulta) y 'rrf'.
+    """
+    id_shift = resources["meta"].get("id_shift", 0)
+    dense = _aggregate(scores, ids, id_shift)
+
+    hybrid = HYBRID_SEARCH and resources["lexical"] is not None
+    lexical, fused = {}, {}
+    if hybrid:
+        lexical = {record_id: coverage for record_id, _, coverage in resources["lexical"].search(query_text, LEXICAL_CANDIDATES)}
+        for ranking in (list(dense), list(lexical)):
+            for rank, record_id in enumerate(ranking):
+                fused[record_id] = fused.get(record_id, 0) + 1 / (RRF_K + rank + 1)
+    order = sorted(fused, key=fused.get, reverse=True) if hybrid else list(dense)
+
+    resultados = []
+    for rank, record_id in enumerate(order):
+        # El id (desplazado id_shift bits) es la posición del registro en el almacén de respuestas
+        registro = resources["answers"][record_id]
+        if registro is None:
+            continue
+
+        if record_id in dense:
+            score, number = dense[record_id]
+        else:
+            score, number = _dense_score(resources["index"], query, record_id, registro, id_shift), None
+        coverage = lexical.get(record_id, 0.0)
+
+        # Debug para ver en consola (stderr: la salida estándar puede ser un canal de datos,
+        # p. ej. la de ivr_client.py, que el dialplan lee como rutas de audio)
+        if verbose:
+            print(f"Top {rank+1} -> id={record_id}, score={score:.4f}, léxico={coverage:.2f}, Pregunta='{registro['pregunta']}'", file=sys.stderr)
+
+        if score < threshold and coverage < LEXICAL_THRESHOLD:
+            if not hybrid:
+                break  # Ordenados por score: los siguientes tampoco pasan
+            continue
+        if filters and not _matches(registro.get("metadata", {}), filters):
+            continue
+
+        # Qué representación del item se parece más a la consulta
+        vectores = registro.get("vectores", ["pregunta"])
+        if number is None:
+            match = "lexico"
+        else:
+            # Un vector antiguo que el índice no pudo eliminar (HNSW) puede quedar fuera de la lista
+            match = vectores[number] if number < len(vectores) else vectores[0]
+
+        resultado = {
+            "id": record_id,
+            "answer": registro["respuesta"],
+            "score": score,
+            "pregunta": registro["pregunta"],
+            "faq_index": registro["faq_index"],
+            "metadata": registro.get("metadata", {}),
+            "match": match
+        }
+        if registro.get("respuesta_telefonica"):
+            resultado["respuesta_telefonica"] = registro["respuesta_telefonica"]
+        if hybrid:
+            resultado["lexical_score"] = round(coverage, 4)
+            resultado["rrf"] = fused[record_id]
+        resultados.append(resultado)
+        if len(resultados) == k_value:
+            break
+    return resultados
+
+def _search(resources, query_texts, embeddings, threshold, k_value, filters=None, verbose=False):
+    """Búsqueda (híbrida si hay índice léxico) de una matriz de consultas; una lista de resultados por fila"""
+    queries = _prepare_queries(embeddings, resources["meta"])
+
+    # Candidatos extra: varios vectores de un mismo item y resultados descartados por los filtros
+    fetch = k_value
+    if resources["meta"].get("id_shift"):
+        fetch *= MULTI_VECTOR_FETCH
+    if filters:
+        fetch *= FILTER_FETCH
+    if HYBRID_SEARCH and resources["lexical"] is not None:
+        fetch = max(fetch, LEXICAL_CANDIDATES)
+
+    D, I = resources["index"].search(queries, k=fetch)
+    return [
+        _collect_results(D[row], I[row], query_texts[row], queries[row], threshold, k_value, resources, filters, verbose)
+        for row in range(len(queries))
+    ]
+
+def faiss_search_with_scores(pregunta_usuario, threshold=0.5, k_value=3, embedding=None, filters=None):
+    """
+    Retorna una lista de dicts {'id', 'answer', 'score', 'pregunta', 'faq_index', 'metadata', 'match'}
+    ordenada por score, con hasta k_value resultados que pasen el threshold (uno por FAQ).
+    'faq_index' es la posición del item en preguntas.json y 'match' el vector que mejor
+    coincidió ("pregunta", "parafrasis", "respuesta" o "lexico"). Si se pasa 'embedding'
+    (de encode_query) no se recalcula. 'filters' ({clave: valor o lista de valores})
+    restringe los resultados por los metadatos del item.
+    Con búsqueda híbrida el orden es el de la fusión con BM25 y cada resultado trae además
+    'lexical_score' y 'rrf'; 'score' sigue siendo la similitud coseno. Los items con versión
+    telefónica de la respuesta la traen en 'respuesta_telefonica'.
     """
     try:
         # 1) Generar embedding
-        embedding = model.encode([pregunta_usuario], convert_to_numpy=True)
-        
-        # 2) Buscar en FAISS con k_value
-        D, I = index.search(embedding, k=k_value)
-        
-        # 3) Recopilar resultados
-        respuestas = []
-        for rank in range(k_value):
-            idx = I[0][rank]
-            sim = D[0][rank]
-            
-            # Debug para ver en consola
-            print(f"Top {rank+1} -> idx={idx}, score={sim}")
-            
-            # Si no supera threshold o idx no es válido, paramos
-            if idx < 0 or sim < threshold:
-                break
-            
-            # Recuperar la 'pregunta' con la que indexamos en preguntas_lista.json
-            faiss_pregunta = faiss_questions[idx].strip().lower()
-            
-            # Debug extra
-            print(f"Rank={rank}, Score={sim}, Pregunta='{faiss_pregunta}'")
-            
-            # Buscar en preguntas.json la respuesta asociada
-            for item in preguntas_db["preguntas"]:
-                if item["pregunta"].strip().lower() == faiss_pregunta:
-                    # Agregamos SOLO la respuesta (para no meter tokens extra)
-                    respuestas.append(item["respuesta"])
-                    break
+        if embedding is None:
+            embedding = encode_query(pregunta_usuario)
         
-        return respuestas
+        # 2) Buscar en FAISS (y BM25) con k_value y 3) recopilar resultados
+        return _search(get_resources(), [pregunta_usuario], embedding, threshold, k_value, filters, verbose=True)[0]
 
     except Exception as e:
         print(f"[ERROR] en faiss_search: {str(e)}", file=sys.stderr)
         return []
 
+def faiss_search_batch(queries, k_value=3, threshold=0.5, batch_size=64, embeddings=None, filters=None):
+    """
+    Búsqueda de varias consultas a la vez: un único model.encode por lotes y un único
+    index.search sobre la matriz de embeddings (evaluación offline, precalentado de cachés,
+    varias hipótesis del ASR o reformulaciones de una pregunta).
+    Retorna una lista (una entrada por consulta, en el mismo orden) con los resultados de
+    cada una en el formato de faiss_search_with_scores. Si se pasa 'embeddings'
+    (matriz len(queries) x dimension) no se recalculan.
+    Lanza la excepción si falla la carga o la búsqueda.
+    """
+    if len(queries) == 0:
+        return []
+    
+    resources = get_resources()
+    if embeddings is None:
+        embeddings = encode_queries(queries, batch_size=batch_size)
+    
+    return _search(resources, list(queries), embeddings, threshold, k_value, filters)
+
+def faiss_search(pregunta_usuario, threshold=0.5, k_value=3, filters=None):
+    """
+    Retorna una lista de strings (cada string es la 'respuesta' de la FAQ),
+    con hasta k_value resultados que pasen el threshold.
+    """
+    # Agregamos SOLO la respuesta (para no meter tokens extra)
+    return [r["answer"] for r in faiss_search_with_scores(pregunta_usuario, threshold, k_value, filters=filters)]
+
 # --------------------------------
 # EJECUCION EN TERMINAL (TEST)
 # --------------------------------
@@ -75,6 +536,14 @@ if __name__ == "__main__":
         print("Error: Debes proporcionar una pregunta como argumento.", file=sys.stderr)
         sys.exit(1)
     
+    # Evaluación por lotes: buscar_pregunta.py --batch consultas.txt (una consulta por línea)
+    if sys.argv[1] == "--batch":
+        with open(sys.argv[2], "r", encoding="utf-8") as f:
+            consultas = [linea.strip() for linea in f if linea.strip()]
+        for consulta, resultados in zip(consultas, faiss_search_batch(consultas, k_value=2)):
+            print(json.dumps({"query": consulta, "results": resultados}, ensure_ascii=False))
+        sys.exit(0)
+    
     user_query = sys.argv[1]
     k = 2
     resultado = faiss_search(user_query, threshold=0.5, k_value=k)
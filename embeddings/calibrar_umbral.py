@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+
+try:
+    from embeddings.buscar_pregunta import faiss_search_batch, encode_queries
+except ImportError:
+    # Ejecución directa como script desde embeddings/
+    from buscar_pregunta import faiss_search_batch, encode_queries
+
+# =====================
+# CALIBRACIÓN DE UMBRALES DE SIMILITUD
+# =====================
+# Elige los umbrales de config.py a partir de un conjunto de consultas etiquetadas
+# (JSONL, una por línea):
+#   {"query": "¿dónde queda la agencia?", "faq_index": 1}
+#   {"query": "¿cuál es el pronóstico del clima?", "faq_index": null}
+# 'faq_index' es la posición del item correcto en preguntas.json, o null si la consulta
+# no tiene respuesta en la base de conocimiento.
+#
+# Cada umbral se mide sobre el mismo estadístico que compara asistente_virtual.py, con la
+# búsqueda que hace el turno (search_faq: --k resultados que pasan --search-threshold):
+#   FAQ_SEARCH_THRESHOLD      → coseno del primer resultado sin filtrar; acierto si es el item
+#                               correcto. El de mejor F1 (las respuestas pasan después por el LLM)
+#   FAQ_FAST_PATH_THRESHOLD   → coseno máximo entre los resultados; acierto si el item correcto
+#                               está entre ellos (se inyectan todos). El menor con precisión
+#                               >= --precision (una sola llamada al LLM)
+#   FAQ_AUDIO_CACHE_THRESHOLD → coseno del primer resultado, que es el que se reproduce; acierto
+#                               si es el item correcto. El menor con precisión >= --strict-precision
+#                               (sin LLM que corrija)
+# Aceptar una consulta sin acierto (o sin respuesta en la base) es un falso positivo.
+
+def load_labelled_queries(path):
+    """Lee el conjunto etiquetado; retorna una lista de (consulta, faq_index o None)"""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                queries.append((item["query"], item.get("faq_index")))
+    return queries
+
+def evaluate_threshold(samples, threshold):
+    """
+    Precisión, recall y F1 de aceptar una consulta cuando su score >= threshold.
+    'samples' es una lista de (score, correcto, en_dominio).
+    """
+    tp = sum(1 for score, correct, _ in samples if score >= threshold and correct)
+    fp = sum(1 for score, correct, _ in samples if score >= threshold and not correct)
+    in_domain = sum(1 for _, _, labelled in samples if labelled)
+
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / in_domain if in_domain else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"threshold": round(threshold, 4), "precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4)}
+
+def threshold_curve(samples):
+    """Puntos de evaluate_threshold para cada score observado, de menor a mayor umbral"""
+    return [evaluate_threshold(samples, t) for t in sorted({score for score, _, _ in samples})]
+
+def lowest_with_precision(curve, target):
+    """El umbral más permisivo que sigue cumpliendo la precisión pedida en toda la cola"""
+    chosen = None
+    for point in reversed(curve):
+        if point["precision"] < target:
+            break
+        chosen = point
+    return chosen
+
+def calibrate(labelled_queries, precision=0.95, strict_precision=0.99, k_value=3, search_threshold=0.5):
+    """
+    Recomienda umbrales a partir de consultas etiquetadas (ver el encabezado del módulo).
+    'k_value' y 'search_threshold' deben ser los de la búsqueda del turno (search_faq).
+    Retorna un dict con los umbrales recomendados y las curvas evaluadas.
+    """
+    queries = [query for query, _ in labelled_queries]
+    embeddings = encode_queries(queries)
+    top_results = faiss_search_batch(queries, k_value=1, threshold=-1.0, embeddings=embeddings)
+    turn_results = faiss_search_batch(queries, k_value=k_value, threshold=search_threshold, embeddings=embeddings)
+
+    search_samples, fast_path_samples, audio_samples = [], [], []
+    for (_, label), top_hits, hits in zip(labelled_queries, top_results, turn_results):
+        labelled = label is not None
+        top = top_hits[0] if top_hits else None
+        search_samples.append((top["score"] if top else -1.0, labelled and top is not None and top["faq_index"] == label, labelled))
+        fast_path_samples.append((
+            max((h["score"] for h in hits), default=-1.0),
+            labelled and any(h["faq_index"] == label for h in hits),
+            labelled
+        ))
+        audio_samples.append((hits[0]["score"] if hits else -1.0, labelled and bool(hits) and hits[0]["faq_index"] == label, labelled))
+
+    search_curve = threshold_curve(search_samples)
+    fast_path_curve = threshold_curve(fast_path_samples)
+    audio_curve = threshold_curve(audio_samples)
+
+    return {
+        "queries": len(search_samples),
+        "in_domain": sum(1 for _, _, labelled in search_samples if labelled),
+        "FAQ_SEARCH_THRESHOLD": max(search_curve, key=lambda point: (point["f1"], point["threshold"])) if search_curve else None,
+        "FAQ_FAST_PATH_THRESHOLD": lowest_with_precision(fast_path_curve, precision),
+        "FAQ_AUDIO_CACHE_THRESHOLD": lowest_with_precision(audio_curve, strict_precision),
+        "curve": {
+            "FAQ_SEARCH_THRESHOLD": search_curve,
+            "FAQ_FAST_PATH_THRESHOLD": fast_path_curve,
+            "FAQ_AUDIO_CACHE_THRESHOLD": audio_curve
+        }
+    }
+
+# =====================
+# EJECUCIÓN EN TERMINAL
+# =====================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calibra los umbrales de similitud de FAISS con consultas etiquetadas")
+    parser.add_argument("consultas", help="Archivo JSONL con {'query', 'faq_index'} por línea")
+    parser.add_argument("--precision", type=float, default=0.95, help="Precisión mínima del camino rápido")
+    parser.add_argument("--strict-precision", type=float, default=0.99, help="Precisión mínima del audio precalculado")
+    parser.add_argument("--k", type=int, default=3, help="Resultados de la búsqueda del turno (k de search_faq)")
+    parser.add_argument("--search-threshold", type=float, default=0.5,
+                        help="Umbral con que filtra la búsqueda del turno (config.FAQ_SEARCH_THRESHOLD)")
+    parser.add_argument("--curve", action="store_true", help="Incluir las curvas completas en la salida")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.consultas):
+        print(f"Error: no existe {args.consultas}", file=sys.stderr)
+        sys.exit(1)
+
+    report = calibrate(load_labelled_queries(args.consultas), args.precision, args.strict_precision,
+                       k_value=args.k, search_threshold=args.search_threshold)
+    if not args.curve:
+        report.pop("curve")
+    print(json.dumps(report, ensure_ascii=False, indent=4))
@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import atexit
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# ----------------------------
+# CACHÉ DE EMBEDDINGS POR TEXTO
+# ----------------------------
+# Evita volver a pasar por el modelo un texto ya codificado: al regenerar el índice
+# (generate_embeddings.py, actualizar_indice.py) y en consultas repetidas de usuarios.
+#
+# La clave es el hash del modelo, la normalización de salida y el texto (Unicode NFC y
+# espacios colapsados, que no cambian la tokenización). Cada modelo tiene su directorio:
+#   vectors.f32: matriz float32 (filas x dimensión) que solo crece; se lee con mmap
+#   keys.txt:    un hash por línea; la línea i es la fila i de la matriz
+#   info.json:   modelo y dimensión (para abrir el caché sin cargar el modelo)
+# Las escrituras toman un flock y añaden primero el vector y después la clave, así que un
+# lector nunca ve una clave sin su fila. Al llegar a EMBEDDING_CACHE_MAX_ROWS se vacía
+# (con archivos nuevos: nunca se trunca una fila que otro proceso pueda tener mapeada).
+# Cada proceso lee de keys.txt solo las líneas añadidas desde su última lectura.
+#
+# Delante del disco hay un LRU en memoria para las consultas más frecuentes. Las consultas
+# de usuarios (encode con defer=True) no escriben en disco en el turno: quedan pendientes
+# en memoria y un hilo aparte las guarda por lotes (EMBEDDING_CACHE_FLUSH_ROWS o
+# EMBEDDING_CACHE_FLUSH_SECONDS) y al salir del proceso.
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+
+EMBEDDING_CACHE_DIR = os.path.join(root_dir, "cache", "embeddings")
+EMBEDDING_CACHE_MAX_ROWS = 100_000   # ~300 MB con vectores de 768 dimensiones
+EMBEDDING_CACHE_MEMORY = 2048        # Vectores en el LRU en memoria
+EMBEDDING_CACHE_FLUSH_ROWS = 64      # Consultas pendientes que disparan su escritura en disco
+EMBEDDING_CACHE_FLUSH_SECONDS = 30   # Antigüedad máxima de una consulta pendiente de escribir
+
+VECTORS_NAME = "vectors.f32"
+KEYS_NAME = "keys.txt"
+INFO_NAME = "info.json"
+LOCK_NAME = ".lock"
+
+def normalize_text(text):
+    """Normaliza un texto para la clave: Unicode NFC y espacios colapsados"""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+class EmbeddingCache:
+    """Caché persistente de embeddings de un modelo, compartido entre procesos"""
+
+    def __init__(self, model_name, dimension=None, normalize=True, directory=EMBEDDING_CACHE_DIR,
+                 max_rows=EMBEDDING_CACHE_MAX_ROWS, memory_size=EMBEDDING_CACHE_MEMORY):
+        import numpy as np
+
+        self._np = np
+        self.model_name = model_name
+        self.dimension = dimension
+        self.normalize = normalize
+        self.max_rows = max_rows
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self.directory = os.path.join(directory, hashlib.sha256(model_name.encode("utf-8")).hexdigest()[:16])
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._vectors_path = os.path.join(self.directory, VECTORS_NAME)
+        self._keys_path = os.path.join(self.directory, KEYS_NAME)
+        self._info_path = os.path.join(self.directory, INFO_NAME)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._rows = {}             # hash → fila
+        self._row_count = 0         # Líneas de keys.txt leídas
+        self._matrix = None         # memmap de las filas conocidas
+        self._keys_signature = -1   # Versión de keys.txt ya leída
+        self._keys_offset = 0       # Bytes de keys.txt ya leídos (hasta el último salto de línea)
+        self._pending = {}          # hash → vector de consultas aún no escritas en disco
+        self._pending_since = None
+        self._flushing = False
+        atexit.register(self.flush)
+
+        # Sin dimensión conocida se toma la del caché existente o la del primer vector guardado
+        if os.path.isfile(self._info_path):
+            with open(self._info_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)["dimension"]
+            if self.dimension is not None and self.dimension != stored:
+                raise ValueError(f"El caché de {model_name} tiene dimensión {stored}, no {self.dimension}")
+            self.dimension = stored
+
+    def key(self, text):
+        """Clave de un texto para este modelo y normalización"""
+        raw = json.dumps([self.model_name, self.normalize, normalize_text(text)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    @contextmanager
+    def _locked(self):
+        """Bloqueo exclusivo entre procesos para escribir (con el bloqueo de hilos tomado)"""
+        with open(os.path.join(self.directory, LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _keys_version(self):
+        """Identifica el contenido actual de keys.txt (None si no existe)"""
+        try:
+            st = os.stat(self._keys_path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _refresh(self):
+        """
+        Lee las claves que otros procesos añadieron y vuelve a mapear la matriz (con el bloqueo
+        tomado). Si keys.txt es otro archivo (se vació) se relee entero.
+        """
+        signature = self._keys_version()
+        if signature == self._keys_signature:
+            return
+        if signature is None or not signature[1] or self.dimension is None:
+            self._reset(signature)
+            return
+
+        incremental = (self._keys_signature not in (None, -1) and signature[0] == self._keys_signature[0]
+                       and signature[1] >= self._keys_offset)
+        rows = self._rows if incremental else {}
+        row_count = self._row_count if incremental else 0
+        offset = self._keys_offset if incremental else 0
+        try:
+            with open(self._keys_path, "rb") as f:
+                if os.fstat(f.fileno()).st_ino != signature[0]:
+                    raise ValueError("keys.txt reemplazado durante la lectura")
+                f.seek(offset)
+                data = f.read()
+            # Solo líneas completas: el resto se lee cuando su escritor termine
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].decode("ascii").splitlines():
+                rows[line] = row_count
+                row_count += 1
+            matrix = self._matrix
+            if row_count != self._row_count or matrix is None or not incremental:
+                matrix = self._np.memmap(self._vectors_path, dtype="float32", mode="r", shape=(row_count, self.dimension)) if row_count else None
+        except (OSError, ValueError):
+            # Otro proceso está vaciando el caché: vacío por ahora, se relee en la próxima consulta
+            self._reset(-1)
+            return
+
+        self._rows = rows
+        self._row_count = row_count
+        self._matrix = matrix
+        self._keys_offset = offset + end
+        self._keys_signature = signature
+
+    def _reset(self, signature):
+        """Olvida las filas leídas (con el bloqueo tomado)"""
+        self._rows = {}
+        self._row_count = 0
+        self._matrix = None
+        self._keys_offset = 0
+        self._keys_signature = signature
+
+    def get(self, texts):
+        """
+        Retorna una lista con el vector de cada texto (numpy float32) o None si no está en caché
+        """
+        found = []
+        with self._lock:
+            self._refresh()
+            for text in texts:
+                key = self.key(text)
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                elif key in self._pending:
+                    vector = self._pending[key]
+                    self._remember(key, vector)
+                elif key in self._rows:
+                    vector = self._np.array(self._matrix[self._rows[key]])
+                    self._remember(key, vector)
+
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                found.append(vector)
+        return found
+
+    def _remember(self, key, vector):
+        """Añade un vector al LRU en memoria (con el bloqueo tomado)"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def put(self, texts, vectors, defer=False):
+        """
+        Guarda los vectores (matriz len(texts) x dimensión) de los textos. Con defer=True
+        quedan en memoria y se escriben en disco más tarde, por lotes y en otro hilo.
+        """
+        vectors = self._np.ascontiguousarray(vectors, dtype="float32")
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            vectors = vectors.reshape(-1, self.dimension)
+            entries = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                self._remember(key, vector.copy())
+                entries[key] = vector.copy()
+            if defer:
+                if not self._pending:
+                    self._pending_since = time.monotonic()
+                self._pending.update(entries)
+                due = (len(self._pending) >= EMBEDDING_CACHE_FLUSH_ROWS
+                       or time.monotonic() - self._pending_since >= EMBEDDING_CACHE_FLUSH_SECONDS)
+                if not due or self._flushing:
+                    return
+                self._flushing = True
+        if defer:
+            threading.Thread(target=self.flush, name="embedding-cache-flush", daemon=True).start()
+        else:
+            self._write(entries)
+
+    def flush(self):
+        """Escribe en disco los vectores pendientes (ver put con defer=True)"""
+        with self._lock:
+            entries, self._pending = self._pending, {}
+            self._pending_since = None
+        try:
+            if entries:
+                self._write(entries)
+        finally:
+            with self._lock:
+                self._flushing = False
+
+    def _write(self, entries):
+        """
+        Añade entradas al disco. El bloqueo de hilos solo se toma para leer y actualizar el
+        estado, no durante la escritura: las consultas de otros hilos no esperan al disco.
+        """
+        try:
+            with self._locked():
+                with self._lock:
+                    self._refresh()
+                    entries = {key: vector for key, vector in entries.items() if key not in self._rows}
+                    row_count = self._row_count
+                if not entries:
+                    return
+                if row_count + len(entries) > self.max_rows:
+                    self._clear(row_count)
+                    row_count = 0
+                self._append(entries, row_count)
+            with self._lock:
+                self._refresh()
+        except OSError as e:
+            print(f"[WARN] no se pudo escribir el caché de embeddings: {e}", file=sys.stderr)
+
+    def _clear(self, row_count):
+        """Vacía el caché en disco (con el flock tomado)"""
+        print(f"[INFO] caché de embeddings lleno ({row_count} filas); se vacía", file=sys.stderr)
+        # Archivos nuevos en lugar de truncar: otros procesos pueden tener la matriz mapeada
+        for path in (self._keys_path, self._vectors_path):
+            with open(f"{path}.part", "wb"):
+                pass
+            os.replace(f"{path}.part", path)
+
+    def _append(self, entries, row_count):
+        """Añade filas al final de la matriz y después sus claves (con el flock tomado)"""
+        if not os.path.isfile(self._info_path):
+            with open(f"{self._info_path}.part", "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dimension": self.dimension}, f)
+            os.replace(f"{self._info_path}.part", self._info_path)
+        with open(self._vectors_path, "r+b" if os.path.exists(self._vectors_path) else "wb") as f:
+            # Descarta filas huérfanas de una escritura interrumpida antes de sus claves
+            f.truncate(row_count * self.dimension * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(self._np.stack(list(entries.values())).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self._keys_path, "a", encoding="ascii") as f:
+            f.write("".join(f"{key}\n" for key in entries))
+
+    def encode(self, model, texts, batch_size=64, defer=False):
+        """
+        Codifica los textos con el modelo, pasando por él solo los que no están en caché.
+        'model' puede ser el modelo o una función que lo carga (solo se llama si falta algún texto).
+        'defer' aplaza la escritura en disco de los vectores nuevos (ver put); para el camino
+        de las consultas, donde cada milisegundo cuenta.
+        Retorna una matriz float32 len(texts) x dimensión.
+        """
+        texts = list(texts)
+        vectors = self.get(texts)
+
+        # Textos pendientes sin repetir (la primera aparición de cada uno)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            if not hasattr(model, "encode"):
+                model = model()
+            encoded = model.encode(missing, batch_size=batch_size, convert_to_numpy=True,
+                                   normalize_embeddings=self.normalize)
+            self.put(missing, encoded, defer=defer)
+            by_text = dict(zip(missing, self._np.ascontiguousarray(encoded, dtype="float32")))
+            vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+
+        if not vectors:
+            return self._np.zeros((0, self.dimension or 0), dtype="float32")
+        return self._np.stack(vectors)
+
+    def stats(self):
+        """Aciertos, fallos, filas en disco, vectores en memoria y pendientes de escribir"""
+        with self._lock:
+            self._refresh()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+                "rows": len(self._rows),
+                "memory": len(self._memory),
+                "pending": len(self._pending)
+            }
+
+def open_embedding_cache(model_name, dimension=None, normalize=True):
+    """Retorna el caché de embeddings del modelo, o None si no se puede usar (directorio no escribible)"""
+    try:
+        return EmbeddingCache(model_name, dimension, normalize)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] caché de embeddings deshabilitado: {e}", file=sys.stderr)
+        return None
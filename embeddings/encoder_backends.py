@@ -0,0 +1,96 @@
+import os
+import sys
+import platform
+
+# ----------------------------
+# BACKENDS DEL CODIFICADOR DE CONSULTAS
+# ----------------------------
+# "torch":     SentenceTransformer en PyTorch de precisión completa (el que generó el índice).
+# "onnx":      el mismo modelo exportado a ONNX Runtime (fp32). Mismos vectores salvo
+#              redondeo; menos memoria y menor latencia en CPU.
+# "onnx-int8": ONNX con cuantización dinámica int8 de los pesos, para el conjunto de
+#              instrucciones del CPU (avx512_vnni, avx512, avx2 o arm64). Es el más rápido y
+#              ligero, pero sus vectores se apartan un poco de los del índice: compruebe la
+#              paridad de recall con benchmark_encoder.py antes de usarlo.
+#
+# Las exportaciones se hacen una sola vez y se guardan en embeddings/onnx/<modelo>/.
+# Requiere sentence-transformers >= 3.2 con el extra ONNX:
+#   pip install "sentence-transformers[onnx]"
+#
+# El backend se elige con la variable de entorno EMBEDDINGS_BACKEND (por defecto "torch").
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_DIR = os.path.join(current_dir, "onnx")
+
+def cpu_quantization_config():
+    """Configuración de cuantización int8 de ONNX Runtime adecuada para este CPU"""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            flags = f.read()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+def _export_dir(model_name):
+    """Directorio local con las exportaciones ONNX de un modelo"""
+    return os.path.join(ONNX_DIR, model_name.replace("/", "__"))
+
+def _quantized_file(config):
+    """Archivo (relativo al directorio de exportación) del modelo int8 para una configuración"""
+    return os.path.join("onnx", f"model_qint8_{config}.onnx")
+
+def export_onnx(model_name, quantize=False):
+    """
+    Exporta el modelo a ONNX (y, si se pide, su variante int8) en embeddings/onnx/<modelo>/
+    si aún no existe. Retorna (directorio, archivo ONNX relativo a él).
+    """
+    from sentence_transformers import SentenceTransformer
+
+    export_dir = _export_dir(model_name)
+    if not os.path.isfile(os.path.join(export_dir, "onnx", "model.onnx")):
+        print(f"[INFO] exportando {model_name} a ONNX en {export_dir}", file=sys.stderr)
+        SentenceTransformer(model_name, backend="onnx").save_pretrained(export_dir)
+
+    if not quantize:
+        return export_dir, os.path.join("onnx", "model.onnx")
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    config = cpu_quantization_config()
+    file_name = _quantized_file(config)
+    if not os.path.isfile(os.path.join(export_dir, file_name)):
+        print(f"[INFO] cuantizando {model_name} a int8 ({config})", file=sys.stderr)
+        model = SentenceTransformer(export_dir, backend="onnx", model_kwargs={"file_name": os.path.join("onnx", "model.onnx")})
+        export_dynamic_quantized_onnx_model(model, config, export_dir)
+    return export_dir, file_name
+
+def load_encoder(model_name, backend="torch"):
+    """
+    Carga el codificador de consultas con el backend indicado (ver el encabezado del módulo).
+    Todos los backends exponen la interfaz de SentenceTransformer (encode, dimensión).
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de embeddings desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+
+    export_dir, file_name = export_onnx(model_name, quantize=backend == "onnx-int8")
+    return SentenceTransformer(export_dir, backend="onnx",
+                               model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider"})
+
+def cache_model_name(model_name, backend):
+    """
+    Nombre del modelo para el caché de embeddings: los vectores int8 no deben mezclarse con
+    los de precisión completa.
+    """
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
@@ -0,0 +1,52 @@
+import re
+
+# ----------------------------
+# VARIOS VECTORES POR FAQ
+# ----------------------------
+# Cada item de la FAQ se indexa con varios vectores: su pregunta, sus paráfrasis (lista
+# opcional "parafrasis" del item en preguntas.json) y su respuesta partida en fragmentos.
+# Así una consulta que se parece más a la respuesta, o a otra forma de preguntar, también
+# encuentra el item.
+#
+# El id FAISS de cada vector codifica el id del registro del almacén de respuestas:
+#   id = (registro << ID_SHIFT) | número de vector
+# de modo que el registro se obtiene con un desplazamiento, sin tablas adicionales. La
+# búsqueda agrupa los vectores por registro y se queda con el mejor score de cada uno.
+# index_meta.json guarda "id_shift"; los índices sin él tienen un vector por registro.
+
+ID_SHIFT = 16               # Hasta 65536 vectores por item
+ANSWER_CHUNK_CHARS = 400    # Tamaño aproximado de los fragmentos de respuesta
+
+def chunk_text(text, max_chars=ANSWER_CHUNK_CHARS):
+    """Parte un texto en fragmentos de hasta ~max_chars caracteres sin cortar frases"""
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?;:])\s+|\n+", text or "") if s.strip()]
+    chunks, current = [], ""
+    for sentence in sentences:
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+def faq_vector_texts(record, multi_vector=True):
+    """
+    Lista de (tipo, texto) a indexar para un registro: la pregunta y, con varios vectores,
+    sus paráfrasis y los fragmentos de su respuesta. Los textos van en minúsculas, como
+    siempre se han indexado las preguntas.
+    """
+    texts = [("pregunta", record["pregunta"].strip().lower())]
+    if multi_vector:
+        texts += [("parafrasis", p.strip().lower()) for p in record.get("parafrasis", [])]
+        texts += [("respuesta", chunk.lower()) for chunk in chunk_text(record["respuesta"])]
+    return texts[:1 << ID_SHIFT]
+
+def vector_id(record_id, number):
+    """Id FAISS del vector 'number' del registro 'record_id'"""
+    return (record_id << ID_SHIFT) | number
+
+def record_id_of(vector_id, id_shift):
+    """Id del registro de un id FAISS (id_shift = 0 en índices de un vector por registro)"""
+    return vector_id >> id_shift
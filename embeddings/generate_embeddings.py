@@ -3,6 +3,12 @@ import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 import os
+import argparse
+from answer_store import faq_key, faq_record, write_answer_store
+from embedding_cache import open_embedding_cache
+from lexical_index import write_lexical_index
+from index_factory import choose_index_config, index_config_for_type, build_index, tune_search_params
+from faq_vectors import ID_SHIFT, faq_vector_texts, vector_id
 
 # =====================
 # CONFIGURACIONES
@@ -11,11 +17,31 @@ EMBEDDINGS_MODEL = "sentence-transformers/multi-qa-mpnet-base-dot-v1"
 JSON_FILE_PATH = "../preguntas.json"
 INDEX_FILE_PATH = "faiss_index.bin"
 MAPPING_FILE_PATH = "preguntas_lista.json"
+ANSWERS_FILE_PATH = "respuestas.bin"  # Respuestas alineadas con los ids del índice
+LEXICAL_FILE_PATH = "lexical_index.json"  # BM25 de la búsqueda híbrida (mismos ids)
+META_FILE_PATH = "index_meta.json"    # Contrato de embeddings que las consultas deben respetar
+NORMALIZE_EMBEDDINGS = True           # Vectores unitarios: el producto interno es el coseno
+
+# Tipo de índice: "auto" elige según el tamaño del corpus, el recall objetivo y la memoria
+parser = argparse.ArgumentParser(description="Genera el índice FAISS de la base de conocimiento")
+parser.add_argument("--index-type", choices=["auto", "flat", "hnsw", "ivfpq"], default="auto")
+parser.add_argument("--recall", type=float, default=0.95, help="Recall@3 objetivo frente a la búsqueda exacta")
+parser.add_argument("--max-memory-mb", type=int, default=2048, help="Memoria máxima del índice")
+# Por defecto cada item se indexa con su pregunta, sus paráfrasis y fragmentos de su respuesta
+parser.add_argument("--solo-preguntas", action="store_true", help="Un vector por item (solo la pregunta)")
+args = parser.parse_args()
 
 # =====================
 # CARGAR MODELO DE EMBEDDINGS
 # =====================
-model = SentenceTransformer(EMBEDDINGS_MODEL)
+# Solo se carga si alguna pregunta no está en el caché de embeddings
+model = None
+
+def load_model():
+    global model
+    if model is None:
+        model = SentenceTransformer(EMBEDDINGS_MODEL)
+    return model
 
 # =====================
 # CARGAR Y PROCESAR DATOS
@@ -26,9 +52,12 @@ with open(JSON_FILE_PATH, "r", encoding="utf-8") as file:
 # Extraer información relevante (preguntas, respuestas y metadatos)
 preguntas = []
 mapeo_preguntas = {}  # Para mapear índices a preguntas originales
+registros = []  # Un registro por item; su posición es el id en el almacén de respuestas
 
 preguntas_lista = preguntas_db["preguntas"]
 
+ocurrencias = {}  # Preguntas repetidas: cada repetición tiene su propia clave
+
 for idx, item in enumerate(preguntas_lista):
     pregunta = item["pregunta"].strip().lower()
     respuesta = item["respuesta"].strip()
@@ -41,29 +70,92 @@ for idx, item in enumerate(preguntas_lista):
         "metadata": metadata,
         "url": item.get("url", ""),
     }
+    # Con clave y hash de contenido para que actualizar_indice.py detecte los cambios
+    registros.append(faq_record(idx, item, faq_key(item["pregunta"], ocurrencias.get(pregunta, 0))))
+    ocurrencias[pregunta] = ocurrencias.get(pregunta, 0) + 1
+
+# =====================
+# TEXTOS A INDEXAR
+# =====================
+# Varios vectores por item (ver faq_vectors.py): el id de cada uno codifica el id del registro
+multi_vector = not args.solo_preguntas
+textos = []
+ids = []
+
+for registro_id, registro in enumerate(registros):
+    vectores = faq_vector_texts(registro, multi_vector)
+    if multi_vector:
+        registro["vectores"] = [tipo for tipo, _ in vectores]
+    for numero, (_, texto) in enumerate(vectores):
+        textos.append(texto)
+        ids.append(vector_id(registro_id, numero))
 
 # =====================
 # CREAR EMBEDDINGS
 # =====================
-print("🔄 Generando embeddings...")
-embeddings = model.encode(preguntas, convert_to_numpy=True, normalize_embeddings=True)
+# Los textos sin cambios desde la última generación salen del caché sin pasar por el modelo
+print(f"🔄 Generando embeddings ({len(textos)} textos de {len(registros)} preguntas)...")
+cache = open_embedding_cache(EMBEDDINGS_MODEL, normalize=NORMALIZE_EMBEDDINGS)
+if cache is not None:
+    embeddings = cache.encode(load_model, textos)
+    print(f"   Caché de embeddings: {cache.stats()}")
+else:
+    embeddings = load_model().encode(textos, convert_to_numpy=True, normalize_embeddings=NORMALIZE_EMBEDDINGS)
 
 # =====================
 # CREAR ÍNDICE FAISS
 # =====================
 dimension = embeddings.shape[1]
-index = faiss.IndexFlatIP(dimension)  # IP: Producto Interno (mejor para embeddings normalizados)
-index.add(embeddings)
+embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+if args.index_type == "auto":
+    index_config = choose_index_config(len(embeddings), dimension, args.recall, args.max_memory_mb)
+else:
+    index_config = index_config_for_type(args.index_type, len(embeddings), dimension, args.recall)
+
+print(f"🔄 Construyendo índice {index_config['type']} ({len(embeddings)} vectores)...")
+vector_ids = ids if multi_vector else None
+index = build_index(embeddings, index_config, vector_ids)  # IP: Producto Interno (embeddings normalizados)
+index_config = tune_search_params(index, embeddings, index_config, args.recall, ids=vector_ids)
+print(f"   Parámetros: {index_config}")
 
 # =====================
 # GUARDAR ÍNDICE Y LISTA DE PREGUNTAS
 # =====================
-faiss.write_index(index, INDEX_FILE_PATH)
+# Reemplazo atómico: un servidor en marcha puede estar leyendo el índice anterior
+faiss.write_index(index, INDEX_FILE_PATH + ".part")
+os.replace(INDEX_FILE_PATH + ".part", INDEX_FILE_PATH)
 
 # Guardar solo la lista de preguntas para asegurar compatibilidad con FAISS
 with open(MAPPING_FILE_PATH, "w", encoding="utf-8") as f:
     json.dump(preguntas, f, ensure_ascii=False, indent=4)
 
+# Guardar el almacén de respuestas (el id de FAISS, desplazado id_shift bits, es la posición del registro)
+write_answer_store(registros, ANSWERS_FILE_PATH)
+
+# Índice léxico BM25 sobre los mismos registros (siglas y nombres propios)
+write_lexical_index(registros, LEXICAL_FILE_PATH)
+
+# La versión sigue la numeración de actualizar_indice.py para que nunca retroceda
+version = 0
+if os.path.isfile(META_FILE_PATH):
+    with open(META_FILE_PATH, "r", encoding="utf-8") as f:
+        version = json.load(f).get("version", 0)
+
+# Guardar el contrato del índice (buscar_pregunta.py lo aplica a cada consulta). Se publica
+# después del índice y de forma atómica: al cambiar, los servidores en marcha lo recargan
+with open(META_FILE_PATH + ".part", "w", encoding="utf-8") as f:
+    json.dump({
+        "model": EMBEDDINGS_MODEL,
+        "normalize": NORMALIZE_EMBEDDINGS,
+        "metric": "inner_product",
+        "dimension": int(dimension),
+        "count": int(index.ntotal),
+        "index": index_config,
+        "id_shift": ID_SHIFT if multi_vector else 0,
+        "version": version + 1,
+    }, f, ensure_ascii=False, indent=4)
+os.replace(META_FILE_PATH + ".part", META_FILE_PATH)
+
 # Guardar el mapeo completo en otro archivo
 with open("preguntas_mapeo.json", "w", encoding="utf-8") as f:
     json.dump(mapeo_preguntas, f, ensure_ascii=False, indent=4)
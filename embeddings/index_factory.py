@@ -0,0 +1,223 @@
+import math
+
+# =====================
+# TIPOS DE ÍNDICE FAISS
+# =====================
+# "flat":  búsqueda exacta (IndexFlatIP). Adecuado para la FAQ y corpus pequeños.
+# "hnsw":  grafo HNSW sobre vectores completos. Muy rápido con recall alto; memoria
+#          ~ n * (4 * d + 8 * M) bytes.
+# "ivfpq": listas invertidas con cuantización de producto. Memoria ~ n * m bytes; pensado
+#          para corpus de millones de vectores (documentos normativos, manuales). Con
+#          recall objetivo alto se reordenan los candidatos con vectores SQ8 (+ n * d bytes),
+#          porque las distancias PQ por sí solas no pasan de ~85% de recall.
+#
+# Los parámetros elegidos se guardan en index_meta.json ("index") y buscar_pregunta.py
+# aplica los de tiempo de búsqueda (efSearch / nprobe) al cargar el índice.
+
+FLAT_MAX_VECTORS = 10_000           # Hasta aquí la búsqueda exacta sigue siendo submilisegundo
+IVF_MIN_TRAINING_PER_LIST = 39      # Mínimo de vectores por lista que recomienda FAISS para entrenar
+
+# efSearch (HNSW) y fracción de listas visitadas (IVF) de partida para cada recall objetivo
+HNSW_EF_SEARCH = {0.9: 32, 0.95: 64, 0.99: 128}
+IVF_NPROBE_FRACTION = {0.9: 1 / 64, 0.95: 1 / 32, 0.99: 1 / 16}
+
+def _for_recall(table, recall_target):
+    """Valor de la tabla para el menor recall tabulado que cubre el objetivo"""
+    for recall in sorted(table):
+        if recall_target <= recall:
+            return table[recall]
+    return table[max(table)]
+
+def hnsw_memory_bytes(n, d, M=32):
+    """Memoria aproximada de un IndexHNSWFlat"""
+    return n * (4 * d + 8 * M)
+
+def _hnsw_config(recall_target):
+    """Parámetros HNSW para el recall objetivo"""
+    return {"type": "hnsw", "M": 32, "efConstruction": 200, "efSearch": _for_recall(HNSW_EF_SEARCH, recall_target)}
+
+def _ivfpq_config(n, d, recall_target):
+    """Parámetros IVF-PQ para n vectores de dimensión d"""
+    # ~4·sqrt(n) listas (potencia de 2) con datos suficientes para entrenar
+    nlist = 2 ** int(round(math.log2(4 * math.sqrt(n))))
+    while nlist > 1 and n < nlist * IVF_MIN_TRAINING_PER_LIST:
+        nlist //= 2
+
+    # Subvectores de 8-16 dimensiones: m debe dividir d
+    m = next((m for m in (96, 64, 48, 32, 24, 16, 8) if d % m == 0 and d // m <= 16), 8)
+    nprobe = max(1, int(nlist * _for_recall(IVF_NPROBE_FRACTION, recall_target)))
+    config = {"type": "ivfpq", "nlist": nlist, "m": m, "nbits": 8, "nprobe": nprobe}
+    if recall_target > 0.9:
+        config.update({"refine": "sq8", "k_factor": 8})
+    return config
+
+def index_config_for_type(index_type, n, d, recall_target=0.95):
+    """Parámetros por defecto de un tipo de índice concreto (para forzarlo desde la línea de comandos)"""
+    if index_type == "flat":
+        return {"type": "flat"}
+    if index_type == "hnsw":
+        return _hnsw_config(recall_target)
+    if index_type == "ivfpq":
+        return _ivfpq_config(n, d, recall_target)
+    raise ValueError(f"Tipo de índice desconocido: {index_type}")
+
+def choose_index_config(n, d, recall_target=0.95, max_memory_mb=2048):
+    """
+    Elige el tipo de índice y sus parámetros según el tamaño del corpus, el recall
+    objetivo y la memoria disponible.
+    Retorna un dict {'type', ...parámetros} listo para build_index y para index_meta.json.
+    """
+    if n <= FLAT_MAX_VECTORS:
+        return index_config_for_type("flat", n, d, recall_target)
+    if hnsw_memory_bytes(n, d) <= max_memory_mb * 1024 * 1024:
+        return index_config_for_type("hnsw", n, d, recall_target)
+    return index_config_for_type("ivfpq", n, d, recall_target)
+
+def build_index(embeddings, config, ids=None):
+    """
+    Construye (y entrena si hace falta) el índice descrito por 'config' con producto interno
+    y añade los vectores en orden: el id de cada vector es su posición o, si se pasa 'ids',
+    el id correspondiente (el índice queda envuelto en un IndexIDMap2).
+    """
+    import numpy as np
+    import faiss
+
+    d = embeddings.shape[1]
+    index_type = config["type"]
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(d)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, config["M"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = config["efConstruction"]
+    elif index_type == "ivfpq":
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFPQ(quantizer, d, config["nlist"], config["m"], config["nbits"], faiss.METRIC_INNER_PRODUCT)
+        if config.get("refine") == "sq8":
+            refine = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            index = faiss.IndexRefine(index, refine)
+        index.train(embeddings)
+    else:
+        raise ValueError(f"Tipo de índice desconocido: {index_type}")
+
+    if ids is None:
+        index.add(embeddings)
+    else:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype="int64"))
+    apply_search_params(index, config)
+    return index
+
+def _unwrap_id_map(index):
+    """Índice interno de un IndexIDMap (o el propio índice si no lo es)"""
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def apply_search_params(index, config):
+    """Aplica los parámetros de tiempo de búsqueda guardados en la configuración del índice"""
+    import faiss
+
+    index_type = config.get("type", "flat")
+    if index_type == "hnsw":
+        _unwrap_id_map(index).hnsw.efSearch = config["efSearch"]
+    elif index_type == "ivfpq":
+        faiss.extract_index_ivf(index).nprobe = config["nprobe"]
+        if config.get("refine"):
+            _unwrap_id_map(index).k_factor = config["k_factor"]
+
+def to_id_index(index):
+    """
+    Retorna un índice equivalente que acepta add_with_ids/remove_ids (para actualizaciones
+    incrementales). Los índices IVF ya guardan ids propios; el resto se envuelve en un
+    IndexIDMap2 con los mismos vectores, cuyo id es su posición actual.
+
+    Un IVF-PQ con refinamiento SQ8 (IndexRefine) sin IndexIDMap no se puede convertir: su
+    índice de refinamiento es posicional y no admite ids ni eliminaciones, y reconstruirlo
+    recodificaría todo el índice. Lanza ValueError; hay que regenerarlo con
+    generate_embeddings.py.
+    """
+    import numpy as np
+    import faiss
+
+    # Se retorna el objeto original: el de downcast_index no es dueño del índice nativo
+    downcast = faiss.downcast_index(index)
+    if isinstance(downcast, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexIVF)):
+        return index
+    if isinstance(downcast, faiss.IndexRefine):
+        raise ValueError(
+            "El índice IVF-PQ con refinamiento no admite actualizaciones incrementales; "
+            "regenérelo con generate_embeddings.py"
+        )
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    inner = faiss.clone_index(index)
+    inner.reset()
+    wrapped = faiss.IndexIDMap2(inner)
+    wrapped.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    return wrapped
+
+def measure_recall(index, embeddings, k=3, sample=1000, noise=0.05, seed=0, ids=None):
+    """
+    Recall@k del índice frente a la búsqueda exacta, con consultas que son vectores del
+    corpus ligeramente perturbados (y normalizados). 'ids' son los ids con que se añadieron
+    los vectores, si no son sus posiciones.
+    """
+    import numpy as np
+    import faiss
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), size=min(sample, len(embeddings)), replace=False)
+    queries = embeddings[rows] + noise * rng.standard_normal((len(rows), embeddings.shape[1])).astype("float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    faiss.normalize_L2(queries)
+
+    exact = faiss.IndexFlatIP(embeddings.shape[1])
+    if ids is None:
+        exact.add(embeddings)
+    else:
+        exact = faiss.IndexIDMap(exact)
+        exact.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype="int64"))
+    _, truth = exact.search(queries, k)
+    _, found = index.search(queries, k)
+
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+def tune_search_params(index, embeddings, config, recall_target=0.95, k=3, ids=None):
+    """
+    Sube efSearch (HNSW), o nprobe y k_factor (IVF-PQ), hasta alcanzar el recall objetivo o
+    el máximo razonable; en cada paso duplica el parámetro que más mejora el recall.
+    Retorna la configuración con los valores finales y el recall medido.
+    """
+    config = dict(config)
+    if config["type"] == "flat":
+        config["recall"] = 1.0
+        return config
+
+    if config["type"] == "hnsw":
+        limits = {"efSearch": 1024}
+    else:
+        limits = {"nprobe": config["nlist"]}
+        if config.get("refine"):
+            limits["k_factor"] = 64
+
+    apply_search_params(index, config)
+    recall = measure_recall(index, embeddings, k=k, ids=ids)
+    while recall < recall_target:
+        candidates = []
+        for knob, limit in limits.items():
+            if config[knob] < limit:
+                trial = dict(config, **{knob: min(limit, config[knob] * 2)})
+                apply_search_params(index, trial)
+                candidates.append((measure_recall(index, embeddings, k=k, ids=ids), trial))
+        if not candidates:
+            break
+        recall, config = max(candidates, key=lambda candidate: candidate[0])
+
+    apply_search_params(index, config)
+    config["recall"] = round(recall, 4)
+    return config
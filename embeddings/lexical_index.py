@@ -0,0 +1,123 @@
+import os
+import re
+import json
+import math
+import unicodedata
+
+# ----------------------------
+# ÍNDICE LÉXICO BM25
+# ----------------------------
+# Complementa a FAISS con coincidencia exacta de términos: nombres propios, siglas y
+# números ("eKogui", "PQRSDF", "ANDJE", teléfonos) que los embeddings densos representan mal.
+#
+# Se construye al indexar (generate_embeddings.py, actualizar_indice.py) sobre los mismos
+# registros del almacén de respuestas, con los mismos ids que FAISS. Cada documento es la
+# pregunta (con doble peso) más la respuesta. Los pesos BM25 de cada término en cada
+# documento se precalculan, así que una consulta solo suma valores de las listas de sus
+# términos.
+#
+# Formato (JSON):
+#   {"version", "k1", "b", "documents", "idf": {término: idf},
+#    "postings": {término: [[id, peso BM25], ...]}}
+
+VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+QUESTION_WEIGHT = 2
+DISTINCTIVE_IDF = 1.0   # Términos en menos de ~1/3 de los documentos: los que identifican un tema
+
+STOPWORDS = frozenset("""
+a al algo como con cual cuales cuando de del desde donde el ella en entre es esa ese esta
+este esto hay la las le les lo los mas me mi mis muy no nos o para pero por puedo que quien
+se si sin sobre su sus te tengo tiene un una uno unos unas y ya yo hola buenos buenas dias
+tardes noches favor gracias quiero quisiera saber necesito
+""".split())
+
+def tokenize(text):
+    """
+    Términos de un texto: minúsculas sin tildes, alfanuméricos, sin palabras vacías y sin la
+    's' final de los plurales (trámites → tramite)
+    """
+    text = unicodedata.normalize("NFKD", text or "").lower()
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    terms = []
+    for term in re.findall(r"[a-z0-9]+", text):
+        if term in STOPWORDS:
+            continue
+        if len(term) > 3 and term.endswith("s") and not term.isdigit():
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+def build_lexical_index(records):
+    """
+    Construye el índice BM25 de los registros del almacén de respuestas (la posición es el
+    id; los registros None, eliminados, se omiten)
+    """
+    documents = {}
+    for record_id, record in enumerate(records):
+        if record is not None:
+            documents[record_id] = tokenize(record["pregunta"]) * QUESTION_WEIGHT + tokenize(record["respuesta"])
+
+    count = len(documents)
+    average_length = sum(len(terms) for terms in documents.values()) / count if count else 0
+
+    frequencies = {}
+    for record_id, terms in documents.items():
+        for term in set(terms):
+            frequencies.setdefault(term, []).append((record_id, terms.count(term)))
+
+    idf, postings = {}, {}
+    for term, entries in frequencies.items():
+        idf[term] = math.log((count - len(entries) + 0.5) / (len(entries) + 0.5) + 1)
+        postings[term] = []
+        for record_id, tf in entries:
+            norm = 1 - BM25_B + BM25_B * len(documents[record_id]) / average_length
+            postings[term].append([record_id, round(idf[term] * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm), 5)])
+
+    return {"version": VERSION, "k1": BM25_K1, "b": BM25_B, "documents": count, "idf": idf, "postings": postings}
+
+def write_lexical_index(records, path):
+    """Construye el índice léxico y lo escribe de forma atómica"""
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(build_lexical_index(records), f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+class LexicalIndex:
+    """Búsqueda BM25 de solo lectura sobre un índice léxico"""
+
+    def __init__(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != VERSION:
+            raise ValueError(f"{path} no es un índice léxico válido (versión {data.get('version')})")
+        self.idf = data["idf"]
+        self.postings = data["postings"]
+        self.documents = data["documents"]
+
+    def __len__(self):
+        return len(self.postings)
+
+    def search(self, query, k=10):
+        """
+        Retorna hasta k tuplas (id, score BM25, cobertura) ordenadas por score. La cobertura
+        (0-1) es la fracción del idf de los términos distintivos de la consulta (conocidos y con
+        idf >= DISTINCTIVE_IDF) que aparece en el documento; es 0 si la consulta no tiene
+        ninguno ("teléfono de la agencia" no identifica ningún documento por "agencia").
+        """
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self.postings]
+        if not terms:
+            return []
+
+        distinctive = {term for term in terms if self.idf[term] >= DISTINCTIVE_IDF}
+        total_idf = sum(self.idf[term] for term in distinctive)
+        scores, matched = {}, {}
+        for term in terms:
+            for record_id, weight in self.postings[term]:
+                scores[record_id] = scores.get(record_id, 0) + weight
+                if term in distinctive:
+                    matched[record_id] = matched.get(record_id, 0) + self.idf[term]
+
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [(record_id, scores[record_id], matched.get(record_id, 0) / total_idf if total_idf else 0.0) for record_id in best]
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Caché de audio precalculado para las respuestas de la base de conocimiento.
+
+Cada respuesta de preguntas.json se sintetiza una sola vez y se guarda en el caché TTS
+compartido (tts_cache.py), con la misma clave que usa la síntesis en tiempo de turno (hash
+del texto, la voz, el modelo, el formato y las instrucciones): cualquier cambio en ellos
+invalida la entrada, y el pipeline normal reutiliza esos audios y viceversa. Un manifiesto
+relaciona cada item de la FAQ con el texto sintetizado y su clave; si la respuesta del item
+cambia (p. ej. con actualizar_indice.py), el audio antiguo deja de servirse.
+
+Uso: faq_audio_cache.py [--force]
+
+Si el item tiene "respuesta_telefonica" se sintetiza esa versión (pensada para
+telefonía) en lugar de "respuesta".
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import traceback
+
+import config
+from tts_cache import get_tts_cache, tts_cache_key
+
+logger = logging.getLogger(__name__)
+
+PREGUNTAS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "preguntas.json")
+MANIFEST_NAME = "manifest.json"
+
+_manifest = None
+_manifest_mtime = None
+_manifest_lock = threading.Lock()
+
+def faq_audio_key(text):
+    """
+    Clave del audio de un texto en el caché TTS, con la voz, el modelo, las instrucciones y
+    el formato actuales (la misma que calcula audio_processor.text_to_speech)
+
+    Args:
+        text (str): Texto a sintetizar
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal (ver tts_cache.tts_cache_key)
+    """
+    return tts_cache_key(text, config.OPENAI_TTS_VOICE, config.OPENAI_TTS_MODEL, config.TTS_INSTRUCTIONS, config.OPENAI_TTS_FORMAT)
+
+def faq_audio_text(item):
+    """
+    Retorna el texto que se sintetiza para un item de la FAQ
+
+    Args:
+        item (dict): Item de preguntas.json o resultado de la búsqueda FAQ (ver knowledge_base.search_faq)
+
+    Returns:
+        str: Versión telefónica si existe, o la respuesta completa
+    """
+    return (item.get("respuesta_telefonica") or item.get("respuesta") or item["answer"]).strip()
+
+def _load_manifest(cache_dir):
+    """
+    Carga el manifiesto del caché (se relee solo si cambió en disco)
+
+    Args:
+        cache_dir (str): Directorio del caché
+
+    Returns:
+        dict: Entradas por índice de la FAQ (como texto)
+    """
+    global _manifest, _manifest_mtime
+
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    try:
+        mtime = os.path.getmtime(manifest_path)
+    except OSError:
+        return {}
+
+    with _manifest_lock:
+        if _manifest is None or mtime != _manifest_mtime:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                _manifest = json.load(f).get("entries", {})
+            _manifest_mtime = mtime
+            logger.info(f"Manifiesto de audio FAQ cargado: {len(_manifest)} entradas")
+        return _manifest
+
+def get_cached_faq_audio(faq_index, pregunta=None, text=None, cache_dir=None):
+    """
+    Busca el audio precalculado de un item de la FAQ
+
+    Args:
+        faq_index (int): Posición del item en preguntas.json
+        pregunta (str, optional): Pregunta del item, para descartar entradas de un índice FAQ anterior
+        text (str, optional): Texto actual del item (ver faq_audio_text), para descartar el audio
+            de una respuesta que se editó después de generar el caché
+        cache_dir (str, optional): Directorio del manifiesto; por defecto el de config
+
+    Returns:
+        dict or None: {'path', 'text', 'key'} o None si no hay audio válido para la configuración actual
+    """
+    cache_dir = cache_dir or config.FAQ_AUDIO_CACHE_DIR
+    try:
+        tts_cache = get_tts_cache()
+        if tts_cache is None:
+            return None
+        entry = _load_manifest(cache_dir).get(str(faq_index))
+        if not entry:
+            return None
+        if pregunta is not None and entry["pregunta"].strip().lower() != pregunta.strip().lower():
+            logger.warning(f"Audio FAQ {faq_index} corresponde a otra pregunta; reconstruya el caché")
+            return None
+        if text is not None and entry["text"] != text.strip():
+            logger.warning(f"Audio FAQ {faq_index} es de una respuesta anterior; reconstruya el caché")
+            return None
+
+        # Un cambio de voz, modelo o instrucciones cambia la clave y deja la entrada obsoleta;
+        # el caché TTS puede además haberla expulsado
+        key = faq_audio_key(entry["text"])
+        if key != entry["key"]:
+            return None
+        path = tts_cache.get_path(key, config.OPENAI_TTS_FORMAT)
+        if path is None:
+            return None
+
+        return {"path": path, "text": entry["text"], "key": key}
+    except Exception as e:
+        logger.error(f"Error consultando el caché de audio FAQ: {e}")
+        return None
+
+def build_faq_audio_cache(api_key, cache_dir=None, preguntas_path=PREGUNTAS_PATH, force=False):
+    """
+    Sintetiza el audio de todas las respuestas de la FAQ que aún no estén en el caché
+
+    Args:
+        api_key (str): Clave API de OpenAI
+        cache_dir (str, optional): Directorio del manifiesto; por defecto el de config
+        preguntas_path (str): Ruta de preguntas.json
+        force (bool): Volver a sintetizar aunque el audio ya exista
+
+    Returns:
+        dict: Conteo de entradas 'cached', 'synthesized', 'skipped' y 'failed'
+
+    Raises:
+        RuntimeError: Si el caché TTS está deshabilitado (los audios se guardan en él)
+    """
+    # Importación diferida: la consulta del caché en tiempo de turno no necesita el cliente TTS
+    from audio_processor import text_to_speech
+
+    tts_cache = get_tts_cache()
+    if tts_cache is None:
+        raise RuntimeError("El caché TTS está deshabilitado o no disponible (TTS_CACHE_ENABLED)")
+
+    cache_dir = cache_dir or config.FAQ_AUDIO_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with open(preguntas_path, "r", encoding="utf-8") as f:
+        items = json.load(f)["preguntas"]
+
+    stats = {"cached": 0, "synthesized": 0, "skipped": 0, "failed": 0}
+    entries = {}
+    for faq_index, item in enumerate(items):
+        text = faq_audio_text(item)
+        if len(text) > config.FAQ_AUDIO_MAX_CHARS and not item.get("respuesta_telefonica"):
+            logger.warning(f"FAQ {faq_index} omitida: respuesta de {len(text)} caracteres sin 'respuesta_telefonica'")
+            stats["skipped"] += 1
+            continue
+
+        key = faq_audio_key(text)
+        if not force and tts_cache.get_path(key, config.OPENAI_TTS_FORMAT):
+            stats["cached"] += 1
+        else:
+            # text_to_speech guarda el audio en el caché TTS con esta misma clave
+            audio = text_to_speech(text, api_key, instructions=config.TTS_INSTRUCTIONS, refresh=force)
+            if not audio or not tts_cache.get_path(key, config.OPENAI_TTS_FORMAT):
+                logger.error(f"No se pudo sintetizar la FAQ {faq_index}")
+                stats["failed"] += 1
+                continue
+            stats["synthesized"] += 1
+
+        entries[str(faq_index)] = {
+            "key": key,
+            "faq_index": faq_index,
+            "pregunta": item["pregunta"],
+            "text": text,
+            "voice": config.OPENAI_TTS_VOICE,
+            "model": config.OPENAI_TTS_MODEL,
+            "format": config.OPENAI_TTS_FORMAT
+        }
+
+    # Publicar el manifiesto de forma atómica para no afectar a los turnos en curso
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "entries": entries}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    logger.info(f"Caché de audio FAQ actualizado en {cache_dir}: {stats}")
+    return stats
+
+def main():
+    """Punto de entrada del generador del caché"""
+    if not config.setup_environment():
+        sys.exit(1)
+
+    try:
+        stats = build_faq_audio_cache(os.environ.get("OPENAI_API_KEY"), force="--force" in sys.argv[1:])
+    except Exception as e:
+        logger.critical(f"Error generando el caché de audio FAQ: {e}")
+        logger.critical(traceback.format_exc())
+        sys.exit(1)
+
+    print(json.dumps(stats))
+    sys.exit(1 if stats["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
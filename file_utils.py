@@ -1,8 +1,21 @@
 #!/usr/bin/env python3
 import os
+import re
+import time
+import shutil
 import logging
 import traceback
-from config import EXIT_FLAG_PATH
+from config import (
+    EXIT_FLAG_PATH,
+    TRANSFER_FLAG_PATH,
+    RESPONSE_PATH,
+    CALLS_DIR,
+    CALL_INPUT_NAME,
+    CALL_RESPONSE_NAME,
+    CALL_EXIT_FLAG_NAME,
+    CALL_TRANSFER_FLAG_NAME,
+    CALL_SEGMENT_NAME
+)
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +43,10 @@ def save_audio_response(audio_data, output_path):
     """
     Guarda los datos de audio en un archivo y establece permisos
     
+    El audio se escribe primero en un archivo temporal del mismo directorio y luego se
+    renombra de forma atómica, de modo que quien reproduzca output_path nunca vea un
+    archivo a medio escribir.
+    
     Args:
         audio_data (bytes): Datos de audio
         output_path (str): Ruta donde guardar el archivo
@@ -37,46 +54,171 @@ def save_audio_response(audio_data, output_path):
     Returns:
         bool: True si se guardó correctamente, False en caso contrario
     """
+    tmp_path = f"{output_path}.part"
     try:
-        logger.debug(f"Guardando audio en {output_path}")
-        with open(output_path, "wb") as f:
+        logger.debug(f"Guardando audio en {tmp_path}")
+        with open(tmp_path, "wb") as f:
             f.write(audio_data)
+            f.flush()
+            os.fsync(f.fileno())
         
-        # Verificar el archivo guardado
-        if os.path.exists(output_path):
-            file_size = os.path.getsize(output_path)
-            logger.info(f"Respuesta generada y guardada en {output_path} (tamaño: {file_size} bytes)")
-            
-            # Establecer permisos adecuados
-            try:
-                os.chmod(output_path, 0o644)  # rw-r--r--
-                logger.info(f"Permisos establecidos en el archivo de audio")
-            except Exception as e:
-                logger.warning(f"No se pudieron establecer permisos: {e}")
-            
-            return True
-        else:
-            logger.error(f"El archivo no existe después de guardar")
-            return False
+        # Establecer permisos adecuados antes de publicar el archivo
+        try:
+            os.chmod(tmp_path, 0o644)  # rw-r--r--
+        except Exception as e:
+            logger.warning(f"No se pudieron establecer permisos: {e}")
+        
+        # Publicar el archivo completo
+        os.replace(tmp_path, output_path)
+        file_size = os.path.getsize(output_path)
+        logger.info(f"Respuesta generada y guardada en {output_path} (tamaño: {file_size} bytes)")
+        return True
             
     except Exception as e:
         logger.error(f"No se pudo guardar el archivo de audio de respuesta: {e}")
         logger.error(traceback.format_exc())
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except OSError:
+            pass
         return False
 
-def create_exit_flag():
+def create_exit_flag(flag_path=EXIT_FLAG_PATH):
     """
     Crea un archivo de bandera para indicar que se debe finalizar la conversación
     
+    Args:
+        flag_path (str): Ruta de la bandera (por defecto la global)
+        
     Returns:
         bool: True si se creó correctamente, False en caso contrario
     """
     try:
-        with open(EXIT_FLAG_PATH, "w") as f:
+        with open(flag_path, "w") as f:
             f.write("1")
-        logger.info(f"Bandera de salida creada en {EXIT_FLAG_PATH}")
+        logger.info(f"Bandera de salida creada en {flag_path}")
         return True
     except Exception as e:
         logger.error(f"Error creando bandera de salida: {e}")
         logger.error(traceback.format_exc())
-        return False
\ No newline at end of file
+        return False
+
+def create_transfer_flag(flag_path=TRANSFER_FLAG_PATH):
+    """
+    Crea un archivo de bandera para indicar que se debe transferir a un agente humano
+    
+    Args:
+        flag_path (str): Ruta de la bandera (por defecto la global)
+        
+    Returns:
+        bool: True si se creó correctamente, False en caso contrario
+    """
+    try:
+        with open(flag_path, "w") as f:
+            f.write("1")
+        logger.info(f"Bandera de transferencia creada en {flag_path}")
+        return True
+    except Exception as e:
+        logger.error(f"Error creando bandera de transferencia: {e}")
+        logger.error(traceback.format_exc())
+        return False
+
+def get_call_paths(call_id=None):
+    """
+    Obtiene las rutas de trabajo de una llamada
+    
+    Cada llamada usa su propio subdirectorio de CALLS_DIR (nombrado con el UUID de FreeSWITCH)
+    para que dos llamantes simultáneos no se pisen el audio ni las banderas. Sin call_id se
+    retornan las rutas globales heredadas.
+    
+    Args:
+        call_id (str, optional): UUID de la llamada
+        
+    Returns:
+        dict: Rutas 'dir', 'input_wav', 'response_wav', 'exit_flag', 'transfer_flag' y
+            'segment_pattern' (plantilla de los segmentos del modo streaming, usar .format(n))
+        
+    Raises:
+        ValueError: Si el call_id contiene caracteres no permitidos
+    """
+    if not call_id:
+        return {
+            "dir": os.path.dirname(RESPONSE_PATH),
+            "input_wav": os.path.join(os.path.dirname(RESPONSE_PATH), CALL_INPUT_NAME),
+            "response_wav": RESPONSE_PATH,
+            "exit_flag": EXIT_FLAG_PATH,
+            "transfer_flag": TRANSFER_FLAG_PATH,
+            "segment_pattern": os.path.join(os.path.dirname(RESPONSE_PATH), CALL_SEGMENT_NAME)
+        }
+    
+    # El UUID llega desde el dialplan: evitar rutas fuera de CALLS_DIR
+    if not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", call_id):
+        raise ValueError(f"Identificador de llamada inválido: {call_id!r}")
+    
+    call_dir = os.path.join(CALLS_DIR, call_id)
+    return {
+        "dir": call_dir,
+        "input_wav": os.path.join(call_dir, CALL_INPUT_NAME),
+        "response_wav": os.path.join(call_dir, CALL_RESPONSE_NAME),
+        "exit_flag": os.path.join(call_dir, CALL_EXIT_FLAG_NAME),
+        "transfer_flag": os.path.join(call_dir, CALL_TRANSFER_FLAG_NAME),
+        "segment_pattern": os.path.join(call_dir, CALL_SEGMENT_NAME)
+    }
+
+def create_call_dir(call_id):
+    """
+    Crea el directorio de trabajo de una llamada
+    
+    Args:
+        call_id (str): UUID de la llamada
+        
+    Returns:
+        dict: Rutas de trabajo de la llamada (ver get_call_paths)
+    """
+    paths = get_call_paths(call_id)
+    os.makedirs(paths["dir"], exist_ok=True)
+    return paths
+
+def cleanup_stale_call_dirs(max_age):
+    """
+    Elimina los directorios de llamada sin actividad reciente (llamadas colgadas sin limpieza)
+    
+    Args:
+        max_age (float): Antigüedad máxima en segundos desde la última modificación
+        
+    Returns:
+        int: Número de directorios eliminados
+    """
+    if not os.path.isdir(CALLS_DIR):
+        return 0
+    
+    removed = 0
+    now = time.time()
+    for entry in os.scandir(CALLS_DIR):
+        try:
+            if entry.is_dir() and now - entry.stat().st_mtime > max_age:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except OSError as e:
+            logger.warning(f"No se pudo revisar {entry.path}: {e}")
+    
+    if removed:
+        logger.info(f"Eliminados {removed} directorios de llamada huérfanos")
+    return removed
+
+def remove_audio_segments(segment_pattern):
+    """
+    Elimina los segmentos de audio de un turno anterior
+    
+    Args:
+        segment_pattern (str): Plantilla de ruta de los segmentos (ver get_call_paths)
+        
+    Returns:
+        int: Número de segmentos eliminados
+    """
+    removed = 0
+    while os.path.exists(segment_pattern.format(removed)):
+        os.remove(segment_pattern.format(removed))
+        removed += 1
+    return removed
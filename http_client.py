@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    OPENAI_API_BASE_URL,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_POOL_SIZE,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX
+)
+
+logger = logging.getLogger(__name__)
+
+# Códigos HTTP que indican un fallo transitorio y justifican reintentar
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Retorna la sesión HTTP compartida del proceso (creándola la primera vez)
+
+    La sesión mantiene un pool de conexiones keep-alive hacia la API, de modo que
+    STT, LLM y TTS reutilizan la misma conexión TLS en lugar de abrir una por petición.
+
+    Returns:
+        requests.Session: Sesión compartida
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Los reintentos se gestionan en post() (con jitter), no en el adaptador
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+                logger.info(f"Sesión HTTP compartida creada (pool de {HTTP_POOL_SIZE} conexiones)")
+
+    return _session
+
+def _backoff_delay(attempt, retry_after=None):
+    """
+    Calcula la espera antes de un reintento (backoff exponencial con jitter completo)
+
+    Args:
+        attempt (int): Número de reintento, empezando en 0
+        retry_after (str, optional): Valor de la cabecera Retry-After de la respuesta
+
+    Returns:
+        float: Segundos de espera
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+def post(url, timeout=None, max_retries=HTTP_MAX_RETRIES, **kwargs):
+    """
+    Envía un POST por la sesión compartida con reintentos acotados
+
+    Reintenta ante errores de conexión, timeouts y respuestas 429/5xx. Los cuerpos
+    multipart deben pasarse como bytes (no como archivos abiertos) para poder reenviarse.
+
+    Args:
+        url (str): URL del endpoint
+        timeout (float or tuple, optional): Timeout de requests; por defecto (conexión, lectura) de config
+        max_retries (int): Reintentos máximos tras el primer intento
+        **kwargs: Argumentos adicionales para requests (headers, json, files, stream...)
+
+    Returns:
+        requests.Response: Respuesta (la última recibida si se agotaron los reintentos)
+
+    Raises:
+        requests.exceptions.RequestException: Si todos los intentos fallaron sin respuesta
+    """
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+    session = get_session()
+    attempt = 0
+    while True:
+        try:
+            response = session.post(url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= max_retries:
+                raise
+            delay = _backoff_delay(attempt)
+            logger.warning(f"Error de red en {url} ({e}); reintento {attempt + 1}/{max_retries} en {delay:.2f}s")
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                return response
+            delay = _backoff_delay(attempt, response.headers.get("Retry-After"))
+            logger.warning(f"Respuesta {response.status_code} de {url}; reintento {attempt + 1}/{max_retries} en {delay:.2f}s")
+            response.close()
+
+        time.sleep(delay)
+        attempt += 1
+
+def warm_up(api_key):
+    """
+    Abre por adelantado la conexión TLS con la API para que el primer turno no pague el handshake
+
+    Args:
+        api_key (str): Clave API de OpenAI
+
+    Returns:
+        bool: True si la conexión quedó establecida
+    """
+    try:
+        start_time = time.time()
+        response = get_session().get(
+            f"{OPENAI_API_BASE_URL}/models",
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        )
+        response.close()
+        logger.info(f"Conexión HTTP precalentada en {time.time() - start_time:.2f} segundos (estado {response.status_code})")
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"No se pudo precalentar la conexión HTTP: {e}")
+        return False
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Cliente ligero del daemon IVR para el dialplan de FreeSWITCH.
+
+Uso: ivr_client.py [--stream] <ruta_wav> [uuid_llamada]
+     ivr_client.py --ping
+     ivr_client.py --reload   (carga el índice FAISS recién actualizado)
+
+Imprime la ruta de la respuesta cuando está lista. Con --stream imprime la ruta de
+cada segmento de audio en cuanto se publica, una por línea.
+
+Solo usa la biblioteca estándar para arrancar en milisegundos. Si el daemon no
+está disponible, ejecuta asistente_virtual.py directamente como respaldo.
+"""
+import os
+import sys
+import json
+import socket
+
+# Sin importar config.py (y sus dependencias): mismos valores por defecto que allí
+DAEMON_SOCKET_PATH = os.environ.get("IVR_DAEMON_SOCKET", "/home/sysadmin/encuesta_IVR/tmp/ivr_daemon.sock")
+DAEMON_TURN_TIMEOUT = float(os.environ.get("IVR_TURN_TIMEOUT", 25))
+
+def iter_job_messages(job, timeout=DAEMON_TURN_TIMEOUT):
+    """
+    Envía un trabajo al daemon y genera sus mensajes hasta la respuesta final
+
+    Args:
+        job (dict): Trabajo a enviar
+        timeout (float): Segundos máximos de espera por cada mensaje
+
+    Yields:
+        dict: Mensajes del daemon; el último contiene la clave "ok"
+
+    Raises:
+        OSError: Si el daemon no está disponible o no responde a tiempo
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(DAEMON_SOCKET_PATH)
+        sock.sendall((json.dumps(job) + "\n").encode("utf-8"))
+
+        with sock.makefile("r", encoding="utf-8") as stream:
+            for line in stream:
+                message = json.loads(line)
+                yield message
+                if "ok" in message:
+                    return
+
+    raise ConnectionError("El daemon cerró la conexión sin responder")
+
+def send_job(job, timeout=DAEMON_TURN_TIMEOUT):
+    """
+    Envía un trabajo al daemon y espera su respuesta final
+
+    Args:
+        job (dict): Trabajo a enviar
+        timeout (float): Segundos máximos de espera
+
+    Returns:
+        dict: Respuesta final del daemon
+
+    Raises:
+        OSError: Si el daemon no está disponible o no responde a tiempo
+    """
+    for message in iter_job_messages(job, timeout):
+        result = message
+    return result
+
+def run_fallback(audio_path, call_id=None):
+    """
+    Ejecuta el asistente en un proceso propio (camino lento, sin daemon)
+
+    El dialplan lee de la salida estándar del cliente las rutas de audio a reproducir, así
+    que el asistente la hereda apuntando a stderr: sus mensajes de depuración (p. ej. los
+    resultados de la búsqueda FAISS) nunca llegan al dialplan como rutas. Sin ninguna línea
+    en stdout, el dialplan reproduce la respuesta en su ruta por defecto, que solo aparece
+    completa (renombrado atómico).
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "asistente_virtual.py")
+    args = [sys.executable, script, audio_path]
+    if call_id:
+        args.append(call_id)
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    os.execv(sys.executable, args)
+
+def main():
+    if len(sys.argv) < 2:
+        print("Uso: ivr_client.py [--stream] <ruta_wav> [uuid_llamada] | --ping | --reload", file=sys.stderr)
+        sys.exit(2)
+
+    if sys.argv[1] in ("--ping", "--reload"):
+        try:
+            print(json.dumps(send_job({"cmd": sys.argv[1][2:]}, timeout=2 if sys.argv[1] == "--ping" else 60)))
+        except (OSError, ValueError) as e:
+            print(f"Daemon no disponible: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    args = sys.argv[1:]
+    stream = args[0] == "--stream"
+    if stream:
+        args = args[1:]
+    if not args:
+        print("Uso: ivr_client.py [--stream] <ruta_wav> [uuid_llamada]", file=sys.stderr)
+        sys.exit(2)
+
+    audio_path = args[0]
+    call_id = args[1] if len(args) > 1 else None
+    job = {"cmd": "turn", "audio_path": audio_path, "stream": stream}
+    if call_id:
+        job["call_id"] = call_id
+
+    result = {}
+    try:
+        for message in iter_job_messages(job):
+            if "segment" in message:
+                # El dialplan reproduce cada segmento en cuanto lee su línea
+                print(message["segment"], flush=True)
+            else:
+                result = message
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("Daemon no disponible, usando asistente_virtual.py", file=sys.stderr)
+        run_fallback(audio_path, call_id)
+        return
+    except (OSError, ValueError) as e:
+        print(f"Error comunicando con el daemon: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not result.get("ok"):
+        print(f"Turno fallido: {result.get('error', 'sin detalle')}", file=sys.stderr)
+        sys.exit(1)
+
+    if not stream:
+        print(result.get("response_path", ""))
+
+if __name__ == "__main__":
+    main()
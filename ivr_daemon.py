@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Daemon de procesamiento de turnos del IVR.
+
+Mantiene cargados el modelo de embeddings, el índice FAISS y las sesiones HTTP,
+y atiende trabajos de turno por un socket Unix para que cada turno no tenga que
+arrancar un intérprete de Python nuevo.
+
+Protocolo (una línea JSON por petición y una línea JSON por respuesta):
+    {"cmd": "turn", "audio_path": "/ruta/pregunta.wav", "call_id": "<uuid FreeSWITCH>"}
+    {"cmd": "ping"}
+    {"cmd": "reload"}    (carga el índice FAISS publicado por embeddings/actualizar_indice.py)
+
+Con "stream": true en un turno, el daemon envía además una línea {"segment": "<ruta>"}
+por cada segmento de audio publicado, antes de la línea final con "ok".
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import http_client
+from knowledge_base import initialize_faiss, faiss_health, reload_faiss
+from tts_cache import get_tts_cache
+from semantic_cache import get_semantic_cache
+from asistente_virtual import process_turn_async, wait_background_tasks
+from file_utils import create_required_directories, create_call_dir, get_call_paths, cleanup_stale_call_dirs
+
+logger = logging.getLogger(__name__)
+
+class TurnDaemon:
+    """Servidor asyncio que atiende todas las llamadas concurrentes en un único bucle de eventos"""
+
+    def __init__(self, socket_path=config.DAEMON_SOCKET_PATH, workers=config.DAEMON_WORKERS):
+        """
+        Inicializa el daemon
+
+        Args:
+            socket_path (str): Ruta del socket Unix donde escuchar
+            workers (int): Hilos del pool compartido para las llamadas bloqueantes (HTTP, FAISS, disco)
+        """
+        self.socket_path = socket_path
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="turno")
+        self.api_key = os.environ.get("OPENAI_API_KEY")
+        self.faiss_available = False
+        self.started_at = time.time()
+        self.turns_served = 0
+        self.turns_active = 0
+
+    def warm_up(self):
+        """Carga una única vez los recursos costosos (FAISS, modelo de embeddings y conexión HTTP)"""
+        start_time = time.time()
+        self.faiss_available = initialize_faiss(warm_up=True)
+        if self.api_key:
+            http_client.warm_up(self.api_key)
+        logger.info(f"Daemon precalentado en {time.time() - start_time:.2f} segundos (FAISS: {self.faiss_available})")
+
+    def status(self):
+        """
+        Retorna el estado actual del daemon
+
+        Returns:
+            dict: Estado del daemon
+        """
+        tts_cache = get_tts_cache()
+        semantic_cache = get_semantic_cache()
+        return {
+            "ok": True,
+            "uptime": round(time.time() - self.started_at, 1),
+            "faiss": self.faiss_available,
+            "faiss_health": faiss_health(),
+            "turns_served": self.turns_served,
+            "turns_active": self.turns_active,
+            "tts_cache": tts_cache.stats() if tts_cache is not None else None,
+            "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None
+        }
+
+    async def reload_index(self):
+        """
+        Carga la última versión publicada del índice FAISS sin reiniciar el daemon
+
+        Returns:
+            dict: Resultado y estado del buscador
+        """
+        try:
+            reloaded = await asyncio.to_thread(reload_faiss)
+        except Exception as e:
+            logger.error(f"Error recargando el índice FAISS: {e}")
+            return {"ok": False, "error": str(e)}
+        logger.info(f"Índice FAISS recargado: {reloaded}")
+        return {"ok": True, "reloaded": reloaded, "faiss_health": faiss_health()}
+
+    async def run_turn(self, job, emit):
+        """
+        Ejecuta un turno con el pipeline asíncrono
+
+        Args:
+            job (dict): Trabajo recibido por el socket
+            emit (callable): Envía una línea JSON al cliente (usado para los segmentos en streaming)
+
+        Returns:
+            dict: Resultado del turno
+        """
+        audio_path = job.get("audio_path")
+        if not audio_path:
+            return {"ok": False, "error": "Falta audio_path"}
+        if not self.api_key:
+            return {"ok": False, "error": "OPENAI_API_KEY no configurada"}
+
+        call_id = job.get("call_id")
+        try:
+            paths = create_call_dir(call_id) if call_id else get_call_paths()
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+
+        loop = asyncio.get_running_loop()
+        stream = bool(job.get("stream"))
+
+        # Los segmentos se publican desde hilos del pool: reenviarlos por el bucle de eventos
+        def on_segment(path):
+            loop.call_soon_threadsafe(emit, {"segment": path})
+
+        start_time = time.time()
+        self.turns_active += 1
+        try:
+            outputs = await process_turn_async(
+                audio_path, self.api_key, call_id, stream=stream, on_segment=on_segment
+            )
+        finally:
+            self.turns_active -= 1
+            self.turns_served += 1
+
+        ok = outputs is not None
+        elapsed = time.time() - start_time
+        logger.info(f"Turno {audio_path} procesado en {elapsed:.2f} segundos (ok={ok})")
+        result = {"ok": ok, "response_path": paths["response_wav"], "elapsed": round(elapsed, 3)}
+        if stream and ok:
+            result["segments"] = outputs
+        return result
+
+    async def cleanup_loop(self):
+        """Borra periódicamente los directorios de llamadas que terminaron sin limpieza"""
+        while True:
+            await asyncio.sleep(config.DAEMON_CLEANUP_INTERVAL)
+            try:
+                await asyncio.to_thread(cleanup_stale_call_dirs, config.CALL_DIR_MAX_AGE)
+            except Exception as e:
+                logger.error(f"Error en la limpieza de directorios de llamada: {e}")
+
+    async def handle_client(self, reader, writer):
+        """Atiende una conexión: lee una petición JSON y responde con una línea JSON"""
+        def emit(message):
+            writer.write((json.dumps(message) + "\n").encode("utf-8"))
+
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError:
+                result = {"ok": False, "error": "Petición JSON inválida"}
+            else:
+                cmd = job.get("cmd", "turn")
+                if cmd == "ping":
+                    result = self.status()
+                elif cmd == "reload":
+                    result = await self.reload_index()
+                elif cmd == "turn":
+                    result = await self.run_turn(job, emit)
+                else:
+                    result = {"ok": False, "error": f"Comando desconocido: {cmd}"}
+
+            emit(result)
+            await writer.drain()
+
+        except Exception as e:
+            logger.error(f"Error atendiendo cliente del daemon: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """Escucha en el socket Unix hasta que se detenga el proceso"""
+        # Todas las llamadas bloqueantes (asyncio.to_thread) comparten el pool del daemon
+        asyncio.get_running_loop().set_default_executor(self.executor)
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        # FreeSWITCH corre con otro usuario: el socket debe ser accesible
+        os.chmod(self.socket_path, 0o666)
+        logger.info(f"Daemon IVR escuchando en {self.socket_path}")
+
+        cleanup_task = asyncio.create_task(self.cleanup_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            cleanup_task.cancel()
+            await wait_background_tasks()
+
+def main():
+    """Punto de entrada del daemon"""
+    create_required_directories(config.BASE_DIR)
+    os.makedirs(os.path.join(config.BASE_DIR, "metrics"), exist_ok=True)
+    os.makedirs(os.path.join(config.BASE_DIR, "transcripts"), exist_ok=True)
+
+    if not config.setup_environment():
+        sys.exit(1)
+
+    daemon = TurnDaemon()
+    daemon.warm_up()
+
+    try:
+        asyncio.run(daemon.serve())
+    except KeyboardInterrupt:
+        logger.info("Daemon detenido por el usuario")
+    finally:
+        daemon.executor.shutdown(wait=False)
+        if os.path.exists(daemon.socket_path):
+            os.remove(daemon.socket_path)
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,204 @@
 #!/usr/bin/env python3
+import asyncio
 import logging
 import time
 import traceback
 import sys
+from config import FAQ_SEARCH_THRESHOLD
 
 logger = logging.getLogger(__name__)
 
 # Variable global para indicar disponibilidad de FAISS
 FAISS_AVAILABLE = False
 
-def initialize_faiss():
-    """Intenta inicializar el módulo FAISS"""
+def initialize_faiss(warm_up=False):
+    """
+    Intenta inicializar el módulo FAISS
+    
+    Por defecto solo comprueba que las dependencias y archivos existan: el modelo y el
+    índice se cargan en la primera búsqueda. Los procesos de larga duración (el daemon)
+    deben pedir warm_up para que el primer turno no pague la carga.
+    
+    Args:
+        warm_up (bool): Cargar ya el modelo y el índice
+        
+    Returns:
+        bool: True si FAISS está disponible
+    """
     global FAISS_AVAILABLE
     
     try:
-        logger.info("Intentando importar numpy")
-        import numpy as np
-        logger.info("NumPy importado correctamente")
+        logger.info("Intentando importar embeddings.buscar_pregunta")
+        from embeddings import buscar_pregunta
+        
+        if not buscar_pregunta.dependencies_available():
+            logger.error("Faltan dependencias o archivos de FAISS (numpy, faiss, sentence_transformers o el índice)")
+            FAISS_AVAILABLE = False
+            return False
         
-        logger.info("Intentando importar faiss_search desde embeddings.buscar_pregunta")
-        from embeddings.buscar_pregunta import faiss_search
-        logger.info("Módulo FAISS importado correctamente")
+        if warm_up:
+            elapsed = buscar_pregunta.warm_up()
+            logger.info(f"Modelo de embeddings e índice FAISS cargados en {elapsed:.2f} segundos: {buscar_pregunta.health()}")
         
         FAISS_AVAILABLE = True
         return True
         
-    except ImportError as e:
-        logger.error(f"Error importando módulos para FAISS: {e}")
+    except Exception as e:
+        logger.error(f"Error inicializando FAISS: {e}")
         logger.error(traceback.format_exc())
         FAISS_AVAILABLE = False
         return False
 
-def get_faq_answer(question):
+def faiss_health():
     """
-    Busca respuestas en la base de conocimiento usando FAISS
+    Retorna el estado del buscador FAISS (ver embeddings.buscar_pregunta.health)
+    
+    Returns:
+        dict or None: Estado, o None si FAISS no está disponible
+    """
+    if not FAISS_AVAILABLE:
+        return None
+    from embeddings.buscar_pregunta import health
+    return health()
+
+def reload_faiss():
+    """
+    Carga ya la última versión publicada del índice FAISS (ver embeddings/actualizar_indice.py),
+    sin esperar a la comprobación periódica de la siguiente búsqueda
+    
+    Returns:
+        bool: True si se cargó una versión nueva
+    """
+    if not FAISS_AVAILABLE:
+        return False
+    from embeddings.buscar_pregunta import reload_index
+    return reload_index(force=True)
+
+def faq_index_version():
+    """
+    Versión del índice FAISS cargada (cambia cuando se recarga una publicación nueva)
+    
+    Returns:
+        tuple or None: Identificador de la versión, o None si FAISS no está disponible o no se cargó
+    """
+    if not FAISS_AVAILABLE:
+        return None
+    from embeddings.buscar_pregunta import loaded_version
+    return loaded_version()
+
+def embed_query(question):
+    """
+    Calcula el embedding de una consulta con el modelo de la base de conocimiento
     
     Args:
         question (str): La pregunta o consulta del usuario
         
     Returns:
-        str or None: Respuesta encontrada o None si no hay coincidencias
+        numpy.ndarray or None: Embedding (1 x dimensión) o None si FAISS no está disponible
     """
-    logger.debug(f"Llamada a get_faq_answer con pregunta: {question[:100]}...")
+    if not FAISS_AVAILABLE:
+        return None
+    
+    try:
+        from embeddings.buscar_pregunta import encode_query
+        return encode_query(question)
+    except Exception as e:
+        logger.error(f"Error calculando embedding de la consulta: {e}")
+        return None
+
+async def embed_query_async(question):
+    """
+    Variante asíncrona de embed_query (se ejecuta en el pool de hilos del bucle de eventos)
+    
+    Args:
+        question (str): La pregunta o consulta del usuario
+        
+    Returns:
+        numpy.ndarray or None: Embedding o None si FAISS no está disponible
+    """
+    return await asyncio.to_thread(embed_query, question)
+
+def search_faq(question, threshold=FAQ_SEARCH_THRESHOLD, embedding=None, filters=None):
+    """
+    Busca en la base de conocimiento y retorna los resultados con su puntuación
+    
+    Args:
+        question (str): La pregunta o consulta del usuario
+        threshold (float): Puntuación mínima de similitud
+        embedding (numpy.ndarray, optional): Embedding ya calculado de la pregunta (ver embed_query)
+        filters (dict, optional): Metadatos que deben cumplir los resultados ({clave: valor o lista de valores})
+        
+    Returns:
+        list: Dicts {'id', 'answer', 'score', 'pregunta', 'faq_index', 'metadata', 'match'} (y
+            'respuesta_telefonica' si el item la tiene) ordenados
+            por score, uno por FAQ (vacía si no hay coincidencias)
+    """
+    logger.debug(f"Llamada a search_faq con pregunta: {question[:100]}...")
 
     if not FAISS_AVAILABLE:
         logger.warning("FAISS no está disponible, omitiendo búsqueda de conocimiento")
-        return None
+        return []
     
     try:
         # Importamos aquí nuevamente para asegurar que esté disponible
-        from embeddings.buscar_pregunta import faiss_search
+        from embeddings.buscar_pregunta import faiss_search_with_scores
         
         logger.info(f"Buscando en FAISS: {question[:100]}...")
         start_time = time.time()
-        answer = faiss_search(question, threshold=0.5)
+        results = faiss_search_with_scores(question, threshold=threshold, embedding=embedding, filters=filters)
         search_time = time.time() - start_time
         logger.info(f"Búsqueda FAISS completada en {search_time:.2f} segundos")
 
-        if answer:
-            logger.info(f"Respuesta encontrada en FAISS: {str(answer)[:200]}...")
-            return answer
+        if results:
+            logger.info(f"Respuesta encontrada en FAISS (score={results[0]['score']:.3f}): {results[0]['answer'][:200]}...")
         else:
             logger.info("No se encontró respuesta en FAISS")
-            return None
+        return results
             
     except Exception as e:
         logger.error(f"Error en búsqueda FAISS: {e}")
         logger.error(traceback.format_exc())
-        return None
+        return []
+
+def get_faq_answer(question):
+    """
+    Busca respuestas en la base de conocimiento usando FAISS
+    
+    Args:
+        question (str): La pregunta o consulta del usuario
+        
+    Returns:
+        list or None: Respuestas encontradas o None si no hay coincidencias
+    """
+    results = search_faq(question)
+    return [r["answer"] for r in results] or None
+
+async def search_faq_async(question, threshold=FAQ_SEARCH_THRESHOLD, embedding=None, filters=None):
+    """
+    Variante asíncrona de search_faq (la búsqueda se ejecuta en el pool de hilos del bucle de eventos)
+    
+    Args:
+        question (str): La pregunta o consulta del usuario
+        threshold (float): Puntuación mínima de similitud
+        embedding (numpy.ndarray, optional): Embedding ya calculado de la pregunta
+        filters (dict, optional): Metadatos que deben cumplir los resultados
+        
+    Returns:
+        list: Resultados con su puntuación (ver search_faq)
+    """
+    return await asyncio.to_thread(search_faq, question, threshold, embedding, filters)
+
+async def get_faq_answer_async(question):
+    """
+    Variante asíncrona de get_faq_answer (la búsqueda se ejecuta en el pool de hilos del bucle de eventos)
+    
+    Args:
+        question (str): La pregunta o consulta del usuario
+        
+    Returns:
+        list or None: Respuestas encontradas o None si no hay coincidencias
+    """
+    return await asyncio.to_thread(get_faq_answer, question)
 
 def diagnostic_faiss_search(transcript):
     """
@@ -5,6 +5,7 @@ import time
 import datetime
 import logging
 import csv
+import traceback
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -44,7 +45,8 @@ class CallMetrics:
                 "stt": 0,
                 "llm": 0,
                 "tts": 0,
-                "faiss": 0
+                "faiss": 0,
+                "first_audio": 0
             },
             "tokens": {
                 "input": 0,
@@ -77,6 +79,16 @@ class CallMetrics:
             "faiss": {
                 "used": False,
                 "found_answer": False
+            },
+            "pipeline": {
+                "mode": "tool",
+                "llm_calls": 0,
+                "faq_top_score": 0
+            },
+            "semantic_cache": {
+                "hit": False,
+                "similarity": 0,
+                "latency_saved": 0
             }
         }
         
@@ -121,6 +133,17 @@ class CallMetrics:
         
         return duration
         
+    def record_step(self, step_name, duration):
+        """
+        Registra directamente la duración de un paso (para pasos que se solapan en modo streaming)
+        
+        Args:
+            step_name (str): Nombre del paso (stt, llm, tts, faiss, first_audio)
+            duration (float): Duración en segundos
+        """
+        self.metrics["duration"][step_name] = round(duration, 3)
+        logger.debug(f"Paso {step_name} registrado: {duration:.3f} segundos")
+        
     def set_transcript(self, user_input=None, assistant_response=None, faiss_response=None):
         """
         Establece las transcripciones de la conversación
@@ -128,7 +151,7 @@ class CallMetrics:
         Args:
             user_input (str, optional): Entrada transcrita del usuario
             assistant_response (str, optional): Respuesta del asistente
-            faiss_response (str, optional): Respuesta de FAISS
+            faiss_response (str or list, optional): Respuesta(s) de FAISS
         """
         if user_input is not None:
             self.transcripts["user_input"] = user_input
@@ -137,6 +160,9 @@ class CallMetrics:
             self.transcripts["assistant_response"] = assistant_response
             
         if faiss_response is not None:
+            # faiss_search retorna una lista de respuestas
+            if isinstance(faiss_response, list):
+                faiss_response = "\n".join(faiss_response)
             self.transcripts["faiss_response"] = faiss_response
             
     def set_token_usage(self, input_tokens, output_tokens):
@@ -218,6 +244,35 @@ class CallMetrics:
         self.metrics["faiss"]["used"] = used
         self.metrics["faiss"]["found_answer"] = found_answer
         
+    def set_pipeline_metrics(self, mode="tool", llm_calls=0, faq_top_score=0):
+        """
+        Establece cómo se resolvió el turno, para comparar la latencia entre modos
+        
+        Args:
+            mode (str): Modo del pipeline ('tool': el LLM decide si consultar FAISS;
+                'fast_path': FAISS se consulta antes y se hace una única llamada al LLM;
+                'cached_audio': se reproduce el audio precalculado de la FAQ;
+                'semantic_cache': se reutiliza la respuesta de una pregunta equivalente)
+            llm_calls (int): Número de llamadas al LLM realizadas
+            faq_top_score (float): Puntuación del mejor resultado de la búsqueda especulativa
+        """
+        self.metrics["pipeline"]["mode"] = mode
+        self.metrics["pipeline"]["llm_calls"] = llm_calls
+        self.metrics["pipeline"]["faq_top_score"] = round(faq_top_score, 4)
+        
+    def set_semantic_cache_metrics(self, hit=False, similarity=0, latency_saved=0):
+        """
+        Establece el resultado de la consulta al caché semántico de respuestas
+        
+        Args:
+            hit (bool): Si la respuesta salió del caché
+            similarity (float): Similitud con la pregunta cacheada
+            latency_saved (float): Segundos ahorrados frente al turno que generó la respuesta
+        """
+        self.metrics["semantic_cache"]["hit"] = hit
+        self.metrics["semantic_cache"]["similarity"] = round(similarity, 4)
+        self.metrics["semantic_cache"]["latency_saved"] = round(latency_saved, 3)
+        
     def calculate_costs(self):
         """
         Calcula los costos basados en el uso y los modelos utilizados
@@ -265,9 +320,9 @@ class CallMetrics:
         else:
             llm_cost = 0
             
-        # Calcular costo de TTS
+        # Calcular costo de TTS (el audio precalculado de la FAQ no se sintetiza en el turno)
         tts_model = self.metrics["models"]["tts"]
-        if tts_model in TTS_PRICE_PER_1K:
+        if tts_model in TTS_PRICE_PER_1K and self.metrics["pipeline"]["mode"] != "cached_audio":
             response_chars = len(self.transcripts["assistant_response"])
             tts_cost = (response_chars / 1000) * TTS_PRICE_PER_1K[tts_model]
         else:
@@ -352,6 +407,7 @@ class CallMetrics:
             "llm_duration": self.metrics["duration"]["llm"],
             "tts_duration": self.metrics["duration"]["tts"],
             "faiss_duration": self.metrics["duration"]["faiss"],
+            "first_audio_duration": self.metrics["duration"]["first_audio"],
             "input_tokens": self.metrics["tokens"]["input"],
             "output_tokens": self.metrics["tokens"]["output"],
             "total_tokens": self.metrics["tokens"]["total"],
@@ -372,8 +428,24 @@ class CallMetrics:
             "overall_success": self.metrics["status"]["overall_success"],
             "faiss_used": self.metrics["faiss"]["used"],
             "faiss_found_answer": self.metrics["faiss"]["found_answer"],
+            "pipeline_mode": self.metrics["pipeline"]["mode"],
+            "llm_calls": self.metrics["pipeline"]["llm_calls"],
+            "faq_top_score": self.metrics["pipeline"]["faq_top_score"],
+            "semantic_cache_hit": self.metrics["semantic_cache"]["hit"],
+            "semantic_cache_similarity": self.metrics["semantic_cache"]["similarity"],
+            "latency_saved": self.metrics["semantic_cache"]["latency_saved"],
         }
         
+        # Si el CSV existente tiene otras columnas (versión anterior), archivarlo y empezar uno nuevo
+        if file_exists:
+            with open(csv_file, "r", newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f), [])
+            if header != list(csv_data.keys()):
+                archived = os.path.join(self.metrics_dir, f"call_metrics_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+                os.replace(csv_file, archived)
+                logger.info(f"CSV de métricas con columnas anteriores archivado en {archived}")
+                file_exists = False
+        
         # Escribir al CSV
         with open(csv_file, "a", newline="", encoding="utf-8") as f:
             writer = csv.DictWriter(f, fieldnames=csv_data.keys())
@@ -387,6 +459,66 @@ class CallMetrics:
         logger.info(f"Métricas añadidas al CSV en {csv_file}")
 
 
+def summarize_by_mode(metrics_dir):
+    """
+    Resume la latencia media por modo del pipeline a partir del CSV acumulativo
+    
+    Args:
+        metrics_dir (str): Directorio de métricas (contiene call_metrics.csv)
+        
+    Returns:
+        dict: Por modo, número de turnos y medias de duración total, LLM y primer audio;
+            si hay turnos de ambos modos incluye 'llm_latency_saved' (segundos ahorrados por turno
+            en el camino rápido), por modo 'total_saved_vs_tool' frente al flujo con herramientas,
+            y la tasa de aciertos del caché semántico con su ahorro medio por acierto
+    """
+    csv_file = os.path.join(metrics_dir, "call_metrics.csv")
+    if not os.path.isfile(csv_file):
+        return {}
+    
+    totals = {}
+    semantic = {"turns": 0, "hits": 0, "saved": 0.0}
+    with open(csv_file, "r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            mode = row.get("pipeline_mode") or "tool"
+            if row.get("overall_success") != "True":
+                continue
+            if "semantic_cache_hit" in row:
+                semantic["turns"] += 1
+                if row["semantic_cache_hit"] == "True":
+                    semantic["hits"] += 1
+                    semantic["saved"] += float(row.get("latency_saved") or 0)
+            entry = totals.setdefault(mode, {"turns": 0, "total": 0.0, "llm": 0.0, "first_audio": 0.0})
+            entry["turns"] += 1
+            entry["total"] += float(row["total_duration"])
+            entry["llm"] += float(row["llm_duration"])
+            entry["first_audio"] += float(row.get("first_audio_duration") or 0)
+    
+    summary = {}
+    for mode, entry in totals.items():
+        summary[mode] = {
+            "turns": entry["turns"],
+            "avg_total": round(entry["total"] / entry["turns"], 3),
+            "avg_llm": round(entry["llm"] / entry["turns"], 3),
+            "avg_first_audio": round(entry["first_audio"] / entry["turns"], 3)
+        }
+    
+    if "tool" in summary and "fast_path" in summary:
+        summary["llm_latency_saved"] = round(summary["tool"]["avg_llm"] - summary["fast_path"]["avg_llm"], 3)
+    
+    # Ahorro de latencia total de cada modo frente al flujo con herramientas
+    if "tool" in summary:
+        for mode in list(totals):
+            if mode != "tool":
+                summary[mode]["total_saved_vs_tool"] = round(summary["tool"]["avg_total"] - summary[mode]["avg_total"], 3)
+    
+    if semantic["turns"]:
+        summary["semantic_cache_hit_rate"] = round(semantic["hits"] / semantic["turns"], 3)
+        summary["semantic_cache_avg_latency_saved"] = round(semantic["saved"] / semantic["hits"], 3) if semantic["hits"] else 0
+    
+    return summary
+
+
 # Utilidades para estimar duración de audio
 def estimate_audio_duration(file_path):
     """
@@ -417,4 +549,11 @@ def estimate_audio_duration(file_path):
             
     except Exception as e:
         logger.warning(f"No se pudo estimar la duración del audio {file_path}: {e}")
-        return 0
\ No newline at end of file
+        return 0
+
+if __name__ == "__main__":
+    # Resumen de latencia por modo del pipeline: python3 metrics_tracker.py [directorio_metricas]
+    import sys
+    from config import BASE_DIR
+    metrics_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(BASE_DIR, "metrics")
+    print(json.dumps(summarize_by_mode(metrics_dir), indent=2))
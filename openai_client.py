@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
+import asyncio
 import requests
 import json
+import http_client
 import logging
 import time
 import traceback
@@ -13,6 +15,43 @@ from config import (
 
 logger = logging.getLogger(__name__)
 
+# Herramientas disponibles para el LLM
+FAQ_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_faq_answer",
+        "description": "Busca respuestas en la base de conocimiento FAISS para preguntas sobre procedimientos, normativas o información institucional específica.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "question": {
+                    "type": "string",
+                    "description": "La pregunta o consulta del usuario para buscar en la base de conocimiento"
+                }
+            },
+            "required": ["question"]
+        }
+    }
+}
+
+TRANSFER_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "transfer_to_agent",
+        "description": "Solicita la transferencia a un agente humano cuando el usuario está insatisfecho o frustrado o el sistema no es capaz de responder la inquietud.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "motivo": {
+                    "type": "string",
+                    "description": "Razón por la cual se requiere la transferencia. Ej: frustración, pregunta no resuelta, solicitud directa."
+                }
+            },
+            "required": ["motivo"]
+        }
+    }
+}
+
 def create_openai_headers(api_key):
     """
     Crea las cabeceras para la API de OpenAI
@@ -60,42 +99,7 @@ def create_llm_payload(transcript, add_tools=True):
     
     # Añadir herramientas para consultar la base de conocimiento si se requiere
     if add_tools:
-        payload["tools"] = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_faq_answer",
-                    "description": "Busca respuestas en la base de conocimiento FAISS para preguntas sobre procedimientos, normativas o información institucional específica.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "question": {
-                                "type": "string",
-                                "description": "La pregunta o consulta del usuario para buscar en la base de conocimiento"
-                            }
-                        },
-                        "required": ["question"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "transfer_to_agent",
-                    "description": "Solicita la transferencia a un agente humano cuando el usuario está insatisfecho o frustrado o el sistema no es capaz de responder la inquietud.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "motivo": {
-                                "type": "string",
-                                "description": "Razón por la cual se requiere la transferencia. Ej: frustración, pregunta no resuelta, solicitud directa."
-                            }
-                        },
-                        "required": ["motivo"]
-                    }
-                }
-            }
-        ]
+        payload["tools"] = [FAQ_TOOL, TRANSFER_TOOL]
         
         # # Forzar el uso de la función si es apropiado
         # payload["tool_choice"] = {
@@ -108,6 +112,30 @@ def create_llm_payload(transcript, add_tools=True):
     
     return payload
 
+def create_grounded_llm_payload(transcript, faq_answers):
+    """
+    Crea el payload de una única llamada al LLM con las respuestas de la base de conocimiento ya incluidas
+    
+    Se usa en el camino rápido: cuando la búsqueda en FAISS sobre la transcripción es
+    suficientemente confiable no hace falta que el modelo pida get_faq_answer, lo que
+    ahorra una llamada completa. Solo se ofrece la herramienta de transferencia.
+    
+    Args:
+        transcript (str): Texto transcrito del audio
+        faq_answers (list): Respuestas recuperadas de la base de conocimiento
+        
+    Returns:
+        dict: Payload para la API
+    """
+    payload = create_llm_payload(transcript, add_tools=False)
+    payload["messages"].insert(1, {
+        "role": "system",
+        "content": "Resultado de get_faq_answer para la consulta del usuario (usa solo la información pertinente): "
+                   + json.dumps({"answer": faq_answers}, ensure_ascii=False)
+    })
+    payload["tools"] = [TRANSFER_TOOL]
+    return payload
+
 def create_second_llm_payload(transcript, tool_calls, tool_response):
     """
     Crea el payload para la segunda llamada a la API con resultados de la función
@@ -174,7 +202,7 @@ def send_openai_request(headers, payload, url=OPENAI_CHAT_URL):
         
         logger.info(f"Enviando solicitud a OpenAI: {url}")
         start_time = time.time()
-        response = requests.post(url, headers=headers, json=payload)
+        response = http_client.post(url, headers=headers, json=payload)
         request_time = time.time() - start_time
         logger.info(f"Solicitud a OpenAI completada en {request_time:.2f} segundos")
         
@@ -192,6 +220,20 @@ def send_openai_request(headers, payload, url=OPENAI_CHAT_URL):
         logger.error(traceback.format_exc())
         return None
 
+async def send_openai_request_async(headers, payload, url=OPENAI_CHAT_URL):
+    """
+    Variante asíncrona de send_openai_request (se ejecuta en el pool de hilos del bucle de eventos)
+    
+    Args:
+        headers (dict): Cabeceras HTTP
+        payload (dict): Payload de la solicitud
+        url (str): URL del endpoint de la API
+        
+    Returns:
+        dict or None: Respuesta JSON o None si hay error
+    """
+    return await asyncio.to_thread(send_openai_request, headers, payload, url)
+
 def process_llm_response(resp_json):
     """
     Procesa la respuesta del LLM para extraer información importante
@@ -230,9 +272,7 @@ def process_llm_response(resp_json):
                 logger.debug(f"Texto de respuesta: {assistant_response[:100]}...")
             
             # Verificar si el usuario está pidiendo finalizar
-            if any(word in assistant_response.lower() for word in EXIT_WORDS):
-                logger.info("Usuario solicitó finalizar la conversación")
-                should_exit = True
+            should_exit = is_exit_response(assistant_response)
         
     except Exception as e:
         logger.error(f"Error procesando respuesta de OpenAI: {e}")
@@ -240,6 +280,21 @@ def process_llm_response(resp_json):
     
     return tool_calls, assistant_response, should_exit
 
+def is_exit_response(assistant_response):
+    """
+    Indica si la respuesta del asistente cierra la conversación
+    
+    Args:
+        assistant_response (str): Texto de la respuesta del asistente
+        
+    Returns:
+        bool: True si contiene alguna palabra de despedida
+    """
+    if any(word in assistant_response.lower() for word in EXIT_WORDS):
+        logger.info("Usuario solicitó finalizar la conversación")
+        return True
+    return False
+
 def extract_function_args(tool_call):
     """
     Extrae los argumentos de una llamada a función
@@ -270,3 +325,128 @@ def extract_function_args(tool_call):
         logger.error(f"Error extrayendo argumentos de función: {e}")
         logger.error(traceback.format_exc())
         return None
+
+def stream_llm_response(headers, payload, state, url=OPENAI_CHAT_URL):
+    """
+    Envía una solicitud en modo streaming y genera los fragmentos de texto a medida que llegan
+    
+    Las llamadas a herramientas llegan fragmentadas en el stream; se acumulan en
+    state["tool_calls"] con el mismo formato que la respuesta no streaming.
+    
+    Args:
+        headers (dict): Cabeceras HTTP
+        payload (dict): Payload de la solicitud (se le añade "stream": True)
+        state (dict): Diccionario que se completa con 'content', 'tool_calls', 'usage' y 'ok'
+        url (str): URL del endpoint de la API
+        
+    Yields:
+        str: Fragmentos de texto de la respuesta del asistente
+    """
+    state.update({"content": "", "tool_calls": [], "usage": None, "ok": False})
+    payload = dict(payload, stream=True, stream_options={"include_usage": True})
+    
+    try:
+        logger.info(f"Enviando solicitud streaming a OpenAI: {url}")
+        start_time = time.time()
+        first_token_time = None
+        
+        with http_client.post(url, headers=headers, json=payload, stream=True) as response:
+            if response.status_code != 200:
+                logger.error(f"Error en la solicitud streaming a OpenAI: {response.status_code}")
+                logger.error(f"Texto de respuesta: {response.text[:500]}...")
+                return
+            
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    state["usage"] = chunk["usage"]
+                
+                for choice in chunk.get("choices", []):
+                    delta = choice.get("delta", {})
+                    
+                    # Acumular llamadas a herramientas por índice
+                    for tc_delta in delta.get("tool_calls") or []:
+                        index = tc_delta.get("index", 0)
+                        while len(state["tool_calls"]) <= index:
+                            state["tool_calls"].append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                        tool_call = state["tool_calls"][index]
+                        if tc_delta.get("id"):
+                            tool_call["id"] = tc_delta["id"]
+                        function = tc_delta.get("function", {})
+                        tool_call["function"]["name"] += function.get("name") or ""
+                        tool_call["function"]["arguments"] += function.get("arguments") or ""
+                    
+                    text = delta.get("content")
+                    if text:
+                        if first_token_time is None:
+                            first_token_time = time.time() - start_time
+                            logger.info(f"Primer token del LLM en {first_token_time:.2f} segundos")
+                        state["content"] += text
+                        yield text
+        
+        state["ok"] = True
+        logger.info(f"Solicitud streaming a OpenAI completada en {time.time() - start_time:.2f} segundos")
+        
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Error en la solicitud streaming a OpenAI: {e}")
+        logger.error(traceback.format_exc())
+
+# Abreviaturas tras las cuales un punto no cierra la frase
+SENTENCE_ABBREVIATIONS = {"no", "sr", "sra", "dr", "dra", "art", "núm", "num", "etc", "a.m", "p.m", "ej"}
+
+def iter_sentences(text_deltas, min_chars=25):
+    """
+    Agrupa fragmentos de texto en frases completas para enviarlas a TTS en cuanto se cierran
+    
+    Una frase termina en '.', '!', '?', ':' o salto de línea seguidos de espacio, salvo
+    cuando el punto pertenece a una abreviatura (No., a.m.); en números y direcciones
+    (7.5, gov.co) el punto no va seguido de espacio.
+    Las frases más cortas que min_chars se unen con la siguiente para no fragmentar la voz.
+    
+    Args:
+        text_deltas (iterable): Fragmentos de texto en orden
+        min_chars (int): Longitud mínima de una frase emitida
+        
+    Yields:
+        str: Frases completas
+    """
+    buffer = ""
+    for delta in text_deltas:
+        buffer += delta
+        search_from = 0
+        while True:
+            cut = _find_sentence_end(buffer, search_from)
+            if cut is None:
+                break
+            sentence = buffer[:cut].strip()
+            if len(sentence) < min_chars:
+                search_from = cut
+                continue
+            yield sentence
+            buffer = buffer[cut:]
+            search_from = 0
+    
+    if buffer.strip():
+        yield buffer.strip()
+
+def _find_sentence_end(text, start):
+    """Retorna la posición justo después del primer fin de frase desde start, o None"""
+    for pos in range(start, len(text) - 1):
+        char = text[pos]
+        if char == "\n":
+            return pos + 1
+        if char not in ".!?:" or not text[pos + 1].isspace():
+            continue
+        if char == ".":
+            words = text[:pos].split()
+            last_word = words[-1].lower() if words else ""
+            if last_word in SENTENCE_ABBREVIATIONS:
+                continue
+        return pos + 1
+    return None
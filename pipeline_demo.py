@@ -6,8 +6,10 @@ import pyaudio
 import wave
 import numpy as np
 import sys
+import threading
 from dotenv import load_dotenv
-from embeddings.buscar_pregunta import faiss_search
+from embeddings.buscar_pregunta import faiss_search, warm_up as warm_up_faiss
+from tts_cache import get_tts_cache, tts_cache_key
 from openai import OpenAI
 
 # Cargar variables de entorno
@@ -28,7 +30,12 @@ p = pyaudio.PyAudio()
 
 # Historial de conversación
 conversation_history = []
-CACHE_TTS = {}  # Cache para respuestas frecuentes
+
+# Parámetros de TTS (forman parte de la clave del caché compartido)
+TTS_MODEL = "tts-1"
+TTS_VOICE = "alloy"
+TTS_FORMAT = "pcm"
+TTS_SPEED = 1.2
 
 def record_audio(filename="temp_user.wav"):
     """Graba audio optimizado con buffer previo"""
@@ -138,29 +145,42 @@ def ask_gpt(contexto, user_input):
         print(f"Error en GPT: {str(e)}")
         return "Lo siento, hubo un error al generar la respuesta."
 
-def text_to_speech_stream(text):
-    """Generación de audio con caché y parámetros corregidos"""
-    if text in CACHE_TTS:
-        print("[CACHE] Respuesta usada")
-        return CACHE_TTS[text]
+def text_to_speech_stream(text, chunk_size=4096):
+    """Generación de audio con caché persistente; retorna un iterador de chunks PCM"""
+    cache = get_tts_cache()
+    cache_key = tts_cache_key(text, TTS_VOICE, TTS_MODEL, audio_format=TTS_FORMAT, speed=TTS_SPEED)
+    if cache is not None:
+        audio = cache.get(cache_key, TTS_FORMAT)
+        if audio:
+            print("[CACHE] Respuesta usada")
+            return (audio[i:i + chunk_size] for i in range(0, len(audio), chunk_size))
 
     start_time = time.time()
     try:
         response = client.audio.speech.create(
-            model="tts-1",
-            voice="alloy",
+            model=TTS_MODEL,
+            voice=TTS_VOICE,
             input=text,
-            response_format="pcm",
-            speed=1.2
+            response_format=TTS_FORMAT,
+            speed=TTS_SPEED
         )
-        CACHE_TTS[text] = response
         print(f"Tiempo TTS: {time.time() - start_time:.2f}s")
-        return response
     except Exception as e:
         print(f"Error TTS: {str(e)}")
         return None
 
-def play_streaming_audio(response):
+    def stream_and_store():
+        # Se guardan los bytes (no el objeto de respuesta) y solo si el audio llegó completo
+        chunks = []
+        for chunk in response.iter_bytes(chunk_size):
+            chunks.append(chunk)
+            yield chunk
+        if cache is not None:
+            cache.put(cache_key, b"".join(chunks), TTS_FORMAT, voice=TTS_VOICE, model=TTS_MODEL, text=text[:200])
+
+    return stream_and_store()
+
+def play_streaming_audio(chunks):
     """Reproducción mejorada con manejo de tiempo real"""
     p = pyaudio.PyAudio()
     stream = p.open(
@@ -170,13 +190,12 @@ def play_streaming_audio(response):
         output=True
     )
 
-    chunk_size = 4096
     max_duration = 30  # Segundos máximos de reproducción
     start_time = time.time()
     first_chunk = True
 
     try:
-        for chunk in response.iter_bytes(chunk_size):
+        for chunk in chunks:
             if time.time() - start_time > max_duration:
                 print("\nInterrupción por tiempo máximo")
                 break
@@ -198,6 +217,9 @@ def play_streaming_audio(response):
 def main_pipeline():
     print("\n=== PIPELINE OPTIMIZADO CON STREAMING EN TIEMPO REAL ===\n")
     
+    # Cargar modelo e índice FAISS mientras se graba la primera pregunta
+    threading.Thread(target=warm_up_faiss, daemon=True).start()
+    
     while True:
         ciclo_start = time.time()
         
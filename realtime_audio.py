@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+"""
+Etapas de audio de las sesiones Realtime (ver realtime_session.py).
+
+Subida (AudioUplink): el audio del usuario llega en fragmentos pequeños (1024 muestras,
+~43 ms a 24 kHz, en el micrófono local; 20 ms en telefonía). Enviar un evento por fragmento
+supone un base64, un json.dumps de un dict nuevo y un frame WebSocket cada vez. AudioUplink
+los agrupa en paquetes de config.REALTIME_UPLINK_PACKET_MS y serializa cada paquete
+copiando el base64 en una plantilla JSON ya formateada, sin pasar por json.dumps.
+
+Reproducción (AudioPlayout): el audio de las respuestas llega a ráfagas (el servidor lo
+genera más rápido que el tiempo real) y con jitter de red. Se guarda en un anillo de PCM
+(PcmRingBuffer) y una tarea o hilo propio lo entrega a la salida en tramas de
+config.REALTIME_PLAYOUT_FRAME_MS, de modo que una salida lenta nunca detiene la recepción
+de eventos. Cada respuesta empieza a sonar cuando hay un margen de audio acumulado (búfer
+de jitter) que crece tras cada corte por falta de audio y se reduce tras un rato sin
+cortes. Cuando el usuario interrumpe (barge-in), flush descarta al momento todo el audio
+pendiente: el consumidor no entrega ni una trama más de la respuesta interrumpida.
+"""
+import time
+import asyncio
+import inspect
+import binascii
+import threading
+from collections import deque
+
+import config
+
+APPEND_PREFIX = b'{"type":"input_audio_buffer.append","audio":"'
+APPEND_SUFFIX = b'"}'
+
+def base64_length(size):
+    """Longitud en bytes del base64 (con relleno) de size bytes"""
+    return (size + 2) // 3 * 4
+
+class AudioUplink:
+    """Agrupa el audio del usuario en paquetes de duración fija y los serializa como eventos append"""
+
+    def __init__(self, packet_ms=config.REALTIME_UPLINK_PACKET_MS, sample_rate=config.REALTIME_SAMPLE_RATE):
+        """
+        Inicializa la etapa de subida
+
+        Args:
+            packet_ms (int): Duración del audio de cada evento en milisegundos
+            sample_rate (int): Frecuencia de muestreo del PCM16 mono
+        """
+        # Número par de bytes: nunca se parte una muestra
+        self.packet_bytes = max(2, sample_rate * 2 * packet_ms // 1000 // 2 * 2)
+        self.packets = 0
+        self._pending = bytearray()
+        # Plantilla del evento de un paquete completo: prefijo, hueco para el base64 y sufijo
+        self._payload_start = len(APPEND_PREFIX)
+        self._payload_end = self._payload_start + base64_length(self.packet_bytes)
+        self._template = bytearray(APPEND_PREFIX + b"=" * base64_length(self.packet_bytes) + APPEND_SUFFIX)
+
+    def encode(self, pcm):
+        """
+        Serializa un evento input_audio_buffer.append con el audio dado
+
+        Args:
+            pcm (bytes-like): Audio PCM16 mono
+
+        Returns:
+            bytearray: JSON UTF-8 del evento (se envía como frame de texto)
+        """
+        payload = binascii.b2a_base64(pcm, newline=False)
+        self.packets += 1
+        if len(payload) == self._payload_end - self._payload_start:
+            event = bytearray(self._template)
+            event[self._payload_start:self._payload_end] = payload
+            return event
+        # Paquete final incompleto
+        return bytearray(APPEND_PREFIX + payload + APPEND_SUFFIX)
+
+    def push(self, pcm):
+        """
+        Añade audio y retorna los eventos de los paquetes que quedaron completos
+
+        Args:
+            pcm (bytes): Audio PCM16 mono de cualquier duración
+
+        Returns:
+            list: Eventos serializados (ver encode), posiblemente vacía
+        """
+        self._pending += pcm
+        if len(self._pending) < self.packet_bytes:
+            return []
+
+        view = memoryview(self._pending)
+        complete = len(self._pending) // self.packet_bytes * self.packet_bytes
+        events = [self.encode(view[start:start + self.packet_bytes]) for start in range(0, complete, self.packet_bytes)]
+        view.release()
+        del self._pending[:complete]
+        return events
+
+    def flush(self):
+        """
+        Retorna el evento del audio pendiente (paquete incompleto), o None si no hay
+
+        Returns:
+            bytearray or None: Evento serializado
+        """
+        if not self._pending:
+            return None
+        event = self.encode(self._pending)
+        self._pending.clear()
+        return event
+
+class PcmRingBuffer:
+    """
+    Anillo de bytes de capacidad fija para un productor y un consumidor. No usa bloqueos:
+    la posición de escritura solo la modifica el productor y la de lectura el consumidor.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._write_pos = 0     # Bytes escritos desde el inicio (productor)
+        self._read_pos = 0      # Bytes leídos desde el inicio (consumidor)
+
+    def available(self):
+        """Bytes pendientes de leer"""
+        return self._write_pos - self._read_pos
+
+    def free(self):
+        """Bytes que caben sin sobrescribir datos pendientes"""
+        return self.capacity - self.available()
+
+    def write(self, data):
+        """
+        Escribe todo lo que cabe de data (lado productor)
+
+        Returns:
+            int: Bytes escritos
+        """
+        size = min(len(data), self.free())
+        if size:
+            data = memoryview(data)
+            start = self._write_pos % self.capacity
+            first = min(size, self.capacity - start)
+            self._view[start:start + first] = data[:first]
+            if size > first:
+                self._view[:size - first] = data[first:size]
+            self._write_pos += size
+        return size
+
+    def read(self, size):
+        """
+        Lee hasta size bytes (lado consumidor)
+
+        Returns:
+            bytes: Datos leídos (menos de size si no hay más)
+        """
+        size = min(size, self.available())
+        start = self._read_pos % self.capacity
+        first = min(size, self.capacity - start)
+        data = bytes(self._view[start:start + first])
+        if size > first:
+            data += self._view[:size - first]
+        self._read_pos += size
+        return data
+
+    def skip(self, size):
+        """
+        Descarta hasta size bytes sin copiarlos (lado consumidor)
+
+        Returns:
+            int: Bytes descartados
+        """
+        size = min(size, self.available())
+        self._read_pos += size
+        return size
+
+class AudioPlayout:
+    """
+    Reproducción del audio de las respuestas de una sesión con búfer de jitter.
+
+    El productor (la recepción de eventos, en el bucle asyncio) llama a push y
+    end_of_response; el consumidor (un hilo propio si sink.write es bloqueante, o una
+    tarea asyncio si es una corrutina) entrega tramas a la salida. Si sink tiene el
+    atributo "latency" (segundos de audio que retiene el dispositivo), se descuenta del
+    audio reproducido y se espera antes de dar por terminada una respuesta.
+
+    flush (productor) pide descartar todo lo recibido hasta ese momento; lo ejecuta el
+    consumidor antes de la siguiente trama, que es quien lee del anillo.
+    """
+
+    def __init__(self, sink, sample_rate=config.REALTIME_SAMPLE_RATE, frame_ms=config.REALTIME_PLAYOUT_FRAME_MS,
+                 buffer_ms=config.REALTIME_PLAYOUT_BUFFER_MS, jitter_min_ms=config.REALTIME_JITTER_MIN_MS,
+                 jitter_max_ms=config.REALTIME_JITTER_MAX_MS, lead_ms=config.REALTIME_PLAYOUT_LEAD_MS):
+        """
+        Inicializa la reproducción (el consumidor arranca con start)
+
+        Args:
+            sink: Salida de audio con write(pcm) bloqueante o asíncrono
+            sample_rate (int): Frecuencia de muestreo del PCM16 mono
+            frame_ms (int): Duración de cada trama entregada a la salida
+            buffer_ms (int): Capacidad del anillo
+            jitter_min_ms (int): Margen inicial (y mínimo) antes de empezar a reproducir
+            jitter_max_ms (int): Margen máximo
+            lead_ms (int): Adelanto máximo sobre el tiempo real (salidas que no bloquean)
+        """
+        self.sink = sink
+        self.bytes_per_ms = sample_rate * 2 / 1000
+        self.frame_ms = frame_ms
+        self.frame_bytes = int(frame_ms * self.bytes_per_ms) // 2 * 2
+        self.jitter_min_ms = jitter_min_ms
+        self.jitter_max_ms = jitter_max_ms
+        self.target_ms = jitter_min_ms
+        self.lead_ms = lead_ms
+        self.threaded = not inspect.iscoroutinefunction(sink.write)
+
+        self._ring = PcmRingBuffer(int(buffer_ms * self.bytes_per_ms) // 2 * 2)
+        # Lo que no cabe en el anillo espera aquí; mientras haya algo, el productor no escribe
+        # en el anillo, así el orden se conserva sin bloqueos
+        self._spill = deque()
+
+        # Estado del productor
+        self._response_open = False
+        self._response_start = 0    # Bytes recibidos antes de la respuesta actual
+        self._bytes_pushed = 0
+        self._spill_in = 0
+        self._responses_ended = 0
+        self.overruns = 0           # Fragmentos que no cupieron en el anillo
+        # Interrupción pedida: se descarta hasta _flush_upto (bytes recibidos)
+        self._flush_upto = 0
+        self._flush_responses = 0
+        self._flush_requested_at = 0.0
+        self._flush_requests = 0
+
+        # Estado del consumidor
+        self._state = "idle"        # idle → buffering → playing
+        self._carry = b""           # Resto de un fragmento tomado de _spill
+        self._bytes_taken = 0       # Bytes sacados del anillo y de _spill
+        self._bytes_played = 0
+        self._bytes_dropped = 0     # Bytes descartados por interrupciones
+        self._flushes_done = 0
+        self.flush_ms_last = None   # Desde flush hasta el silencio en la salida (incluye su latencia)
+        self.flush_ms_max = 0
+        self._spill_out = 0
+        self._responses_drained = 0
+        self._drained_at = 0.0      # Hora a la que sonó de verdad el final (latencia de la salida)
+        self._clock = None          # Hora a la que debe sonar la siguiente trama
+        self._frames_since_underrun = 0
+        self.underruns = 0          # Cortes por falta de audio en mitad de una respuesta
+        self.late_frames = 0        # Tramas entregadas tarde (salida lenta)
+        self.frames_played = 0
+
+        self._running = False
+        self._loop = None
+        self._worker = None
+        self._wakeup = threading.Event() if self.threaded else asyncio.Event()
+        self._drain_event = None
+
+    # ---------------------------
+    # Productor
+    # ---------------------------
+    def push(self, pcm):
+        """Añade audio de la respuesta en curso"""
+        if not self._response_open:
+            self._response_open = True
+            self._response_start = self._bytes_pushed
+        self._bytes_pushed += len(pcm)
+
+        written = 0 if self._spill else self._ring.write(pcm)
+        if written < len(pcm):
+            self._spill.append(bytes(pcm[written:]))
+            self._spill_in += len(pcm) - written
+            self.overruns += 1
+        self._wakeup.set()
+
+    def end_of_response(self):
+        """Marca el final del audio de la respuesta en curso: lo que quede suena sin esperar margen"""
+        if not self._response_open:
+            return
+        self._response_open = False
+        self._responses_ended += 1
+        self._wakeup.set()
+
+    def flush(self):
+        """
+        Descarta todo el audio recibido que no ha sonado (el usuario interrumpió la respuesta)
+
+        Returns:
+            int: Milisegundos de la respuesta interrumpida que llegaron a sonar
+        """
+        played_ms = self.played_ms()
+        self.end_of_response()
+        self._flush_upto = self._bytes_pushed
+        self._flush_responses = self._responses_ended
+        self._flush_requested_at = time.monotonic()
+        # Último: el consumidor lee este contador antes que los campos anteriores
+        self._flush_requests += 1
+        self._wakeup.set()
+        return played_ms
+
+    def drained(self):
+        """True si ya sonó (o se descartó) todo el audio de las respuestas terminadas"""
+        return (self._responses_drained >= self._responses_ended and self._position() >= self._bytes_pushed
+                and time.monotonic() >= self._drained_at)
+
+    async def wait_drained(self, timeout=None):
+        """
+        Espera a que suene todo el audio recibido (incluida la latencia de la salida)
+
+        Args:
+            timeout (float, optional): Segundos máximos de espera
+
+        Returns:
+            bool: True si se vació, False si se agotó el timeout
+        """
+        if self._drain_event is None:
+            return self.drained()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.drained():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self._responses_drained >= self._responses_ended and self._position() >= self._bytes_pushed:
+                # Solo falta la latencia de la salida
+                await asyncio.sleep(max(0.0, self._drained_at - time.monotonic()))
+                continue
+            self._drain_event.clear()
+            try:
+                await asyncio.wait_for(self._drain_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return True
+
+    def played_ms(self):
+        """Milisegundos de la respuesta en curso (o la última) que ya sonaron"""
+        latency_ms = getattr(self.sink, "latency", 0) * 1000
+        return max(0, int((self._position() - self._response_start) / self.bytes_per_ms - latency_ms))
+
+    def buffered_ms(self):
+        """Milisegundos de audio pendientes de sonar"""
+        return int(self._buffered_bytes() / self.bytes_per_ms)
+
+    # ---------------------------
+    # Consumidor
+    # ---------------------------
+    def _buffered_bytes(self):
+        return self._ring.available() + self._spill_in - self._spill_out + len(self._carry)
+
+    def _position(self):
+        """Bytes recibidos que ya sonaron o se descartaron"""
+        return self._bytes_played + self._bytes_dropped
+
+    def _take(self, size):
+        """Lee hasta size bytes en orden: resto de _spill, anillo y _spill"""
+        self._bytes_taken += size
+        data = self._carry[:size]
+        self._carry = self._carry[size:]
+        if len(data) < size:
+            data += self._ring.read(size - len(data))
+        while len(data) < size and self._spill:
+            # El anillo está vacío y el productor no escribirá en él mientras quede algo aquí
+            chunk = self._spill.popleft()
+            self._spill_out += len(chunk)
+            need = size - len(data)
+            data += chunk[:need]
+            self._carry = chunk[need:]
+        self._bytes_taken -= size - len(data)
+        return data
+
+    def _discard(self, size):
+        """Descarta hasta size bytes en el mismo orden que _take, sin copiarlos"""
+        if size <= 0:
+            return
+        dropped = min(size, len(self._carry))
+        self._carry = self._carry[dropped:]
+        dropped += self._ring.skip(size - dropped)
+        while dropped < size and self._spill:
+            chunk = self._spill.popleft()
+            self._spill_out += len(chunk)
+            need = size - dropped
+            dropped += min(need, len(chunk))
+            self._carry = chunk[need:]
+        self._bytes_taken += dropped
+        self._bytes_dropped += dropped
+
+    def _apply_flush(self):
+        """
+        Ejecuta la interrupción pendiente, si la hay (lado consumidor)
+
+        Returns:
+            bool: True si se descartó audio
+        """
+        requests = self._flush_requests
+        if requests == self._flushes_done:
+            return False
+        self._flushes_done = requests
+        self._discard(self._flush_upto - self._bytes_taken)
+        self._state = "idle"
+        self._clock = None
+        self._drained_at = time.monotonic() + getattr(self.sink, "latency", 0)
+        self._responses_drained = max(self._responses_drained, self._flush_responses)
+        self.flush_ms_last = round((self._drained_at - self._flush_requested_at) * 1000, 1)
+        self.flush_ms_max = max(self.flush_ms_max, self.flush_ms_last)
+        self._signal_drained()
+        return True
+
+    def _next_frame(self):
+        """Siguiente trama a entregar a la salida, o None si ahora no hay que reproducir nada"""
+        self._apply_flush()
+        ended = self._responses_ended
+        ending = ended > self._responses_drained
+        buffered = self._buffered_bytes()
+
+        if buffered == 0:
+            if self._state == "playing" and not ending:
+                # Corte en mitad de una respuesta: más margen para la próxima vez
+                self.underruns += 1
+                self._frames_since_underrun = 0
+                self.target_ms = min(self.jitter_max_ms, self.target_ms + max(self.frame_ms, self.target_ms // 2))
+                self._state = "buffering"
+                self._clock = None
+            elif ending:
+                self._state = "idle"
+                self._clock = None
+                self._drained_at = time.monotonic() + getattr(self.sink, "latency", 0)
+                self._responses_drained = ended
+                self._signal_drained()
+            return None
+
+        if self._state != "playing":
+            if buffered < self.target_ms * self.bytes_per_ms and not ending:
+                self._state = "buffering"
+                return None
+            self._state = "playing"
+
+        self._frames_since_underrun += 1
+        if self._frames_since_underrun * self.frame_ms >= 5000 and self.target_ms > self.jitter_min_ms:
+            # 5 s sin cortes: se recupera latencia
+            self.target_ms = max(self.jitter_min_ms, self.target_ms - self.frame_ms)
+            self._frames_since_underrun = 0
+        return self._take(self.frame_bytes)
+
+    def _pace(self):
+        """Segundos a esperar antes de entregar la siguiente trama (no adelantarse más de lead_ms)"""
+        now = time.monotonic()
+        frame_seconds = self.frame_ms / 1000
+        if self._clock is None:
+            self._clock = now
+        elif now > self._clock + frame_seconds:
+            # La salida va con retraso: no se intenta recuperar entregando a ráfagas
+            self.late_frames += 1
+            self._clock = now
+        delay = self._clock - now - self.lead_ms / 1000
+        self._clock += frame_seconds
+        return max(0.0, delay)
+
+    def _played(self, frame):
+        self._bytes_played += len(frame)
+        self.frames_played += 1
+
+    def _signal_drained(self):
+        if self._drain_event is None:
+            return
+        if self.threaded:
+            self._loop.call_soon_threadsafe(self._drain_event.set)
+        else:
+            self._drain_event.set()
+
+    def _run_thread(self):
+        """Consumidor en un hilo propio (salidas bloqueantes, p. ej. PyAudio)"""
+        while self._running:
+            frame = self._next_frame()
+            if frame is None:
+                self._wakeup.wait(self.frame_ms / 1000)
+                self._wakeup.clear()
+                continue
+            delay = self._pace()
+            if delay:
+                time.sleep(delay)
+            if self._apply_flush():
+                # La trama ya tomada también era de la respuesta interrumpida
+                self._bytes_dropped += len(frame)
+                continue
+            self.sink.write(frame)
+            self._played(frame)
+
+    async def _run_task(self):
+        """Consumidor como tarea asyncio (salidas asíncronas, p. ej. un puente de telefonía)"""
+        while self._running:
+            frame = self._next_frame()
+            if frame is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.frame_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            delay = self._pace()
+            if delay:
+                await asyncio.sleep(delay)
+            if self._apply_flush():
+                self._bytes_dropped += len(frame)
+                continue
+            await self.sink.write(frame)
+            self._played(frame)
+
+    # ---------------------------
+    # Ciclo de vida
+    # ---------------------------
+    async def start(self):
+        """Arranca el consumidor (desde el bucle de eventos de la sesión)"""
+        self._loop = asyncio.get_running_loop()
+        self._drain_event = asyncio.Event()
+        self._running = True
+        if self.threaded:
+            self._worker = threading.Thread(target=self._run_thread, name="playout", daemon=True)
+            self._worker.start()
+        else:
+            self._worker = asyncio.create_task(self._run_task())
+
+    async def stop(self):
+        """Detiene el consumidor (el audio pendiente se descarta)"""
+        self._running = False
+        self._wakeup.set()
+        if self._worker is None:
+            return
+        if self.threaded:
+            await asyncio.to_thread(self._worker.join)
+        else:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
+
+    def status(self):
+        """
+        Retorna el estado y los contadores de la reproducción
+
+        Returns:
+            dict: Estado de la reproducción
+        """
+        return {
+            "state": self._state,
+            "buffered_ms": self.buffered_ms(),
+            "jitter_target_ms": self.target_ms,
+            "frames_played": self.frames_played,
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "late_frames": self.late_frames,
+            "flushes": self._flushes_done,
+            "flush_ms_last": self.flush_ms_last,
+            "flush_ms_max": self.flush_ms_max
+        }
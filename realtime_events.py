@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Lectura rápida de los eventos del servidor Realtime (ver realtime_session.py).
+
+La mayor parte del tráfico de bajada son eventos response.audio.delta: un JSON pequeño con
+un base64 de decenas de KB. Decodificar el frame a str y pasar todo por json.loads para
+luego decodificar el base64 copia el audio varias veces. Aquí los mensajes se reciben como
+bytes (recv(decode=False)) y:
+    peek_type:         lee el campo "type" del inicio del mensaje sin parsearlo
+    split_audio_delta: decodifica el base64 directamente desde una vista del mensaje
+                       (sin copiarlo) y extrae solo los ids del evento, sin parsearlo
+    parse_event:       parseo completo (con orjson si está instalado) para los demás eventos,
+                       que la sesión solo hace si alguien maneja ese tipo de evento
+"""
+import json
+import base64
+import binascii
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+TYPE_KEY = b'"type"'
+TYPE_PREFIX = b'{"type":"'
+DELTA_KEY = b'"delta"'
+AUDIO_DELTA_IDS = (("response_id", b'"response_id"'), ("item_id", b'"item_id"'))
+
+def parse_event(message):
+    """
+    Parsea un evento completo
+
+    Args:
+        message (bytes or str): JSON del evento
+
+    Returns:
+        dict: Evento
+    """
+    return _loads(message)
+
+def _string_value(message, key, start=0, end=None):
+    """
+    Posición (inicio, fin) del valor string de una clave JSON, o None si no está o no es string
+    """
+    position = message.find(key, start, end)
+    if position < 0:
+        return None
+    position += len(key)
+    # Espacios opcionales alrededor de los dos puntos
+    while message[position:position + 1] in (b" ", b":"):
+        position += 1
+    if message[position:position + 1] != b'"':
+        return None
+    value_end = message.find(b'"', position + 1)
+    if value_end < 0:
+        return None
+    return position + 1, value_end
+
+def peek_type(message):
+    """
+    Tipo de un evento sin parsearlo (el servidor envía "type" como primera clave)
+
+    Args:
+        message (bytes): JSON del evento
+
+    Returns:
+        str or None: Tipo del evento, o None si "type" no es la primera clave
+    """
+    # Caso habitual: JSON compacto
+    if message.startswith(TYPE_PREFIX):
+        end = message.find(b'"', len(TYPE_PREFIX))
+        return message[len(TYPE_PREFIX):end].decode("ascii", "replace") if end > 0 else None
+
+    # Solo la primera clave: un "type" más adelante podría ser de un objeto anidado
+    position = 1
+    while message[position:position + 1] in (b" ", b"\n", b"\r", b"\t"):
+        position += 1
+    if not message.startswith(TYPE_KEY, position):
+        return None
+    span = _string_value(message, TYPE_KEY, position, position + len(TYPE_KEY))
+    if span is None:
+        return None
+    return message[span[0]:span[1]].decode("ascii", "replace")
+
+def split_audio_delta(message):
+    """
+    Separa un evento response.audio.delta en sus campos y su audio
+
+    Args:
+        message (bytes): JSON del evento
+
+    Returns:
+        tuple: ({"type", "response_id", "item_id"}, PCM decodificado en bytes)
+    """
+    span = _string_value(message, DELTA_KEY)
+    # Un escape dentro del valor ("\\/") obliga al parseo completo
+    if span is None or message.find(b"\\", span[0], span[1]) >= 0:
+        event = parse_event(message)
+        pcm = base64.b64decode(event.pop("delta", ""))
+        return {"type": event.get("type"), **{name: event.get(name) for name, _ in AUDIO_DELTA_IDS}}, pcm
+
+    start, end = span
+    with memoryview(message) as view:
+        pcm = binascii.a2b_base64(view[start:end])
+
+    # Los ids van antes o después del audio; se buscan sin recorrer el base64
+    event = {"type": "response.audio.delta"}
+    for name, key in AUDIO_DELTA_IDS:
+        value = _string_value(message, key, 0, start) or _string_value(message, key, end)
+        event[name] = message[value[0]:value[1]].decode("utf-8") if value else None
+    return event, pcm
@@ -1,8 +1,14 @@
 session:answer()
 freeswitch.consoleLog("INFO", "Llamada contestada\n")
 
-local audio_respuesta = "/home/sysadmin/encuesta_IVR/tmp/assistant_response.wav"
-local pregunta_audio = "/home/sysadmin/encuesta_IVR/tmp/pregunta.wav"
+-- Archivos de trabajo propios de esta llamada (un directorio por UUID) para no pisar a otros llamantes
+local call_uuid = session:get_uuid()
+local call_dir = "/home/sysadmin/encuesta_IVR/tmp/calls/" .. call_uuid
+os.execute("mkdir -p " .. call_dir)
+
+local audio_respuesta = call_dir .. "/assistant_response.wav"
+local pregunta_audio = call_dir .. "/pregunta.wav"
+local flag_file = call_dir .. "/transfer_flag.txt"
 
 -- Loop principal para múltiples interacciones
 while session:ready() do
@@ -12,42 +18,40 @@ while session:ready() do
     -- Grabar pregunta del usuario
     session:execute("record", pregunta_audio .. " 30 100 2")
 
-    -- Ejecutar script Python en segundo plano
-    os.execute("/home/sysadmin/encuesta_IVR/venv/bin/python3 /home/sysadmin/encuesta_IVR/scripts/asistente_virtual.py " .. pregunta_audio .. " > /dev/null 2>&1 &")
+    -- Enviar el turno al daemon IVR en modo streaming (el cliente recurre a asistente_virtual.py si el daemon no está activo).
+    -- El cliente imprime cada segmento de audio en cuanto está publicado: no hace falta sondear archivos.
+    local cliente = io.popen("/home/sysadmin/encuesta_IVR/venv/bin/python3 /home/sysadmin/encuesta_IVR/scripts/ivr_client.py --stream " .. pregunta_audio .. " " .. call_uuid .. " 2>/dev/null")
 
     -- Mensaje de espera mientras procesa
     session:streamFile("/home/sysadmin/encuesta_IVR/sounds/Beep_Pensar.wav")
 
-    -- Esperar la respuesta de Python con un tiempo límite (ej. 20 segundos)
-    local espera = 0
-    local max_espera = 40  -- Máximo 20 segundos (40 * 500ms)
-    local respuesta_lista = false
+    -- Reproducir cada frase mientras las siguientes se siguen generando
+    local segmentos = 0
+    for segmento in cliente:lines() do
+        if not session:ready() then
+            break
+        end
+        if segmentos == 0 then
+            freeswitch.consoleLog("INFO", "Respuesta lista!\n")
+        end
+        session:streamFile(segmento)
+        segmentos = segmentos + 1
+    end
+    cliente:close()
 
-    while espera < max_espera do
+    if segmentos == 0 then
+        -- Sin segmentos (respaldo sin daemon): el archivo solo aparece completo (renombrado atómico)
         local file = io.open(audio_respuesta, "rb")
         if file then
-            local size = file:seek("end")
             file:close()
-            if size > 1000 then
-                freeswitch.consoleLog("INFO", "Respuesta lista!\n")
-                respuesta_lista = true
-                break
-            end
+            session:streamFile(audio_respuesta)
+        else
+            -- Informar que no se generó respuesta
+            session:streamFile("/home/sysadmin/encuesta_IVR/sounds/Beep_Error.wav")
         end
-        espera = espera + 1
-        session:sleep(500)
-    end
-
-    if respuesta_lista then
-        -- Reproducir respuesta generada por Python
-        session:streamFile(audio_respuesta)
-    else
-        -- Informar que no se generó respuesta
-        session:streamFile("/home/sysadmin/encuesta_IVR/sounds/Beep_Error.wav")
     end
 
     -- Verificar si se solicitó transferencia a agente
-    local flag_file = "/home/sysadmin/encuesta_IVR/tmp/transfer_flag.txt"
     local f = io.open(flag_file, "r")
     if f then
         f:close()
@@ -61,12 +65,16 @@ while session:ready() do
     end
 
     -- Limpiar archivos temporales para siguiente interacción
-    os.execute("rm -f " .. audio_respuesta)
-    os.execute("rm -f " .. pregunta_audio)
+    os.remove(audio_respuesta)
+    os.remove(pregunta_audio)
+    os.execute("rm -f " .. call_dir .. "/assistant_response_*.wav")
 
     -- Pequeña pausa antes de la siguiente interacción
     session:sleep(500)
 end
 
+-- Eliminar los archivos de trabajo de la llamada (el daemon barre los que queden huérfanos)
+os.execute("rm -rf " .. call_dir)
+
 -- Finalizar sesión si el usuario cuelga
 session:hangup()
@@ -45,7 +45,10 @@ try:
         logger.info(f"Añadido {base_dir} al sys.path")
 
     logger.info("Intentando importar faiss_search desde embeddings.buscar_pregunta")
-    from embeddings.buscar_pregunta import faiss_search
+    from embeddings.buscar_pregunta import faiss_search, dependencies_available
+    # El modelo y el índice se cargan en la primera búsqueda; aquí solo se verifica que existan
+    if not dependencies_available():
+        raise ImportError("Faltan dependencias o archivos del índice FAISS")
     logger.info("Módulo FAISS importado correctamente")
     FAISS_AVAILABLE = True
 except ImportError as e:
@@ -0,0 +1,632 @@
+#!/usr/bin/env python3
+"""
+Motor asyncio de sesiones de la API Realtime de OpenAI (voz a voz por WebSocket).
+
+Cada RealtimeSession es una conversación con su propio estado (respuesta en curso,
+contadores, colas) y su propio WebSocket; no hay estado global, así que un proceso puede
+alojar cientos de sesiones en un único bucle de eventos, cada una conectada a una fuente
+de audio distinta (una llamada de FreeSWITCH, el micrófono local, un archivo...).
+
+Por sesión corren cuatro tareas:
+    recepción:   lee los eventos del servidor y los despacha a sus manejadores (por su
+                 tipo, sin parsear el JSON de los eventos que nadie maneja; el audio se
+                 decodifica sin parsear el evento completo, ver realtime_events.py)
+    envío:       escribe en el WebSocket los eventos de la cola de envío
+    subida:      lee la fuente de audio y encola input_audio_buffer.append (agrupado en
+                 paquetes por realtime_audio.AudioUplink)
+    reproducción: entrega a la salida el audio recibido, con búfer de jitter
+                 (realtime_audio.AudioPlayout; un hilo propio si la salida es bloqueante)
+
+Barge-in: si el usuario empieza a hablar (input_audio_buffer.speech_started) mientras
+el asistente responde o aún suena su audio, la sesión descarta al momento el audio
+pendiente, cancela la respuesta (response.cancel) y recorta el item del asistente en el
+servidor a lo que llegó a sonar (conversation.item.truncate), para que el modelo no dé por
+dicho lo que el usuario no oyó.
+
+La cola de envío es acotada: si el WebSocket va lento, quien encola espera (backpressure)
+en lugar de acumular memoria sin límite. El audio recibido nunca detiene la recepción.
+
+Fuentes y salidas de audio (PCM16 mono a config.REALTIME_SAMPLE_RATE):
+    fuente: objeto con "async read()" que retorna bytes, o None al terminar la llamada
+    salida: objeto con "write(pcm)", bloqueante o asíncrono; opcionalmente "async close()"
+            y "latency" (segundos de audio que retiene el dispositivo)
+
+Requiere el paquete websockets (>= 14).
+"""
+import json
+import time
+import asyncio
+import logging
+import traceback
+
+import config
+from realtime_audio import AudioUplink, AudioPlayout
+from realtime_events import peek_type, parse_event, split_audio_delta
+from knowledge_base import search_faq_async
+
+logger = logging.getLogger(__name__)
+
+NO_ANSWER_MESSAGE = "Lo siento, no encontré esa respuesta en mi base de datos."
+
+FAQ_TOOL = {
+    "type": "function",
+    "name": "get_faq_answer",
+    "description": "Obtiene una respuesta de las FAQs internas si aplica.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "question": {
+                "type": "string",
+                "description": "Pregunta del usuario en texto."
+            }
+        },
+        "required": ["question"]
+    }
+}
+
+def build_session_config(instructions=config.REALTIME_INSTRUCTIONS, voice=config.REALTIME_VOICE):
+    """
+    Construye el evento session.update con la configuración de la conversación
+
+    Args:
+        instructions (str): Instrucciones del asistente
+        voice (str): Voz de las respuestas
+
+    Returns:
+        dict: Evento session.update
+    """
+    return {
+        "type": "session.update",
+        "session": {
+            "voice": voice,
+            "instructions": instructions,
+            "turn_detection": {
+                "type": "server_vad",
+                "threshold": 0.2,
+                "prefix_padding_ms": 400,
+                "silence_duration_ms": 1200,
+                "create_response": True,
+            },
+            "tools": [FAQ_TOOL],
+            "tool_choice": "auto",
+            "modalities": ["audio", "text"],
+            "input_audio_format": "pcm16",
+            "output_audio_format": "pcm16",
+            "max_response_output_tokens": config.REALTIME_MAX_OUTPUT_TOKENS,
+            "temperature": config.REALTIME_TEMPERATURE
+        }
+    }
+
+async def faq_tool_output(question, k_value=2):
+    """
+    Resultado de la función get_faq_answer para el modelo: hasta k_value respuestas de la FAQ
+
+    Args:
+        question (str): Pregunta del usuario
+        k_value (int): Respuestas máximas
+
+    Returns:
+        str: JSON {"answers": [...]} o el mensaje de "no encontrado"
+    """
+    results = await search_faq_async(question)
+    answers = [r["answer"] for r in results[:k_value]]
+    if not answers:
+        return NO_ANSWER_MESSAGE
+    return json.dumps({"answers": answers}, ensure_ascii=False)
+
+class RealtimeSession:
+    """Una conversación Realtime: su WebSocket, su estado y sus colas"""
+
+    def __init__(self, session_id, audio_source, audio_sink, api_key, url=config.REALTIME_URL,
+                 instructions=config.REALTIME_INSTRUCTIONS, voice=config.REALTIME_VOICE, on_event=None,
+                 barge_in=config.REALTIME_BARGE_IN):
+        """
+        Inicializa la sesión (la conexión se abre en run)
+
+        Args:
+            session_id (str): Identificador de la sesión (p. ej. el uuid de la llamada)
+            audio_source: Fuente de audio del usuario (ver el encabezado del módulo)
+            audio_sink: Salida del audio del asistente (ver el encabezado del módulo)
+            api_key (str): Clave API de OpenAI
+            url (str): URL del WebSocket Realtime
+            instructions (str): Instrucciones del asistente
+            voice (str): Voz de las respuestas
+            on_event (callable, optional): Se llama con (sesión, evento) tras manejar cada evento del servidor
+                (en response.audio.delta, el evento sin el campo "delta")
+            barge_in (bool): Si la voz del usuario interrumpe las respuestas
+        """
+        self.session_id = session_id
+        self.audio_source = audio_source
+        self.audio_sink = audio_sink
+        self.api_key = api_key
+        self.url = url
+        self.instructions = instructions
+        self.voice = voice
+        self.on_event = on_event
+        self.barge_in = barge_in
+
+        # Estado de la conversación
+        self.connected = False
+        self.in_response = False
+        self.current_response_id = None
+        self.audio_item_id = None           # Item del asistente del último audio recibido
+        self._audio_response_id = None      # Respuesta a la que pertenece ese item
+        self._interrupted_item_id = None    # Sus deltas aún en vuelo se descartan
+        self._cancelled_response_id = None  # Respuesta cancelada: igual, aunque aún no tuviera audio
+        self.closing = False
+        self._closed = asyncio.Event()      # Lo activa close(): corta la espera entre reconexiones
+        self.source_finished = False
+        self._session_created_at = None     # Hora (monotonic) del session.created de la conexión actual
+
+        # Contadores
+        self.started_at = time.time()
+        self.events_received = 0
+        self.events_sent = 0
+        self.audio_bytes_sent = 0
+        self.audio_bytes_received = 0
+        self.responses = 0
+        self.tool_calls = 0
+        self.reconnects = 0
+        self.interruptions = 0
+
+        self._ws = None
+        self._uplink = AudioUplink()
+        self._send_queue = asyncio.Queue(maxsize=config.REALTIME_SEND_QUEUE_SIZE)
+        self._playout = AudioPlayout(audio_sink)
+        self._tool_tasks = set()
+        # Manejadores que reciben el mensaje sin parsear (bytes)
+        self._raw_handlers = {
+            "response.audio.delta": self._on_audio_delta,
+        }
+        self._handlers = {
+            "session.created": self._on_session_created,
+            "session.updated": self._on_session_updated,
+            "response.created": self._on_response_created,
+            "response.done": self._on_response_done,
+            "response.audio.done": self._on_audio_done,
+            "response.text.done": self._on_text_done,
+            "response.function_call_arguments.done": self._on_function_call,
+            "input_audio_buffer.speech_started": self._on_speech_started,
+            "error": self._on_error,
+        }
+
+    # ---------------------------
+    # Envío
+    # ---------------------------
+    async def send(self, event):
+        """
+        Encola un evento para el servidor (espera si la cola de envío está llena)
+
+        Args:
+            event (dict): Evento del protocolo Realtime
+        """
+        await self._send_queue.put(json.dumps(event))
+
+    async def send_audio(self, pcm):
+        """
+        Añade audio del usuario para el búfer de entrada del servidor; se encola un evento
+        por cada paquete completo (ver realtime_audio.AudioUplink)
+
+        Args:
+            pcm (bytes): Audio PCM16 mono
+        """
+        self.audio_bytes_sent += len(pcm)
+        for event in self._uplink.push(pcm):
+            await self._send_queue.put(event)
+
+    async def _send_loop(self, ws):
+        """Escribe en el WebSocket los eventos encolados, en orden y por lotes"""
+        while True:
+            batch = [await self._send_queue.get()]
+            while len(batch) < config.REALTIME_SEND_BATCH and not self._send_queue.empty():
+                batch.append(self._send_queue.get_nowait())
+            for message in batch:
+                # Los eventos de audio ya vienen serializados (bytes): van como frame de texto
+                await ws.send(message, text=True)
+            self.events_sent += len(batch)
+
+    # ---------------------------
+    # Tareas de audio
+    # ---------------------------
+    async def _uplink_loop(self):
+        """Lee la fuente de audio y la envía hasta que la fuente termina"""
+        while True:
+            pcm = await self.audio_source.read()
+            if pcm is None:
+                logger.info(f"[{self.session_id}] Fin del audio de entrada")
+                event = self._uplink.flush()
+                if event is not None:
+                    await self._send_queue.put(event)
+                self.source_finished = True
+                return
+            if pcm:
+                await self.send_audio(pcm)
+
+    # ---------------------------
+    # Recepción y manejadores
+    # ---------------------------
+    async def _receive_loop(self, ws):
+        """Lee los eventos del servidor y los despacha a su manejador según su tipo"""
+        import websockets
+
+        while True:
+            try:
+                # Sin decodificar a str: el audio se lee directamente de los bytes del frame
+                message = await ws.recv(decode=False)
+            except websockets.exceptions.ConnectionClosedOK:
+                return
+            self.events_received += 1
+
+            event = None
+            event_type = peek_type(message)
+            if event_type is None:
+                event = parse_event(message)
+                event_type = event.get("type", "")
+
+            raw_handler = self._raw_handlers.get(event_type)
+            if raw_handler is not None:
+                event = await raw_handler(message)
+            else:
+                handler = self._handlers.get(event_type)
+                if handler is None and self.on_event is None:
+                    continue  # Nadie usa este evento: no se parsea
+                if event is None:
+                    event = parse_event(message)
+                if handler is not None:
+                    await handler(event)
+            if self.on_event is not None:
+                self.on_event(self, event)
+
+    async def _on_session_created(self, event):
+        self._session_created_at = time.monotonic()
+        logger.info(f"[{self.session_id}] Sesión Realtime creada ({event.get('session', {}).get('id')})")
+        await self.send(build_session_config(self.instructions, self.voice))
+
+    async def _on_session_updated(self, event):
+        logger.debug(f"[{self.session_id}] Sesión actualizada")
+
+    async def _on_response_created(self, event):
+        self.current_response_id = event["response"]["id"]
+        self.in_response = True
+
+    async def _on_response_done(self, event):
+        # Respuestas canceladas o fallidas no envían response.audio.done
+        self._playout.end_of_response()
+        self.current_response_id = None
+        self.in_response = False
+        self.responses += 1
+
+    async def _on_audio_delta(self, message):
+        event, pcm = split_audio_delta(message)
+        self.audio_bytes_received += len(pcm)
+        if event["item_id"] == self._interrupted_item_id or event["response_id"] == self._cancelled_response_id:
+            return event  # Enviado antes de que el servidor recibiera la cancelación
+        self.audio_item_id = event["item_id"]
+        self._audio_response_id = event["response_id"]
+        self._playout.push(pcm)
+        return event
+
+    async def _on_audio_done(self, event):
+        logger.debug(f"[{self.session_id}] Fin del audio de la respuesta ({self._playout.buffered_ms()} ms por sonar)")
+        self._playout.end_of_response()
+
+    async def _on_speech_started(self, event):
+        if self.barge_in:
+            await self.interrupt()
+
+    async def _on_text_done(self, event):
+        logger.info(f"[{self.session_id}] Texto de la respuesta: {event.get('text', '')}")
+
+    async def _on_error(self, event):
+        message = event.get("error", {}).get("message", "")
+        if "no active response found" in message:
+            logger.debug(f"[{self.session_id}] No había respuesta activa para cancelar; se ignora")
+        else:
+            logger.error(f"[{self.session_id}] Error de la API Realtime: {event}")
+
+    async def _on_function_call(self, event):
+        # La búsqueda corre aparte para no detener la recepción de eventos
+        task = asyncio.create_task(self._answer_function_call(event["call_id"], event.get("name"), event.get("arguments", "")))
+        self._tool_tasks.add(task)
+        task.add_done_callback(self._tool_tasks.discard)
+
+    async def _answer_function_call(self, call_id, name, arguments):
+        """Ejecuta la función pedida por el modelo y le envía el resultado"""
+        self.tool_calls += 1
+        logger.info(f"[{self.session_id}] Llamada a {name} con args={arguments}")
+        try:
+            question = json.loads(arguments).get("question", "")
+            result = await faq_tool_output(question)
+        except json.JSONDecodeError:
+            logger.error(f"[{self.session_id}] No se pudieron decodificar los argumentos de la función")
+            result = "Hubo un problema procesando tu solicitud."
+        except Exception as e:
+            logger.error(f"[{self.session_id}] Fallo inesperado en la función: {e}")
+            result = "Ocurrió un error interno."
+
+        await self.send({
+            "type": "conversation.item.create",
+            "item": {
+                "type": "function_call_output",
+                "call_id": call_id,
+                "output": json.dumps({"faq_answer": result}, ensure_ascii=False)
+            }
+        })
+        # Forzar al modelo a responder con el resultado de la función
+        await self.send({
+            "type": "response.create",
+            "response": {
+                "modalities": ["audio", "text"],
+                "instructions": "Usa la información de la función llamada para responder de manera clara y concisa."
+            }
+        })
+
+    # ---------------------------
+    # Ciclo de vida
+    # ---------------------------
+    async def _connect(self):
+        """Abre el WebSocket de la sesión"""
+        import websockets
+
+        return await websockets.connect(
+            self.url,
+            additional_headers={"Authorization": f"Bearer {self.api_key}", "OpenAI-Beta": "realtime=v1"},
+            open_timeout=config.REALTIME_CONNECT_TIMEOUT,
+            ping_interval=config.REALTIME_PING_INTERVAL,
+            max_size=None
+        )
+
+    async def _run_connection(self, ws, background):
+        """
+        Atiende una conexión hasta que se cierra, falla o termina la fuente de audio
+
+        Returns:
+            bool: True si la sesión terminó (no hay que reconectar)
+        """
+        tasks = {asyncio.create_task(self._receive_loop(ws)), asyncio.create_task(self._send_loop(ws))}
+        try:
+            done, _ = await asyncio.wait(tasks | background, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # Propaga el error de la tarea que terminó (p. ej. ConnectionClosed)
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+            # Terminó la fuente (fin de la llamada) o el servidor cerró sin error
+            return True
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self):
+        """
+        Conecta y atiende la sesión hasta que termina la fuente de audio, se llama a close()
+        o se agotan las reconexiones. Tras una reconexión la conversación empieza de nuevo
+        en el servidor (las sesiones Realtime no se reanudan).
+        """
+        import websockets
+
+        # La subida y la reproducción sobreviven a las reconexiones
+        background = {asyncio.create_task(self._uplink_loop())}
+        await self._playout.start()
+        failures = 0
+        try:
+            while not self.closing:
+                try:
+                    self._ws = await self._connect()
+                except (OSError, asyncio.TimeoutError, websockets.exceptions.InvalidHandshake) as e:
+                    logger.warning(f"[{self.session_id}] No se pudo conectar a la API Realtime: {e}")
+                else:
+                    if self.closing:
+                        # close() llegó mientras se abría la conexión: no cerró este WebSocket
+                        await self._ws.close()
+                        break
+                    self.connected = True
+                    self._session_created_at = None
+                    try:
+                        if await self._run_connection(self._ws, background):
+                            break
+                    except websockets.exceptions.ConnectionClosed as e:
+                        logger.warning(f"[{self.session_id}] Conexión Realtime cerrada: {e}")
+                        # El audio pendiente es de una respuesta que el servidor ya no terminará;
+                        # sin descartarlo, la respuesta quedaría abierta y se mezclaría con la siguiente
+                        self._playout.flush()
+                    finally:
+                        self.connected = False
+                        self.in_response = False
+                        self.current_response_id = None
+                        self.audio_item_id = None
+                        await self._ws.close()
+                        # Los eventos pendientes pertenecen a la sesión del servidor que se cerró
+                        while not self._send_queue.empty():
+                            self._send_queue.get_nowait()
+                        # Solo una conexión que funcionó un tiempo reinicia el contador: un servidor
+                        # que acepta y corta enseguida no debe provocar reconexiones sin fin
+                        if (self._session_created_at is not None
+                                and time.monotonic() - self._session_created_at >= config.REALTIME_STABLE_CONNECTION):
+                            failures = 0
+
+                if self.closing:
+                    break
+                failures += 1
+                if failures > config.REALTIME_RECONNECT_ATTEMPTS:
+                    logger.error(f"[{self.session_id}] Reconexiones agotadas; se abandona la sesión")
+                    break
+                self.reconnects += 1
+                try:
+                    await asyncio.wait_for(self._closed.wait(), min(2 ** failures, 10))
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as e:
+            logger.error(f"[{self.session_id}] Error en la sesión Realtime: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            for task in background | self._tool_tasks:
+                task.cancel()
+            await asyncio.gather(*background, *self._tool_tasks, return_exceptions=True)
+            await self._playout.stop()
+            close_sink = getattr(self.audio_sink, "close", None)
+            if close_sink is not None:
+                await close_sink()
+            logger.info(f"[{self.session_id}] Sesión Realtime finalizada: {self.status()}")
+
+    async def close(self):
+        """Termina la sesión: cierra el WebSocket y hace que run() retorne"""
+        self.closing = True
+        self._closed.set()
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def interrupt(self):
+        """
+        Corta la respuesta del asistente: descarta el audio pendiente, cancela la respuesta
+        en curso y recorta el item del asistente a lo que llegó a sonar
+
+        Returns:
+            bool: True si había algo que interrumpir
+        """
+        if not self.in_response and self._playout.drained():
+            return False
+        # Solo se recorta un item que aún suena o es de la respuesta en curso: uno que ya sonó
+        # entero (p. ej. el turno anterior, mientras la respuesta actual espera una función)
+        # perdería su transcripción en el servidor
+        truncate = self.audio_item_id is not None and (
+            self._audio_response_id == self.current_response_id or not self._playout.drained()
+        )
+        # Primero el silencio local: no depende de la red
+        played_ms = self._playout.flush()
+        self.interruptions += 1
+        if self.in_response:
+            self._cancelled_response_id = self.current_response_id
+            await self.send({"type": "response.cancel"})
+        if truncate:
+            await self.send({
+                "type": "conversation.item.truncate",
+                "item_id": self.audio_item_id,
+                "content_index": 0,
+                "audio_end_ms": played_ms
+            })
+            self._interrupted_item_id = self.audio_item_id
+            self.audio_item_id = None
+        logger.info(f"[{self.session_id}] Respuesta interrumpida por el usuario tras {played_ms} ms de audio")
+        return True
+
+    async def wait_playout(self, timeout=None):
+        """
+        Espera a que termine de sonar el audio recibido (p. ej. antes de colgar tras una despedida)
+
+        Args:
+            timeout (float, optional): Segundos máximos de espera
+
+        Returns:
+            bool: True si terminó de sonar
+        """
+        return await self._playout.wait_drained(timeout)
+
+    def status(self):
+        """
+        Retorna el estado y los contadores de la sesión
+
+        Returns:
+            dict: Estado de la sesión
+        """
+        return {
+            "session_id": self.session_id,
+            "connected": self.connected,
+            "in_response": self.in_response,
+            "uptime": round(time.time() - self.started_at, 1),
+            "events_received": self.events_received,
+            "events_sent": self.events_sent,
+            "audio_bytes_sent": self.audio_bytes_sent,
+            "audio_packets_sent": self._uplink.packets,
+            "audio_bytes_received": self.audio_bytes_received,
+            "send_queue": self._send_queue.qsize(),
+            "playout": self._playout.status(),
+            "responses": self.responses,
+            "tool_calls": self.tool_calls,
+            "interruptions": self.interruptions,
+            "reconnects": self.reconnects
+        }
+
+class RealtimeEngine:
+    """Aloja las sesiones Realtime concurrentes de un proceso en su bucle de eventos"""
+
+    def __init__(self, api_key, max_sessions=config.REALTIME_MAX_SESSIONS, url=config.REALTIME_URL):
+        """
+        Inicializa el motor
+
+        Args:
+            api_key (str): Clave API de OpenAI
+            max_sessions (int): Sesiones simultáneas máximas
+            url (str): URL del WebSocket Realtime
+        """
+        self.api_key = api_key
+        self.max_sessions = max_sessions
+        self.url = url
+        self.sessions = {}
+        self.sessions_served = 0
+        self._tasks = {}
+
+    def start_session(self, session_id, audio_source, audio_sink, **kwargs):
+        """
+        Crea una sesión y la ejecuta en segundo plano (desde el bucle de eventos)
+
+        Args:
+            session_id (str): Identificador único de la sesión
+            audio_source: Fuente de audio del usuario
+            audio_sink: Salida del audio del asistente
+            **kwargs: Argumentos adicionales para RealtimeSession (instructions, voice, on_event)
+
+        Returns:
+            RealtimeSession: La sesión creada
+
+        Raises:
+            RuntimeError: Si ya existe la sesión o se alcanzó el máximo de sesiones
+        """
+        if session_id in self.sessions:
+            raise RuntimeError(f"La sesión {session_id} ya existe")
+        if len(self.sessions) >= self.max_sessions:
+            raise RuntimeError(f"Máximo de sesiones Realtime alcanzado ({self.max_sessions})")
+
+        session = RealtimeSession(session_id, audio_source, audio_sink, self.api_key, url=self.url, **kwargs)
+        self.sessions[session_id] = session
+        task = asyncio.create_task(session.run())
+        self._tasks[session_id] = task
+
+        def on_done(_):
+            self.sessions.pop(session_id, None)
+            self._tasks.pop(session_id, None)
+            self.sessions_served += 1
+
+        task.add_done_callback(on_done)
+        return session
+
+    async def wait_session(self, session_id):
+        """Espera a que termine una sesión"""
+        task = self._tasks.get(session_id)
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def stop_session(self, session_id):
+        """Cierra una sesión y espera a que termine"""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            await session.close()
+            await self.wait_session(session_id)
+
+    async def shutdown(self):
+        """Cierra todas las sesiones"""
+        await asyncio.gather(*(self.stop_session(session_id) for session_id in list(self.sessions)))
+
+    def status(self):
+        """
+        Retorna el estado del motor y de cada sesión activa
+
+        Returns:
+            dict: Estado del motor
+        """
+        return {
+            "active_sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "sessions_served": self.sessions_served,
+            "sessions": [session.status() for session in self.sessions.values()]
+        }
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Caché semántico de respuestas del asistente.
+
+Las mismas preguntas llegan con distintas palabras. Cada turno respondido se guarda con el
+embedding de su transcripción en un índice FAISS pequeño; si una transcripción nueva es
+suficientemente similar a una ya respondida, se reutiliza el texto de la respuesta (y su
+audio, que queda en el caché TTS) sin pasar por el LLM.
+
+El caché vive en la memoria del proceso (el daemon IVR) y expulsa entradas por antigüedad
+(TTL) y por capacidad (la usada hace más tiempo). Cada consulta indica la versión del índice
+FAQ cargada: cuando cambia (una actualización de la FAQ recargada en caliente), todas las
+respuestas guardadas se descartan, porque pueden citar respuestas que ya no existen.
+"""
+import time
+import logging
+import threading
+
+import config
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """Índice de similitud coseno entre transcripciones con respuestas asociadas"""
+
+    def __init__(self, threshold=config.SEMANTIC_CACHE_THRESHOLD, ttl=config.SEMANTIC_CACHE_TTL,
+                 capacity=config.SEMANTIC_CACHE_CAPACITY):
+        """
+        Inicializa el caché
+
+        Args:
+            threshold (float): Similitud coseno mínima para considerar un acierto
+            ttl (float): Segundos de validez de cada entrada
+            capacity (int): Número máximo de entradas
+
+        Raises:
+            ImportError: Si numpy o faiss no están instalados
+        """
+        import numpy as np
+        import faiss
+
+        self._np = np
+        self._faiss = faiss
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.version = None           # Versión del índice FAQ de las respuestas guardadas
+        self._index = None            # Se crea con la dimensión del primer embedding
+        self._entries = {}            # id en el índice → entrada
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _normalize(self, embedding):
+        """Copia el embedding como float32 normalizado (producto interno = coseno)"""
+        vector = self._np.array(embedding, dtype="float32").reshape(1, -1)
+        self._faiss.normalize_L2(vector)
+        return vector
+
+    def _remove(self, ids):
+        """Elimina entradas del índice (con el bloqueo tomado)"""
+        if not ids:
+            return
+        self._index.remove_ids(self._np.array(ids, dtype="int64"))
+        for entry_id in ids:
+            self._entries.pop(entry_id, None)
+
+    def _expire(self):
+        """Elimina las entradas que superaron el TTL (con el bloqueo tomado)"""
+        limit = time.time() - self.ttl
+        self._remove([entry_id for entry_id, entry in self._entries.items() if entry["created"] < limit])
+
+    def _check_version(self, version):
+        """Descarta todas las entradas si cambió la versión del índice FAQ (con el bloqueo tomado)"""
+        if version == self.version:
+            return
+        if self._entries:
+            logger.info(f"Índice FAQ recargado: se descartan {len(self._entries)} respuestas del caché semántico")
+            self._remove(list(self._entries))
+            self.invalidations += 1
+        self.version = version
+
+    def _search(self, vector):
+        """Retorna (id, similitud) de la entrada más cercana, o (None, 0) (con el bloqueo tomado)"""
+        if self._index is None or not self._entries:
+            return None, 0
+        D, I = self._index.search(vector, 1)
+        if I[0][0] < 0:
+            return None, 0
+        return int(I[0][0]), float(D[0][0])
+
+    def lookup(self, embedding, version=None):
+        """
+        Busca una respuesta para una transcripción similar a una ya respondida
+
+        Args:
+            embedding (numpy.ndarray): Embedding de la transcripción
+            version (optional): Versión del índice FAQ cargada (ver knowledge_base.faq_index_version)
+
+        Returns:
+            dict or None: Copia de la entrada con 'similarity', o None si no hay acierto
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            self._expire()
+            entry_id, similarity = self._search(vector)
+            if entry_id is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[entry_id]
+            entry["last_used"] = time.time()
+            entry["hits"] += 1
+            self.hits += 1
+            return dict(entry, similarity=similarity)
+
+    def add(self, embedding, transcript, response, cost=0, version=None):
+        """
+        Guarda la respuesta de un turno
+
+        Args:
+            embedding (numpy.ndarray): Embedding de la transcripción
+            transcript (str): Transcripción del usuario
+            response (str): Texto final de la respuesta del asistente
+            cost (float): Segundos que tardó el turno original desde la transcripción hasta el primer audio
+            version (optional): Versión del índice FAQ con la que se respondió
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if version != self.version:
+                # Respondida con un índice FAQ que ya se reemplazó
+                return
+            if self._index is None:
+                self._index = self._faiss.IndexIDMap(self._faiss.IndexFlatIP(vector.shape[1]))
+
+            # Una pregunta equivalente ya cacheada se reemplaza por la respuesta más reciente
+            entry_id, similarity = self._search(vector)
+            if entry_id is not None and similarity >= self.threshold:
+                self._remove([entry_id])
+
+            self._expire()
+            if len(self._entries) >= self.capacity:
+                oldest = sorted(self._entries, key=lambda i: self._entries[i]["last_used"])
+                self._remove(oldest[:len(self._entries) - self.capacity + 1])
+
+            now = time.time()
+            self._index.add_with_ids(vector, self._np.array([self._next_id], dtype="int64"))
+            self._entries[self._next_id] = {
+                "transcript": transcript,
+                "response": response,
+                "cost": cost,
+                "created": now,
+                "last_used": now,
+                "hits": 0
+            }
+            self._next_id += 1
+
+    def stats(self):
+        """
+        Retorna los contadores del caché
+
+        Returns:
+            dict: Aciertos, fallos, tasa de aciertos, entradas y vaciados por recarga del índice FAQ
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations
+            }
+
+_cache = None
+_cache_failed = False
+_cache_lock = threading.Lock()
+
+def get_semantic_cache():
+    """
+    Retorna el caché semántico compartido del proceso
+
+    Returns:
+        SemanticCache or None: Caché, o None si está deshabilitado o faltan numpy/faiss
+    """
+    global _cache, _cache_failed
+
+    if not config.SEMANTIC_CACHE_ENABLED:
+        return None
+
+    if _cache is None and not _cache_failed:
+        with _cache_lock:
+            if _cache is None and not _cache_failed:
+                try:
+                    _cache = SemanticCache()
+                except ImportError as e:
+                    logger.warning(f"Caché semántico deshabilitado: {e}")
+                    _cache_failed = True
+
+    return _cache
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Servidor Realtime falso para probar RealtimeSession sin la API de OpenAI.
+
+Cada conexión ejecuta un guion (corrutina script(server, ws, number)) mientras el servidor
+registra los eventos que envía el cliente (salvo input_audio_buffer.append, que solo cuenta).
+"""
+import json
+import base64
+import asyncio
+
+import websockets
+
+BYTES_PER_MS = 48   # PCM16 mono a 24 kHz
+
+def event(event_type, **fields):
+    """Evento del servidor serializado"""
+    return json.dumps({"type": event_type, **fields})
+
+def audio_delta(response_id, item_id, ms, value=1):
+    """response.audio.delta con 'ms' milisegundos de audio cuyos bytes valen 'value'"""
+    pcm = bytes([value]) * (ms * BYTES_PER_MS)
+    return event("response.audio.delta", response_id=response_id, item_id=item_id,
+                 delta=base64.b64encode(pcm).decode("ascii"))
+
+class FakeRealtimeServer:
+    """Servidor WebSocket en un puerto efímero de 127.0.0.1"""
+
+    def __init__(self, script, reject_after=None, handshake_delay=0):
+        """
+        Args:
+            script: Corrutina script(server, ws, number) que atiende la conexión número 'number' (desde 1)
+            reject_after (int, optional): Conexiones aceptadas; las siguientes reciben un 503 en el handshake
+            handshake_delay (float): Segundos que tarda el servidor en aceptar cada conexión
+        """
+        self.script = script
+        self.reject_after = reject_after
+        self.handshake_delay = handshake_delay
+        self.connections = 0
+        self.rejected = 0
+        self.events = []
+        self.audio_appends = 0
+        self._changed = asyncio.Condition()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+
+    async def start(self):
+        self._server = await websockets.serve(self._handle, "127.0.0.1", 0, process_request=self._process_request)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def sent(self, event_type):
+        """Eventos de un tipo recibidos del cliente"""
+        return [e for e in self.events if e["type"] == event_type]
+
+    async def wait_for(self, event_type, timeout=5):
+        """Espera el primer evento de un tipo enviado por el cliente y lo retorna"""
+        async def first():
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.sent(event_type))
+            return self.sent(event_type)[0]
+        return await asyncio.wait_for(first(), timeout)
+
+    async def _process_request(self, connection, request):
+        await asyncio.sleep(self.handshake_delay)
+        if self.reject_after is not None and self.connections >= self.reject_after:
+            self.rejected += 1
+            return connection.respond(503, "Servicio no disponible\n")
+        return None
+
+    async def _handle(self, ws):
+        self.connections += 1
+        reader = asyncio.create_task(self._read(ws))
+        try:
+            await self.script(self, ws, self.connections)
+        finally:
+            reader.cancel()
+
+    async def _read(self, ws):
+        try:
+            async for message in ws:
+                data = json.loads(message)
+                if data["type"] == "input_audio_buffer.append":
+                    self.audio_appends += 1
+                    continue
+                async with self._changed:
+                    self.events.append(data)
+                    self._changed.notify_all()
+        except websockets.exceptions.ConnectionClosed:
+            pass
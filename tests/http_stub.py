@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP local que imita los endpoints de la API de OpenAI para las pruebas.
+
+Se usa apuntando OPENAI_API_BASE_URL (o las URLs de config) a StubServer.base_url.
+Cada petición queda registrada con el puerto de origen del cliente, de modo que las
+pruebas pueden comprobar si la conexión keep-alive se reutilizó.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que el cliente pueda mantener la conexión abierta entre peticiones
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests.append({"method": self.command, "path": self.path, "port": self.client_address[1], "body": body})
+            script = stub.scripts.get(self.path)
+            status, headers, payload = script.pop(0) if script else (200, {}, {"ok": True})
+
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer:
+    """
+    Servidor de pruebas en un puerto efímero de 127.0.0.1, ejecutado en un hilo
+
+    script(path, *responses) programa las respuestas (status, cabeceras, cuerpo) que recibirán
+    las siguientes peticiones a 'path'; agotado el guion responde 200 {"ok": true}.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.scripts = {}
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def script(self, path, *responses):
+        with self.lock:
+            self.scripts.setdefault(path, []).extend(responses)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,85 @@
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import http_client
+from tests.http_stub import StubServer
+
+@pytest.fixture
+def stub():
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+@pytest.fixture(autouse=True)
+def fresh_session(monkeypatch):
+    """Sesión compartida nueva en cada prueba y esperas de backoff registradas en lugar de dormidas"""
+    monkeypatch.setattr(http_client, "_session", None)
+    delays = []
+    monkeypatch.setattr(http_client.time, "sleep", delays.append)
+    yield delays
+    if http_client._session is not None:
+        http_client._session.close()
+
+def test_retries_transient_status_until_success(stub, fresh_session):
+    url = f"{stub.base_url}/chat/completions"
+    stub.script("/v1/chat/completions", (503, {}, {"error": "busy"}), (429, {"Retry-After": "1.5"}, {"error": "slow down"}))
+
+    response = http_client.post(url, json={"model": "test"}, max_retries=2)
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert len(stub.requests) == 3
+    # Retry-After manda sobre el backoff exponencial
+    assert fresh_session[1] == 1.5
+    assert 0 <= fresh_session[0] <= http_client.HTTP_BACKOFF_BASE
+
+def test_returns_last_response_when_retries_exhausted(stub, fresh_session):
+    url = f"{stub.base_url}/audio/speech"
+    stub.script("/v1/audio/speech", *[(500, {}, {"error": "boom"})] * 3)
+
+    response = http_client.post(url, json={}, max_retries=1)
+
+    assert response.status_code == 500
+    assert len(stub.requests) == 2
+    assert len(fresh_session) == 1
+
+def test_does_not_retry_client_errors(stub, fresh_session):
+    stub.script("/v1/chat/completions", (400, {}, {"error": "bad request"}))
+
+    response = http_client.post(f"{stub.base_url}/chat/completions", json={})
+
+    assert response.status_code == 400
+    assert len(stub.requests) == 1
+    assert fresh_session == []
+
+def test_connection_errors_raise_after_retries(fresh_session):
+    # Puerto sin servidor: cada intento falla al conectar
+    closed = StubServer()
+    url = f"{closed.base_url}/chat/completions"
+    closed.stop()
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_client.post(url, json={}, max_retries=2)
+    assert len(fresh_session) == 2
+
+def test_session_reuses_keep_alive_connection(stub):
+    stub.script("/v1/audio/transcriptions", (503, {}, {"error": "busy"}))
+
+    assert http_client.get_session() is http_client.get_session()
+    http_client.post(f"{stub.base_url}/audio/transcriptions", files={"file": ("a.wav", b"RIFF")})
+    http_client.post(f"{stub.base_url}/chat/completions", json={})
+    http_client.post(f"{stub.base_url}/audio/speech", json={})
+
+    # El reintento y las peticiones a distintos endpoints viajan por la misma conexión
+    assert len(stub.requests) == 4
+    assert len({request["port"] for request in stub.requests}) == 1
+
+def test_warm_up_opens_connection_for_later_requests(stub, monkeypatch):
+    monkeypatch.setattr(http_client, "OPENAI_API_BASE_URL", stub.base_url)
+
+    assert http_client.warm_up("sk-test")
+    http_client.post(f"{stub.base_url}/chat/completions", json={})
+
+    assert [request["path"] for request in stub.requests] == ["/v1/models", "/v1/chat/completions"]
+    assert stub.requests[0]["port"] == stub.requests[1]["port"]
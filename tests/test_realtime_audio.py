@@ -0,0 +1,110 @@
+import time
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from realtime_audio import AudioPlayout, PcmRingBuffer
+
+BYTES_PER_MS = 48   # PCM16 mono a 24 kHz
+
+class BlockingSink:
+    """Salida bloqueante que tarda en escribir lo que dura el audio (como un dispositivo)"""
+    latency = 0.02
+
+    def __init__(self):
+        self.data = bytearray()
+        self.last_write = 0.0
+
+    def write(self, pcm):
+        time.sleep(len(pcm) / (BYTES_PER_MS * 1000))
+        self.data += pcm
+        self.last_write = time.monotonic()
+
+class AsyncSink:
+    """Salida asíncrona que no bloquea (la reproducción la marca a tiempo real)"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.last_write = 0.0
+
+    async def write(self, pcm):
+        self.data += pcm
+        self.last_write = time.monotonic()
+
+def test_ring_buffer_wraps_and_caps_writes():
+    ring = PcmRingBuffer(10)
+    assert ring.write(b"abcdefgh") == 8
+    assert ring.read(5) == b"abcde"
+    assert ring.write(b"123456") == 6
+    assert ring.read(20) == b"fgh123456"
+    assert ring.write(b"x" * 20) == 10
+    assert ring.free() == 0
+
+@pytest.mark.parametrize("sink_class, buffer_ms", [(BlockingSink, 4000), (BlockingSink, 300), (AsyncSink, 300)])
+def test_playout_delivers_every_byte_in_order(sink_class, buffer_ms):
+    async def scenario():
+        sink = sink_class()
+        playout = AudioPlayout(sink, buffer_ms=buffer_ms)
+        await playout.start()
+        expected = bytearray()
+        # Ráfaga de 500 ms (con buffer_ms=300 parte espera fuera del anillo) y luego un goteo
+        # con un hueco más largo que el audio pendiente, que provoca un corte
+        for i in range(5):
+            chunk = bytes([i]) * (100 * BYTES_PER_MS)
+            playout.push(chunk)
+            expected += chunk
+        for i in range(5):
+            await asyncio.sleep(1.0 if i == 2 else 0.1)
+            chunk = bytes([100 + i]) * (100 * BYTES_PER_MS)
+            playout.push(chunk)
+            expected += chunk
+        playout.end_of_response()
+        drained = await playout.wait_drained(5)
+        await playout.stop()
+        return sink, playout, expected, drained
+
+    sink, playout, expected, drained = asyncio.run(scenario())
+
+    assert drained
+    assert bytes(sink.data) == bytes(expected)
+    # played_ms descuenta lo que retiene la salida
+    assert playout.played_ms() == 1000 - int(getattr(sink, "latency", 0) * 1000)
+    assert playout.status()["underruns"] >= 1
+    if buffer_ms < 500:
+        assert playout.overruns > 0
+
+@pytest.mark.parametrize("sink_class", [BlockingSink, AsyncSink])
+def test_flush_silences_pending_audio_and_next_response_plays(sink_class):
+    async def scenario():
+        sink = sink_class()
+        playout = AudioPlayout(sink)
+        await playout.start()
+        for _ in range(20):
+            playout.push(b"\x01" * (100 * BYTES_PER_MS))
+        await asyncio.sleep(0.5)
+
+        flushed_at = time.monotonic()
+        played_ms = playout.flush()
+        await asyncio.sleep(0.2)
+        stale = sink.last_write - flushed_at
+
+        for _ in range(3):
+            playout.push(b"\x02" * (100 * BYTES_PER_MS))
+        playout.end_of_response()
+        drained = await playout.wait_drained(3)
+        await playout.stop()
+        return sink, playout, played_ms, stale, drained
+
+    sink, playout, played_ms, stale, drained = asyncio.run(scenario())
+
+    assert drained
+    # La interrupción llega en mitad de la primera respuesta y el audio viejo deja de sonar enseguida
+    assert 300 <= played_ms <= 600
+    assert stale < 0.1
+    assert sink.data.count(1) < 800 * BYTES_PER_MS
+    # La respuesta siguiente suena entera y el contador vuelve a empezar con ella
+    assert sink.data.count(2) == 300 * BYTES_PER_MS
+    assert playout.played_ms() == 300 - int(getattr(sink, "latency", 0) * 1000)
+    assert playout.status()["flushes"] == 1
@@ -0,0 +1,264 @@
+import json
+import time
+import asyncio
+
+import pytest
+
+pytest.importorskip("websockets")
+pytest.importorskip("numpy")
+
+import config
+import realtime_session
+from realtime_session import RealtimeSession
+from tests.fake_realtime import BYTES_PER_MS, FakeRealtimeServer, audio_delta, event
+
+class SilenceSource:
+    """Micrófono que entrega 20 ms de silencio a tiempo real"""
+
+    async def read(self):
+        await asyncio.sleep(0.02)
+        return b"\0\0" * 480
+
+class Sink:
+    def __init__(self):
+        self.data = bytearray()
+
+    async def write(self, pcm):
+        self.data += pcm
+
+@pytest.fixture(autouse=True)
+def fake_faq(monkeypatch):
+    async def faq_tool_output(question, k_value=2):
+        return f"Respuesta de prueba para {question}"
+    monkeypatch.setattr(realtime_session, "faq_tool_output", faq_tool_output)
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Registra las esperas entre reconexiones en lugar de cumplirlas"""
+    delays = []
+
+    class FastBackoff:
+        def __getattr__(self, name):
+            return getattr(asyncio, name)
+
+        async def wait_for(self, awaitable, timeout):
+            delays.append(timeout)
+            return await asyncio.wait_for(awaitable, 0)
+
+    monkeypatch.setattr(realtime_session, "asyncio", FastBackoff())
+    return delays
+
+async def run_session(script, body, sink=None, **server_options):
+    """Arranca el servidor falso y una sesión contra él, ejecuta body(server, session) y cierra ambos"""
+    server = await FakeRealtimeServer(script, **server_options).start()
+    session = RealtimeSession("test", SilenceSource(), sink or Sink(), "sk-test", url=server.url)
+    task = asyncio.create_task(session.run())
+    try:
+        return await body(server, session, task)
+    finally:
+        await session.close()
+        await asyncio.wait_for(task, 10)
+        await server.stop()
+
+async def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timeout"
+        await asyncio.sleep(0.02)
+
+def test_tool_call_output_is_sent_and_response_requested():
+    async def script(server, ws, number):
+        await ws.send(event("session.created", session={"id": "s1"}))
+        await server.wait_for("session.update")
+        await ws.send(event("response.created", response={"id": "r1"}))
+        await ws.send(event("response.function_call_arguments.done", call_id="c1", name="get_faq_answer",
+                            arguments=json.dumps({"question": "pqrsdf"})))
+        await ws.send(event("response.done", response={"id": "r1"}))
+        await ws.wait_closed()
+
+    async def body(server, session, task):
+        await server.wait_for("response.create")
+        return server, session
+
+    server, session = asyncio.run(run_session(script, body))
+
+    update = server.sent("session.update")[0]["session"]
+    assert update["tools"][0]["name"] == "get_faq_answer"
+    item = server.sent("conversation.item.create")[0]["item"]
+    assert item["call_id"] == "c1"
+    assert json.loads(item["output"]) == {"faq_answer": "Respuesta de prueba para pqrsdf"}
+    assert session.tool_calls == 1
+    assert session.responses == 1
+
+def test_reconnect_discards_audio_of_dropped_response(backoffs):
+    async def script(server, ws, number):
+        await ws.send(event("session.created", session={"id": f"s{number}"}))
+        await ws.send(event("response.created", response={"id": f"r{number}"}))
+        if number == 1:
+            # 40 ms de una respuesta que el servidor no terminará
+            await ws.send(audio_delta("r1", "i1", 40, value=7))
+            await asyncio.sleep(0.2)
+            await ws.close(code=1011)
+            return
+        for _ in range(5):
+            await ws.send(audio_delta("r2", "i2", 100))
+        await ws.send(event("response.audio.done"))
+        await ws.send(event("response.done", response={"id": "r2"}))
+        await ws.wait_closed()
+
+    sink = Sink()
+
+    async def body(server, session, task):
+        await wait_until(lambda: server.connections == 2 and session.responses == 1)
+        assert await session.wait_playout(5)
+        return server, session
+
+    server, session = asyncio.run(run_session(script, body, sink))
+
+    assert session.reconnects == 1
+    assert backoffs == [2]
+    # Solo suena la respuesta de la conexión nueva, sin restos de la anterior
+    assert 7 not in sink.data
+    assert len(sink.data) == 500 * BYTES_PER_MS
+    assert session._playout.played_ms() == 500
+
+def test_barge_in_cancels_response_and_truncates_to_played_audio():
+    async def script(server, ws, number):
+        await ws.send(event("session.created", session={"id": "s1"}))
+        await ws.send(event("response.created", response={"id": "r1"}))
+        for _ in range(30):
+            await ws.send(audio_delta("r1", "i1", 100))
+        await asyncio.sleep(1.0)
+        await ws.send(event("input_audio_buffer.speech_started", audio_start_ms=1000, item_id="u2"))
+        # Deltas que el servidor envió antes de recibir la cancelación
+        for _ in range(3):
+            await ws.send(audio_delta("r1", "i1", 100, value=9))
+        await server.wait_for("response.cancel")
+        await ws.send(event("response.done", response={"id": "r1", "status": "cancelled"}))
+        await ws.wait_closed()
+
+    sink = Sink()
+
+    async def body(server, session, task):
+        truncate = await server.wait_for("conversation.item.truncate")
+        await asyncio.sleep(0.3)
+        return server, session, truncate
+
+    server, session, truncate = asyncio.run(run_session(script, body, sink))
+
+    assert truncate["item_id"] == "i1"
+    assert 700 <= truncate["audio_end_ms"] <= 1100
+    assert len(server.sent("response.cancel")) == 1
+    assert session.interruptions == 1
+    # Lo que sonó coincide con lo recortado y los deltas en vuelo no llegan a la salida
+    assert 9 not in sink.data
+    assert abs(len(sink.data) / BYTES_PER_MS - truncate["audio_end_ms"]) <= 100
+
+def test_barge_in_during_tool_call_does_not_truncate_played_item():
+    async def script(server, ws, number):
+        await ws.send(event("session.created", session={"id": "s1"}))
+        await ws.send(event("response.created", response={"id": "r1"}))
+        for _ in range(3):
+            await ws.send(audio_delta("r1", "i1", 100))
+        await ws.send(event("response.audio.done"))
+        await ws.send(event("response.done", response={"id": "r1"}))
+        await asyncio.sleep(1.0)
+        # La respuesta siguiente aún no tiene audio (p. ej. espera el resultado de una función)
+        await ws.send(event("response.created", response={"id": "r2"}))
+        await ws.send(event("input_audio_buffer.speech_started"))
+        # Audio de r2 que el servidor envió antes de recibir la cancelación
+        for _ in range(3):
+            await ws.send(audio_delta("r2", "i2", 100, value=9))
+        await server.wait_for("response.cancel")
+        await ws.send(event("response.done", response={"id": "r2", "status": "cancelled"}))
+        await ws.wait_closed()
+
+    sink = Sink()
+
+    async def body(server, session, task):
+        await server.wait_for("response.cancel")
+        await wait_until(lambda: session.responses == 2)
+        await asyncio.sleep(0.3)
+        return server, session
+
+    server, session = asyncio.run(run_session(script, body, sink))
+
+    assert session.interruptions == 1
+    assert server.sent("conversation.item.truncate") == []
+    # Los deltas en vuelo de la respuesta cancelada no llegan a la salida
+    assert 9 not in sink.data
+    assert len(sink.data) == 300 * BYTES_PER_MS
+
+def test_flapping_server_stops_after_reconnect_attempts(backoffs):
+    async def script(server, ws, number):
+        await ws.send(event("session.created", session={"id": f"s{number}"}))
+        await asyncio.sleep(0.1)
+        await ws.close(code=1011)
+
+    async def body(server, session, task):
+        await asyncio.wait_for(asyncio.shield(task), 10)
+        return server, session
+
+    server, session = asyncio.run(run_session(script, body))
+
+    assert server.connections == config.REALTIME_RECONNECT_ATTEMPTS + 1
+    assert session.reconnects == config.REALTIME_RECONNECT_ATTEMPTS
+    assert backoffs == [2, 4, 8]
+
+def test_stable_connection_resets_reconnect_budget(backoffs, monkeypatch):
+    monkeypatch.setattr(config, "REALTIME_STABLE_CONNECTION", 0.1)
+
+    async def script(server, ws, number):
+        await ws.send(event("session.created", session={"id": f"s{number}"}))
+        await asyncio.sleep(0.3)
+        await ws.close(code=1011)
+
+    async def body(server, session, task):
+        await asyncio.wait_for(asyncio.shield(task), 15)
+        return server, session
+
+    server, session = asyncio.run(run_session(script, body, reject_after=5))
+
+    # Cada conexión estable deja el contador en su primer fallo (su propio cierre); después
+    # los 503 seguidos lo agotan
+    assert server.connections == 5
+    assert server.rejected == config.REALTIME_RECONNECT_ATTEMPTS
+    assert session.reconnects == 5 + config.REALTIME_RECONNECT_ATTEMPTS - 1
+    assert backoffs == [2] * 5 + [4, 8]
+
+def test_close_during_connect_does_not_start_the_connection():
+    async def script(server, ws, number):
+        await ws.send(event("session.created", session={"id": "s1"}))
+        await ws.wait_closed()
+
+    async def body(server, session, task):
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        await session.close()
+        await asyncio.wait_for(asyncio.shield(task), 2)
+        return server, session, time.monotonic() - started
+
+    server, session, elapsed = asyncio.run(run_session(script, body, handshake_delay=0.5))
+
+    # run() termina en cuanto se abre el WebSocket, sin atenderlo hasta que acabe la fuente
+    assert elapsed < 1
+    assert server.events == []
+    assert not session.connected
+
+def test_close_interrupts_reconnect_backoff():
+    async def script(server, ws, number):
+        await ws.send(event("session.created", session={"id": f"s{number}"}))
+        await ws.close(code=1011)
+
+    async def body(server, session, task):
+        await wait_until(lambda: session.reconnects == 1)
+        started = time.monotonic()
+        await session.close()
+        await asyncio.wait_for(asyncio.shield(task), 1)
+        return server, session, time.monotonic() - started
+
+    server, session, elapsed = asyncio.run(run_session(script, body))
+
+    # La espera de 2 s antes de reconectar no retrasa el cierre
+    assert elapsed < 0.5
+    assert server.connections == 1
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Caché persistente de audio sintetizado (TTS) compartido entre procesos.
+
+Cada audio se guarda como un archivo propio (WAV/PCM tal como lo entrega la API), de modo
+que puede mapearse en memoria o reproducirse directamente desde disco. Un índice JSON
+registra tamaño y metadatos de cada entrada. El orden LRU se lleva con la fecha de
+modificación de cada archivo, que se actualiza en cada acierto; así las lecturas no
+necesitan reescribir el índice ni tomar el bloqueo.
+
+La expulsión se hace al insertar, cuando se supera el tamaño total o el número de entradas.
+"""
+import os
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+import config
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.json"
+LOCK_NAME = ".lock"
+
+def _normalize(value):
+    """Normaliza un texto para la clave: Unicode NFC y espacios colapsados"""
+    return " ".join(unicodedata.normalize("NFC", value or "").split())
+
+def tts_cache_key(text, voice, model, instructions=None, audio_format="wav", **extra):
+    """
+    Calcula la clave de caché de una síntesis
+
+    Args:
+        text (str): Texto sintetizado
+        voice (str): Voz de TTS
+        model (str): Modelo de TTS
+        instructions (str, optional): Instrucciones de TTS
+        audio_format (str): Formato de audio
+        **extra: Otros parámetros que cambian el audio (p. ej. speed)
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    parts = {
+        "text": _normalize(text),
+        "voice": voice.strip().lower(),
+        "model": model.strip().lower(),
+        "instructions": _normalize(instructions),
+        "format": audio_format.strip().lower()
+    }
+    parts.update({k: v for k, v in extra.items() if v is not None})
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class TTSCache:
+    """Almacén en disco de audios TTS con expulsión LRU por tamaño total y número de entradas"""
+
+    def __init__(self, cache_dir, max_bytes=config.TTS_CACHE_MAX_BYTES, max_entries=config.TTS_CACHE_MAX_ENTRIES):
+        """
+        Inicializa el caché (crea el directorio si no existe)
+
+        Args:
+            cache_dir (str): Directorio del caché
+            max_bytes (int): Tamaño máximo total de los audios
+            max_entries (int): Número máximo de audios
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _blob_path(self, key, audio_format):
+        """Ruta del archivo de audio de una clave"""
+        return os.path.join(self.cache_dir, f"{key}.{audio_format}")
+
+    @contextmanager
+    def _locked(self):
+        """Bloqueo exclusivo entre hilos y procesos para modificar el índice"""
+        with self._lock, open(os.path.join(self.cache_dir, LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        """Lee el índice del disco (vacío si no existe o está dañado)"""
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_NAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Índice del caché TTS ilegible, se reconstruye: {e}")
+            return {}
+
+    def _write_index(self, index):
+        """Escribe el índice de forma atómica"""
+        index_path = os.path.join(self.cache_dir, INDEX_NAME)
+        tmp_path = f"{index_path}.part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    def get_path(self, key, audio_format="wav"):
+        """
+        Retorna la ruta del audio en caché y lo marca como usado recientemente
+
+        Args:
+            key (str): Clave (ver tts_cache_key)
+            audio_format (str): Formato de audio
+
+        Returns:
+            str or None: Ruta del archivo, o None si no está en caché
+        """
+        path = self._blob_path(key, audio_format)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def get(self, key, audio_format="wav"):
+        """
+        Retorna el audio en caché
+
+        Args:
+            key (str): Clave (ver tts_cache_key)
+            audio_format (str): Formato de audio
+
+        Returns:
+            bytes or None: Audio, o None si no está en caché
+        """
+        path = self.get_path(key, audio_format)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            # Expulsado por otro proceso entre la comprobación y la lectura
+            return None
+
+    def put(self, key, audio, audio_format="wav", **metadata):
+        """
+        Guarda un audio en el caché y expulsa los menos usados si se superan los límites
+
+        Args:
+            key (str): Clave (ver tts_cache_key)
+            audio (bytes): Audio a guardar
+            audio_format (str): Formato de audio
+            **metadata: Datos descriptivos para el índice (voz, modelo, texto...)
+
+        Returns:
+            bool: True si se guardó
+        """
+        if not audio or len(audio) > self.max_bytes:
+            return False
+
+        path = self._blob_path(key, audio_format)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+
+            with self._locked():
+                index = self._read_index()
+                index[key] = {"size": len(audio), "format": audio_format, "created": time.time(), **metadata}
+                self._evict(index)
+                self._write_index(index)
+            return True
+        except OSError as e:
+            logger.error(f"Error guardando en el caché TTS: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def _evict(self, index):
+        """Expulsa las entradas menos usadas hasta cumplir los límites (con el bloqueo tomado)"""
+        total = sum(entry["size"] for entry in index.values())
+        if total <= self.max_bytes and len(index) <= self.max_entries:
+            return
+
+        def last_used(key):
+            try:
+                return os.path.getmtime(self._blob_path(key, index[key]["format"]))
+            except OSError:
+                return 0
+
+        for key in sorted(index, key=last_used):
+            if total <= self.max_bytes and len(index) <= self.max_entries:
+                break
+            entry = index.pop(key)
+            total -= entry["size"]
+            try:
+                os.remove(self._blob_path(key, entry["format"]))
+            except FileNotFoundError:
+                pass
+            self.evictions += 1
+        logger.info(f"Caché TTS podado a {len(index)} entradas ({total} bytes)")
+
+    def stats(self):
+        """
+        Retorna los contadores del caché
+
+        Returns:
+            dict: Aciertos, fallos y expulsiones de este proceso, y entradas y bytes en disco
+        """
+        index = self._read_index()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(index),
+            "bytes": sum(entry["size"] for entry in index.values())
+        }
+
+_cache = None
+_cache_failed = False
+_cache_lock = threading.Lock()
+
+def get_tts_cache():
+    """
+    Retorna el caché TTS compartido del proceso
+
+    Returns:
+        TTSCache or None: Caché, o None si está deshabilitado o no se pudo crear su directorio
+    """
+    global _cache, _cache_failed
+
+    if not config.TTS_CACHE_ENABLED:
+        return None
+
+    if _cache is None and not _cache_failed:
+        with _cache_lock:
+            if _cache is None and not _cache_failed:
+                try:
+                    _cache = TTSCache(config.TTS_CACHE_DIR)
+                    logger.info(f"Caché TTS en {config.TTS_CACHE_DIR}")
+                except OSError as e:
+                    logger.warning(f"Caché TTS deshabilitado: {e}")
+                    _cache_failed = True
+
+    return _cache